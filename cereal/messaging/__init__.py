@@ -129,19 +129,68 @@ def get_one_can(logcan):
     if len(can.can) > 0:
       return can
 
+class _LazyEvent():
+  """Raw bytes of a received event, decoded on first use and shared by the service dicts"""
+  __slots__ = ("dat", "event")
+
+  def __init__(self, dat):
+    self.dat = dat
+    self.event = None
+
+  def get(self):
+    if self.event is None:
+      self.event = log.Event.from_bytes(self.dat)
+    return self.event
+
+
+class _LazyServiceDict(dict):
+  """Per-service dict whose values are read from the latest received event on first access"""
+  def __init__(self, getter):
+    super().__init__()
+    self.getter = getter
+    self.pending = {}
+
+  def set_pending(self, s, event):
+    self.pending[s] = event
+
+  def __getitem__(self, s):
+    if s in self.pending:
+      dict.__setitem__(self, s, self.getter(self.pending.pop(s).get(), s))
+    return dict.__getitem__(self, s)
+
+  def get(self, s, default=None):
+    return self[s] if s in self else default
+
+  def values(self):
+    return [self[s] for s in self]
+
+  def items(self):
+    return [(s, self[s]) for s in self]
+
+
 class SubMaster():
-  def __init__(self, services, ignore_alive=None, addr="127.0.0.1"):
+  def __init__(self, services, ignore_alive=None, addr="127.0.0.1", lazy=False):
     self.poller = Poller()
     self.frame = -1
+    self.lazy = lazy
     self.updated = {s : False for s in services}
     self.rcv_time = {s : 0. for s in services}
     self.rcv_frame = {s : 0 for s in services}
     self.alive = {s : False for s in services}
     self.sock = {}
+    self.sock_service = {}
     self.freq = {}
-    self.data = {}
-    self.logMonoTime = {}
-    self.valid = {}
+
+    # in lazy mode received events are kept as raw bytes, they are only decoded on the
+    # first access to the service struct, logMonoTime or valid
+    if lazy:
+      self.data = _LazyServiceDict(getattr)
+      self.logMonoTime = _LazyServiceDict(lambda msg, s: msg.logMonoTime)
+      self.valid = _LazyServiceDict(lambda msg, s: msg.valid)
+    else:
+      self.data = {}
+      self.logMonoTime = {}
+      self.valid = {}
 
     if ignore_alive is not None:
       self.ignore_alive = ignore_alive
@@ -151,6 +200,7 @@ class SubMaster():
     for s in services:
       if addr is not None:
         self.sock[s] = sub_sock(s, poller=self.poller, addr=addr, conflate=True)
+        self.sock_service[self.sock[s]] = s
       self.freq[s] = service_list[s].frequency
 
       try:
@@ -169,24 +219,37 @@ class SubMaster():
   def update(self, timeout=1000):
     msgs = []
     for sock in self.poller.poll(timeout):
-      msgs.append(recv_one_or_none(sock))
+      if self.lazy:
+        msgs.append((self.sock_service[sock], sock.receive(non_blocking=True)))
+      else:
+        msgs.append(recv_one_or_none(sock))
     self.update_msgs(sec_since_boot(), msgs)
 
   def update_msgs(self, cur_time, msgs):
+    """msgs are events, or (service, bytes) pairs in lazy mode"""
     # TODO: add optional input that specify the service to wait for
     self.frame += 1
     self.updated = dict.fromkeys(self.updated, False)
     for msg in msgs:
+      if self.lazy:
+        s, msg = msg
       if msg is None:
         continue
+      if not self.lazy:
+        s = msg.which()
 
-      s = msg.which()
       self.updated[s] = True
       self.rcv_time[s] = cur_time
       self.rcv_frame[s] = self.frame
-      self.data[s] = getattr(msg, s)
-      self.logMonoTime[s] = msg.logMonoTime
-      self.valid[s] = msg.valid
+      if self.lazy:
+        event = _LazyEvent(msg)
+        self.data.set_pending(s, event)
+        self.logMonoTime.set_pending(s, event)
+        self.valid.set_pending(s, event)
+      else:
+        self.data[s] = getattr(msg, s)
+        self.logMonoTime[s] = msg.logMonoTime
+        self.valid[s] = msg.valid
 
     for s in self.data:
       # arbitrary small number to avoid float comparison. If freq is 0, we can skip the check
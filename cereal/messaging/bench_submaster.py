@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Compare the eager and lazy SubMaster update paths by replaying recorded event bytes.
+
+usage: bench_submaster.py [rlog.bz2]
+
+Without a log, synthetic messages for the controlsd services are used.
+"""
+import bz2
+import sys
+import time
+
+from cereal import log
+import cereal.messaging as messaging
+
+SERVICES = ['thermal', 'health', 'liveCalibration', 'dMonitoringState', 'plan', 'pathPlan', 'model']
+ITERS = 10
+
+
+def load_bytes(fn):
+  with open(fn, 'rb') as f:
+    dat = f.read()
+  if fn.endswith('.bz2'):
+    dat = bz2.decompress(dat)
+  return [(e.which(), e.as_builder().to_bytes()) for e in log.Event.read_multiple_bytes(dat) if e.which() in SERVICES]
+
+
+def synthetic_bytes(n=10000):
+  ret = []
+  for i in range(n):
+    s = SERVICES[i % len(SERVICES)]
+    msg = messaging.new_message(s)
+    msg.logMonoTime = i
+    ret.append((s, msg.to_bytes()))
+  return ret
+
+
+def run(dats, lazy):
+  sm = messaging.SubMaster(SERVICES, addr=None, lazy=lazy)
+  t = time.monotonic()
+  for i in range(ITERS):
+    for j, dat in enumerate(dats):
+      msgs = [dat] if lazy else [log.Event.from_bytes(dat[1])]
+      sm.update_msgs(j * 0.01, msgs)
+      # like controlsd, only a few fields of one service are read most cycles
+      sm['plan'].hasLead  # pylint: disable=pointless-statement
+      sm.all_alive_and_valid()
+  return (time.monotonic() - t) / (ITERS * len(dats))
+
+
+if __name__ == "__main__":
+  dats = load_bytes(sys.argv[1]) if len(sys.argv) > 1 else synthetic_bytes()
+  print("replaying %d messages %d times" % (len(dats), ITERS))
+
+  eager = run(dats, False)
+  lazy = run(dats, True)
+  print("eager: %7.2f us/update" % (eager * 1e6))
+  print("lazy:  %7.2f us/update" % (lazy * 1e6))
+  print("speedup: %.2fx" % (eager / lazy))
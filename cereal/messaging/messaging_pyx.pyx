@@ -61,10 +61,13 @@ cdef class Poller:
     with nogil:
         result = self.poller.poll(t)
 
+    # the registered sockets are returned, so callers can look them up
+    cdef SubSocket socket
     for s in result:
-        socket = SubSocket()
-        socket.setPtr(s)
-        sockets.append(socket)
+      for socket in self.sub_sockets:
+        if socket.socket == s:
+          sockets.append(socket)
+          break
 
     return sockets
 
@@ -9,6 +9,7 @@
 #include <cstdlib>
 #include <csignal>
 #include <random>
+#include <string>
 
 #include <poll.h>
 #include <sys/ioctl.h>
@@ -82,13 +83,15 @@ int msgq_new_queue(msgq_queue_t * q, const char * path, size_t size){
 
   std::signal(SIGUSR2, sigusr2_handler);
 
-  const char * prefix = "/dev/shm/";
-  char * full_path = new char[strlen(path) + strlen(prefix) + 1];
-  strcpy(full_path, prefix);
-  strcat(full_path, path);
+  // OPENPILOT_PREFIX gives processes their own set of queues
+  std::string full_path = "/dev/shm/";
+  const char * prefix = std::getenv("OPENPILOT_PREFIX");
+  if (prefix != NULL){
+    full_path += std::string(prefix) + "_";
+  }
+  full_path += path;
 
-  auto fd = open(full_path, O_RDWR | O_CREAT, 0777);
-  delete[] full_path;
+  auto fd = open(full_path.c_str(), O_RDWR | O_CREAT, 0777);
 
   if (fd < 0)
     return -1;
@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from cereal import log
+import cereal.messaging as messaging
+
+SERVICES = ['thermal', 'health', 'liveCalibration', 'plan', 'pathPlan', 'model', 'carState']
+
+
+def random_bytes(services, n):
+  """(service, bytes) pairs, like lazy SubMaster.update receives them"""
+  ret = []
+  for i in range(n):
+    s = services[i % len(services)]
+    try:
+      msg = messaging.new_message(s)
+    except Exception:
+      msg = messaging.new_message(s, 0)
+    msg.logMonoTime = i
+    msg.valid = bool(i % 3)
+    ret.append((s, msg.to_bytes()))
+  return ret
+
+
+class TestSubMaster(unittest.TestCase):
+  def test_lazy_matches_eager(self):
+    eager = messaging.SubMaster(SERVICES, addr=None)
+    lazy = messaging.SubMaster(SERVICES, addr=None, lazy=True)
+
+    dats = random_bytes(SERVICES, 200)
+    for i in range(0, len(dats), 3):
+      chunk = dats[i:i+3]
+      eager.update_msgs(i * 0.01, [log.Event.from_bytes(d) for _, d in chunk])
+      lazy.update_msgs(i * 0.01, chunk)
+
+      self.assertEqual(eager.updated, lazy.updated)
+      self.assertEqual(eager.alive, lazy.alive)
+      self.assertEqual(eager.rcv_frame, lazy.rcv_frame)
+
+      # only touch the data of one service, the others stay pending
+      s = SERVICES[i % len(SERVICES)]
+      self.assertEqual(eager[s].to_dict(), lazy[s].to_dict())
+      self.assertEqual(eager.logMonoTime[s], lazy.logMonoTime[s])
+
+    self.assertEqual(eager.valid, dict(lazy.valid.items()))
+    self.assertEqual(eager.logMonoTime, dict(lazy.logMonoTime.items()))
+    self.assertEqual(eager.all_alive_and_valid(), lazy.all_alive_and_valid())
+    for s in SERVICES:
+      self.assertEqual(eager[s].to_dict(), lazy[s].to_dict())
+
+  def test_lazy_keeps_last_message(self):
+    lazy = messaging.SubMaster(SERVICES, addr=None, lazy=True)
+    lazy.update_msgs(0., random_bytes(['carState'], 1))
+    lazy.update_msgs(0.01, random_bytes(['thermal'], 1))
+    self.assertFalse(lazy.updated['carState'])
+    self.assertEqual(lazy.logMonoTime['carState'], 0)
+    self.assertEqual(lazy.rcv_frame['carState'], 0)
+
+  def test_lazy_decodes_on_access(self):
+    lazy = messaging.SubMaster(SERVICES, addr=None, lazy=True)
+    with mock.patch.object(log.Event, 'from_bytes', wraps=log.Event.from_bytes) as from_bytes:
+      lazy.update_msgs(0., random_bytes(['carState', 'thermal'], 2) + [('plan', None)])
+      self.assertTrue(lazy.updated['carState'] and lazy.updated['thermal'])
+      self.assertFalse(lazy.updated['plan'])
+      self.assertEqual(from_bytes.call_count, 0)
+
+      # one decode per event, shared by data, logMonoTime and valid
+      lazy['carState'].vEgo  # pylint: disable=pointless-statement
+      self.assertEqual(lazy.logMonoTime['carState'], 0)
+      self.assertFalse(lazy.valid['carState'])
+      self.assertEqual(from_bytes.call_count, 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,35 +1,68 @@
-﻿
+﻿import numpy as np
+
+# largest window LatControlPID asks for, bigger windows grow the buffer once
+DEFAULT_CAPACITY = 500
 
 
 class MoveAvg():
-    def __init__(self):
+    """Average of the last max_cnt values passed to get_data. max_cnt can change between
+    calls, a smaller window drops the oldest values and a bigger one fills up again.
+    Values sit in a preallocated ring buffer with a running sum."""
+    def __init__(self, capacity=DEFAULT_CAPACITY):
         self.skip_timer = 0
         self.data_cnt = 0
         self.data_sum = 0
         self.data_avg = 0
-        self.data_steer = []
+        self.data_steer = [0.] * capacity
+        self.head = 0  # where the next value goes
+        self.resync_cnt = 0
 
-    def __del__(self):
-        self.data_steer.clear()        
+    def window(self):
+        """Values in the window, oldest first."""
+        cap = len(self.data_steer)
+        start = (self.head - self.data_cnt) % cap
+        if start + self.data_cnt <= cap:
+            return self.data_steer[start:start + self.data_cnt]
+        return self.data_steer[start:] + self.data_steer[:self.head]
 
-    def get_data(self, steer_angle_dest, max_cnt ):
-        self.data_steer.append( steer_angle_dest )
-        self.data_cnt += 1
+    def grow(self, capacity):
+        data = self.window()
+        self.data_steer = data + [0.] * (capacity - len(data))
+        self.head = len(data) % capacity
 
-        delta = self.data_cnt - max_cnt
-        if self.data_cnt > max_cnt:
-            self.data_cnt = max_cnt
+    def get_data(self, steer_angle_dest, max_cnt ):
+        if max_cnt > len(self.data_steer):
+            self.grow(max_cnt)
+        cap = len(self.data_steer)
 
-            if delta > 0:
-                del self.data_steer[:delta]
-            else:
-                self.data_steer.pop(0)
+        # make room for the new value
+        while self.data_cnt >= max_cnt:
+            self.data_sum -= self.data_steer[(self.head - self.data_cnt) % cap]
+            self.data_cnt -= 1
 
+        self.data_steer[self.head] = steer_angle_dest
+        self.head = (self.head + 1) % cap
+        self.data_cnt += 1
+        self.data_sum += steer_angle_dest
 
-        self.data_sum = 0
-        for enum in self.data_steer:
-            #print( enum )
-            self.data_sum += enum
+        # re-sum now and then so rounding errors of the running sum don't add up
+        self.resync_cnt += 1
+        if self.resync_cnt >= cap:
+            self.resync_cnt = 0
+            self.data_sum = 0
+            for enum in self.window():
+                self.data_sum += enum
 
         self.data_avg = self.data_sum / self.data_cnt
         return  self.data_avg
+
+
+def move_avg_batch(values, max_cnts):
+    """What MoveAvg.get_data returns for each of values, with the matching max_cnts, as a
+    numpy array. For offline use on whole logs."""
+    values = np.asarray(values, dtype=np.float64)
+    idx = np.arange(1, len(values) + 1)
+    # first value in each window, values dropped by a smaller window don't come back
+    start = np.maximum.accumulate(np.maximum(idx - np.asarray(max_cnts), 0))
+    csum = np.concatenate(([0.], np.cumsum(values)))
+    return (csum[idx] - csum[start]) / (idx - start)
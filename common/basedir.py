@@ -9,3 +9,5 @@ else:
   PERSIST = os.path.join(BASEDIR, "persist")
   PARAMS = os.path.join(BASEDIR, "persist", "params")
 
+PARAMS = os.getenv("PARAMS_PATH", PARAMS)
+
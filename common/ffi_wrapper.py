@@ -1,8 +1,11 @@
 import os
 import sys
+import glob
+import json
 import fcntl
 import hashlib
 import platform
+import subprocess
 from cffi import FFI
 
 def suffix():
@@ -53,3 +56,57 @@ def wrap_compiled(name, directory):
   sys.path.append(directory)
   mod = __import__(name)
   return mod.ffi, mod.lib
+
+
+BUILD_MANIFEST = ".build_manifest.json"
+
+def sources_hash(directory, sources):
+  """sha1 over the machine and the contents of the files matching the glob patterns in
+     sources, relative to directory."""
+  h = hashlib.sha1(platform.machine().encode('utf-8'))
+  for pattern in sources:
+    for fn in sorted(glob.glob(os.path.join(directory, pattern), recursive=True)):
+      if os.path.isfile(fn):
+        h.update(os.path.relpath(fn, directory).encode('utf-8'))
+        with open(fn, 'rb') as f:
+          h.update(f.read())
+  return h.hexdigest()
+
+
+def _loadable(directory, targets):
+  try:
+    for t in targets:
+      FFI().dlopen(os.path.join(directory, t))
+  except OSError:
+    return False
+  return True
+
+
+def make_once(directory, sources, targets):
+  """Runs make in directory unless all targets exist and were built from sources with the
+     same hash, as recorded in the directory's build manifest. Returns True if it built."""
+  manifest_fn = os.path.join(directory, BUILD_MANIFEST)
+  h = sources_hash(directory, sources)
+
+  fd = os.open(directory, 0)
+  fcntl.flock(fd, fcntl.LOCK_EX)
+  try:
+    try:
+      with open(manifest_fn) as f:
+        manifest = json.load(f)
+    except (OSError, ValueError):
+      manifest = {}
+
+    if manifest.get("hash") == h and all(os.path.exists(os.path.join(directory, t)) for t in targets):
+      return False
+
+    if platform.machine() == "x86_64" and not _loadable(directory, [t for t in targets if t.endswith(suffix())]):
+      # missing or likely built for aarch64. cleaning...
+      subprocess.check_call(["make", "clean"], cwd=directory)
+    subprocess.check_call(["make", "-j4"], cwd=directory)
+
+    with open(manifest_fn, "w") as f:
+      json.dump({"hash": h, "machine": platform.machine(), "targets": targets}, f)
+    return True
+  finally:
+    os.close(fd)
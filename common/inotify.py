@@ -0,0 +1,76 @@
+"""Minimal inotify bindings over libc, for platforms without a python inotify package."""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1  # pylint: disable=pointless-statement
+    return libc
+  except (OSError, AttributeError):
+    return None
+
+
+libc = _load_libc()
+
+
+def available():
+  return libc is not None
+
+
+class Inotify():
+  def __init__(self):
+    if libc is None:
+      raise OSError("inotify not available")
+    self.fd = libc.inotify_init1(IN_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+  def add_watch(self, path, mask):
+    wd = libc.inotify_add_watch(self.fd, path.encode('utf8'), mask)
+    if wd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+    return wd
+
+  def rm_watch(self, wd):
+    libc.inotify_rm_watch(self.fd, wd)
+
+  def read(self, timeout=None):
+    """Blocks for up to timeout seconds, returns a list of (wd, mask, name) events."""
+    if timeout is not None and not select.select([self.fd], [], [], timeout)[0]:
+      return []
+
+    try:
+      buf = os.read(self.fd, 65536)
+    except InterruptedError:
+      return []
+
+    events = []
+    i = 0
+    while i + INOTIFY_EVENT.size <= len(buf):
+      wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(buf, i)
+      name = buf[i + INOTIFY_EVENT.size:i + INOTIFY_EVENT.size + name_len].rstrip(b"\0").decode('utf8', 'replace')
+      i += INOTIFY_EVENT.size + name_len
+      events.append((wd, mask, name))
+    return events
+
+  def close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
@@ -19,8 +19,11 @@ before deleting the old <params_dir>/<d> directory.
 
 Writers that only modify a single key can simply take the lock, then swap the corresponding value
 file in place without messing with <params_dir>/d.
+
+On Linux, reads are served from a per-process cache. It is invalidated by inotify events on
+<params_dir> (the <params_dir>/d symlink being swapped) and on the directory <params_dir>/d points
+to (a single value file being swapped). The same events drive Params.watch callbacks.
 """
-import time
 import os
 import string
 import binascii
@@ -32,6 +35,9 @@ import tempfile
 import threading
 from enum import Enum
 from common.basedir import PARAMS
+from common import inotify
+from common.inotify import IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, \
+                           IN_DELETE_SELF, IN_IGNORED
 
 def mkdirs_exists_ok(path):
   try:
@@ -54,6 +60,7 @@ class UnknownKeyName(Exception):
 keys = {
   "AccessToken": [TxType.CLEAR_ON_MANAGER_START],
   "AthenadPid": [TxType.PERSISTENT],
+  "AthenadUploadQueue": [TxType.PERSISTENT],
   "CalibrationParams": [TxType.PERSISTENT],
   "CarParams": [TxType.CLEAR_ON_MANAGER_START, TxType.CLEAR_ON_PANDA_DISCONNECT],
   "CarParamsCache": [TxType.CLEAR_ON_MANAGER_START, TxType.CLEAR_ON_PANDA_DISCONNECT],
@@ -202,15 +209,27 @@ class DBReader(DBAccessor):
 
 
 class DBWriter(DBAccessor):
-  def __init__(self, path):
+  """Writes a new copy of the data directory and swaps <params_dir>/d to it on exit.
+
+  With incremental=True, only keys that changed are written and fsynced. Unchanged keys are
+  hardlinked from the current data directory. Value files are never modified in place (write_db
+  replaces them with a rename), so sharing inodes between the old and new directory is safe and
+  the old directory stays intact until the symlink swap."""
+  def __init__(self, path, incremental=True):
     super(DBWriter, self).__init__(path)
     self._lock = None
     self._prev_umask = None
+    self._incremental = incremental
+    self._dirty = set()
 
   def put(self, key, value):
+    if self._vals.get(key) != value:
+      self._dirty.add(key)
     self._vals[key] = value
 
   def delete(self, key):
+    if key in self._vals:
+      self._dirty.add(key)
     self._vals.pop(key, None)
 
   def __enter__(self):
@@ -222,7 +241,9 @@ class DBWriter(DBAccessor):
     try:
       os.chmod(self._path, 0o777)
       self._lock = self._get_lock(True)
+      self._remove_stale_locked()
       self._vals = self._read_values_locked()
+      self._dirty = set()
     except:
       os.umask(self._prev_umask)
       self._prev_umask = None
@@ -230,10 +251,50 @@ class DBWriter(DBAccessor):
 
     return self
 
+  def _remove_stale_locked(self):
+    """Removes temporary files and directories left behind by a writer that crashed. Callers
+    should hold the lock."""
+    try:
+      current = os.readlink(self._data_path())
+    except OSError:
+      current = None
+
+    for fn in os.listdir(self._path):
+      if not fn.startswith(".tmp") or fn == current:
+        continue
+      path = os.path.join(self._path, fn)
+      if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+      else:
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+
+  def _write_value(self, dir_path, key, old_data_path):
+    path = os.path.join(dir_path, key)
+    if self._incremental and key not in self._dirty and old_data_path is not None:
+      try:
+        os.link(os.path.join(old_data_path, key), path)
+        return
+      except OSError:
+        # the old file is gone or the filesystem has no hardlinks, write a copy instead
+        pass
+
+    with open(path, "wb") as f:
+      f.write(self._vals[key])
+      f.flush()
+      os.fsync(f.fileno())
+
   def __exit__(self, type, value, traceback):
     self._check_entered()
 
     try:
+      data_path = self._data_path()
+      if self._incremental and not self._dirty and os.path.isdir(data_path):
+        # nothing changed
+        return
+
       # data_path refers to the externally used path to the params. It is a symlink.
       # old_data_path is the path currently pointed to by data_path.
       # tempdir_path is a path where the new params will go, which the new data path will point to.
@@ -252,16 +313,6 @@ class DBWriter(DBAccessor):
       tempdir_path = tempfile.mkdtemp(prefix=".tmp", dir=self._path)
 
       try:
-        # Write back all keys.
-        os.chmod(tempdir_path, 0o777)
-        for k, v in self._vals.items():
-          with open(os.path.join(tempdir_path, k), "wb") as f:
-            f.write(v)
-            f.flush()
-            os.fsync(f.fileno())
-        fsync_dir(tempdir_path)
-
-        data_path = self._data_path()
         try:
           old_data_path = os.path.join(self._path, os.readlink(data_path))
         except (OSError, IOError):
@@ -269,6 +320,12 @@ class DBWriter(DBAccessor):
           #                 copies to be left behind, but we still want to overwrite.
           pass
 
+        # Write back all keys.
+        os.chmod(tempdir_path, 0o777)
+        for k in self._vals:
+          self._write_value(tempdir_path, k, old_data_path)
+        fsync_dir(tempdir_path)
+
         new_data_path = "{}.link".format(tempdir_path)
         os.symlink(os.path.basename(tempdir_path), new_data_path)
         os.rename(new_data_path, data_path)
@@ -326,8 +383,143 @@ def write_db(params_path, key, value):
     os.umask(prev_umask)
     lock.release()
 
+class ParamsWatcher():
+  """Per-process cache of param values, kept up to date by a thread reading inotify events."""
+  def __init__(self, db):
+    self.db = db
+    self.pid = os.getpid()
+    self.alive = True
+
+    self.lock = threading.Lock()
+    self.cache = {}
+    self.gen = 0
+    self.callbacks = {}
+    self.last_values = {}
+
+    self._inotify = inotify.Inotify()
+    self._root_wd = self._inotify.add_watch(self.db, IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF)
+    self._data_wd = None
+    self._watch_data_dir()
+
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def _watch_data_dir(self):
+    # <db>/d can be swapped between resolving and watching it, retry until stable
+    while True:
+      data_path = os.path.realpath(os.path.join(self.db, "d"))
+      try:
+        self._data_wd = self._inotify.add_watch(data_path, IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE)
+      except OSError:
+        self._data_wd = None
+      if os.path.realpath(os.path.join(self.db, "d")) == data_path:
+        return
+
+  def get(self, key):
+    with self.lock:
+      if key in self.cache:
+        return self.cache[key]
+      gen = self.gen
+
+    ret = read_db(self.db, key)
+
+    with self.lock:
+      # don't cache a value that was invalidated while reading it
+      if self.alive and self.gen == gen:
+        self.cache[key] = ret
+    return ret
+
+  def invalidate(self, key=None):
+    with self.lock:
+      if key is None:
+        self.cache.clear()
+      else:
+        self.cache.pop(key, None)
+      self.gen += 1
+
+  def watch(self, key, callback):
+    with self.lock:
+      if key not in self.callbacks:
+        self.callbacks[key] = []
+        self.last_values[key] = read_db(self.db, key)
+      self.callbacks[key].append(callback)
+
+  def unwatch(self, key, callback):
+    with self.lock:
+      callbacks = self.callbacks.get(key, [])
+      if callback in callbacks:
+        callbacks.remove(callback)
+      if not callbacks:
+        self.callbacks.pop(key, None)
+        self.last_values.pop(key, None)
+
+  def _notify(self, keys):
+    with self.lock:
+      watched = [k for k in keys if k in self.callbacks]
+
+    for key in watched:
+      value = read_db(self.db, key)
+      with self.lock:
+        if key not in self.callbacks or self.last_values.get(key) == value:
+          continue
+        self.last_values[key] = value
+        callbacks = list(self.callbacks[key])
+      for callback in callbacks:
+        callback(value)
+
+  def _run(self):
+    while self.alive:
+      changed = set()
+      swapped = False
+      for wd, mask, name in self._inotify.read():
+        if wd == self._root_wd:
+          if mask & (IN_DELETE_SELF | IN_IGNORED):
+            # the whole params directory is gone, a new watcher is made on next use
+            self.alive = False
+          elif name == "d":
+            swapped = True
+        elif wd == self._data_wd and not name.startswith("."):
+          changed.add(name)
+
+      if swapped:
+        self._watch_data_dir()
+        self.invalidate()
+        with self.lock:
+          changed.update(self.callbacks.keys())
+      else:
+        for key in changed:
+          self.invalidate(key)
+
+      if not self.alive:
+        self.invalidate()
+        self._inotify.close()
+
+      self._notify(changed)
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(db):
+  """Returns the ParamsWatcher of this process for db, or None when inotify is not available."""
+  if not inotify.available():
+    return None
+
+  with _watchers_lock:
+    watcher = _watchers.get(db)
+    # watcher threads don't survive a fork
+    if watcher is None or not watcher.alive or watcher.pid != os.getpid():
+      try:
+        watcher = ParamsWatcher(db)
+      except OSError:
+        return None
+      _watchers[db] = watcher
+    return watcher
+
+
 class Params():
-  def __init__(self, db=PARAMS):
+  def __init__(self, db=PARAMS, cache=True):
     self.db = db
 
     # create the database if it doesn't exist...
@@ -335,8 +527,23 @@ class Params():
       with self.transaction(write=True):
         pass
 
+    self.cache = cache
+
+  def _watcher(self):
+    return get_watcher(self.db) if self.cache else None
+
+  def _invalidate(self, key=None):
+    watcher = self._watcher()
+    if watcher is not None:
+      watcher.invalidate(key)
+
   def clear_all(self):
     shutil.rmtree(self.db, ignore_errors=True)
+    with _watchers_lock:
+      watcher = _watchers.pop(self.db, None)
+    if watcher is not None:
+      watcher.alive = False
+      watcher.invalidate()
     with self.transaction(write=True):
       pass
 
@@ -351,6 +558,7 @@ class Params():
       for key in keys:
         if tx_type in keys[key]:
           txn.delete(key)
+    self._invalidate()
 
   def manager_start(self):
     self._clear_keys_with_type(TxType.CLEAR_ON_MANAGER_START)
@@ -361,17 +569,51 @@ class Params():
   def delete(self, key):
     with self.transaction(write=True) as txn:
       txn.delete(key)
+    self._invalidate(key)
+
+  def watch(self, key, callback):
+    """Calls callback(value) from a background thread every time the value of key changes.
+    Returns False if changes can't be watched on this platform."""
+    if key not in keys:
+      raise UnknownKeyName(key)
+
+    watcher = get_watcher(self.db)
+    if watcher is None:
+      return False
+    watcher.watch(key, callback)
+    return True
+
+  def unwatch(self, key, callback):
+    watcher = get_watcher(self.db)
+    if watcher is not None:
+      watcher.unwatch(key, callback)
+
+  def _read(self, key):
+    watcher = self._watcher()
+    if watcher is None:
+      return read_db(self.db, key)
+    return watcher.get(key)
 
   def get(self, key, block=False, encoding=None):
     if key not in keys:
       raise UnknownKeyName(key)
 
-    while 1:
-      ret = read_db(self.db, key)
-      if not block or ret is not None:
-        break
-      # is polling really the best we can do?
-      time.sleep(0.05)
+    ret = self._read(key)
+    if block and ret is None:
+      changed = threading.Event()
+      on_change = lambda _: changed.set()
+      watching = self.watch(key, on_change)
+      try:
+        while 1:
+          ret = self._read(key)
+          if ret is not None:
+            break
+          # fall back to polling without inotify
+          changed.wait(None if watching else 0.05)
+          changed.clear()
+      finally:
+        if watching:
+          self.unwatch(key, on_change)
 
     if ret is not None and encoding is not None:
       ret = ret.decode(encoding)
@@ -391,16 +633,65 @@ class Params():
       raise UnknownKeyName(key)
 
     write_db(self.db, key, dat)
+    self._invalidate(key)
+
+
+class ParamsWriter():
+  """Writes params on a single background thread. Pending writes to the same key are
+  coalesced, only the last value is written. The thread only runs while there are
+  pending writes, so the interpreter waits for them before exiting."""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.pending = {}
+    self.thread = None
+
+  def put(self, db, key, val):
+    with self.lock:
+      self.pending[(db, key)] = val
+      if self.thread is None:
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+
+  def flush(self):
+    thread = self.thread
+    if thread is not None:
+      thread.join()
+
+  def _run(self):
+    try:
+      while True:
+        with self.lock:
+          if not self.pending:
+            self.thread = None
+            return
+          (db, key) = next(iter(self.pending))
+          val = self.pending.pop((db, key))
+
+        try:
+          Params(db).put(key, val)
+        except Exception:
+          # only this write is lost, keep writing the others
+          from selfdrive.swaglog import cloudlog
+          cloudlog.exception("params writer failed to write %s" % key)
+    finally:
+      # let the next put start a new thread if this one dies
+      with self.lock:
+        if self.thread is threading.current_thread():
+          self.thread = None
+
+
+_writer = ParamsWriter()
+
+def _reset_writer():
+  # a forked child doesn't have the writer thread, and its lock may be held
+  global _writer
+  _writer = ParamsWriter()
 
+os.register_at_fork(after_in_child=_reset_writer)
 
-def put_nonblocking(key, val):
-  def f(key, val):
-    params = Params()
-    params.put(key, val)
 
-  t = threading.Thread(target=f, args=(key, val))
-  t.start()
-  return t
+def put_nonblocking(key, val, db=PARAMS):
+  _writer.put(db, key, val)
 
 
 if __name__ == "__main__":
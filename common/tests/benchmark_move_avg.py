@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Time per MoveAvg.get_data call for the windows LatControlPID uses, ring buffer against
+the list based reference, plus move_avg_batch over the same inputs.
+
+usage: benchmark_move_avg.py [calls]
+"""
+import sys
+import time
+
+from common.MoveAvg import MoveAvg, move_avg_batch
+from common.tests.test_move_avg import MoveAvgList, random_inputs
+
+
+def bench(cls, values, max_cnt):
+  m = cls()
+  t = time.perf_counter()
+  for v in values:
+    m.get_data(v, max_cnt)
+  return (time.perf_counter() - t) / len(values)
+
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  values, max_cnts = random_inputs(n)
+
+  print("%6s %12s %12s" % ("window", "list", "ring"))
+  for max_cnt in [5, 50, 100, 200, 500]:
+    print("%6d %9.2f us %9.2f us" % (max_cnt, bench(MoveAvgList, values, max_cnt) * 1e6, bench(MoveAvg, values, max_cnt) * 1e6))
+
+  t = time.perf_counter()
+  move_avg_batch(values, max_cnts)
+  print("batch, changing windows: %.3f us/value" % ((time.perf_counter() - t) / n * 1e6))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Multiprocess params stress test. Readers hammer a set of keys while writers
+update them, both with single-key puts and full <params>/d swaps. Reports read
+throughput with and without the inotify cache and checks every reader
+converges on the last written values.
+
+usage: benchmark_params.py [num_readers] [duration]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common.params import Params
+
+KEYS = ["DongleId", "AccessToken", "GitBranch", "IsMetric"]
+
+
+def reader(db, cache, duration, q):
+  params = Params(db, cache=cache)
+  count = 0
+  start = time.monotonic()
+  while time.monotonic() - start < duration:
+    for k in KEYS:
+      params.get(k)
+    count += len(KEYS)
+
+  # give the watcher a moment to see the final writes
+  time.sleep(0.2)
+  q.put((count, {k: params.get(k) for k in KEYS}))
+
+
+def writer(db, duration):
+  params = Params(db, cache=False)
+  i = 0
+  start = time.monotonic()
+  while time.monotonic() - start < duration:
+    if i % 10 == 0:
+      with params.transaction(write=True) as txn:
+        for k in KEYS:
+          txn.put(k, str(i).encode('utf8'))
+    else:
+      params.put(KEYS[i % len(KEYS)], str(i))
+    i += 1
+    time.sleep(0.001)
+
+  # final value for every key
+  for k in KEYS:
+    params.put(k, "final")
+
+
+def run(db, cache, num_readers, duration):
+  q = multiprocessing.Queue()
+  procs = [multiprocessing.Process(target=reader, args=(db, cache, duration, q)) for _ in range(num_readers)]
+  procs.append(multiprocessing.Process(target=writer, args=(db, duration)))
+  for p in procs:
+    p.start()
+
+  results = [q.get() for _ in range(num_readers)]
+  for p in procs:
+    p.join()
+
+  reads = sum(r[0] for r in results)
+  stale = sum(any(v != b"final" for v in r[1].values()) for r in results)
+  print("cache=%-5s %10.0f reads/s  %d/%d readers stale" % (cache, reads / duration, stale, num_readers))
+
+
+if __name__ == "__main__":
+  num_readers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+  duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.
+
+  for cache in [False, True]:
+    db = tempfile.mkdtemp()
+    try:
+      Params(db)
+      run(db, cache, num_readers, duration)
+    finally:
+      shutil.rmtree(db)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Compares fsync counts and latency of full and incremental DBWriter transactions
+on a params directory with every known key set.
+
+usage: benchmark_params_txn.py [iterations]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import common.params as params_module
+from common.params import DBWriter, TxType, keys
+
+fsyncs = [0]
+_fsync = os.fsync
+
+
+def counting_fsync(fd):
+  fsyncs[0] += 1
+  _fsync(fd)
+
+
+def single_key(txn, i):
+  txn.put("DongleId", str(i).encode('utf8'))
+
+
+def manager_start(txn, i):
+  # what Params.manager_start does, after the keys have been set again
+  for k in keys:
+    if TxType.CLEAR_ON_MANAGER_START in keys[k]:
+      txn.delete(k)
+
+
+def run(db, incremental, update, iterations):
+  times = []
+  total_fsyncs = 0
+  for i in range(iterations):
+    with DBWriter(db) as txn:
+      for k in keys:
+        txn.put(k, b"x" * 64)
+
+    fsyncs[0] = 0
+    t = time.monotonic()
+    with DBWriter(db, incremental=incremental) as txn:
+      update(txn, i)
+    times.append(time.monotonic() - t)
+    total_fsyncs += fsyncs[0]
+
+  times.sort()
+  print("%-14s incremental=%-5s %6.1f fsyncs/txn  median %6.2f ms  max %6.2f ms" % (
+    update.__name__, incremental, total_fsyncs / iterations, times[len(times) // 2] * 1e3, times[-1] * 1e3))
+
+
+if __name__ == "__main__":
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+  os.fsync = counting_fsync
+  params_module.os.fsync = counting_fsync
+
+  for update in [single_key, manager_start]:
+    for incremental in [False, True]:
+      db = tempfile.mkdtemp()
+      try:
+        run(db, incremental, update, iterations)
+      finally:
+        shutil.rmtree(db)
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from common.ffi_wrapper import make_once
+
+MAKEFILE = """
+all: out.txt
+
+out.txt: src.txt
+\tcat src.txt > out.txt
+\techo built >> builds.txt
+
+clean:
+\trm -f out.txt
+"""
+
+
+class TestMakeOnce(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    with open(os.path.join(self.tmpdir, "Makefile"), "w") as f:
+      f.write(MAKEFILE)
+    self.write_src("a")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def write_src(self, s):
+    with open(os.path.join(self.tmpdir, "src.txt"), "w") as f:
+      f.write(s)
+
+  def make(self):
+    return make_once(self.tmpdir, ["Makefile", "src.txt"], ["out.txt"])
+
+  def test_builds_once(self):
+    self.assertTrue(self.make())
+    self.assertFalse(self.make())
+    self.assertFalse(self.make())
+    with open(os.path.join(self.tmpdir, "builds.txt")) as f:
+      self.assertEqual(f.read().count("built"), 1)
+
+  def test_rebuilds_on_change(self):
+    self.assertTrue(self.make())
+    self.write_src("b")
+    self.assertTrue(self.make())
+    with open(os.path.join(self.tmpdir, "out.txt")) as f:
+      self.assertEqual(f.read(), "b")
+    self.assertFalse(self.make())
+
+  def test_rebuilds_missing_target(self):
+    self.assertTrue(self.make())
+    os.unlink(os.path.join(self.tmpdir, "out.txt"))
+    self.assertTrue(self.make())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,72 @@
+import random
+import unittest
+
+import numpy as np
+
+from common.MoveAvg import MoveAvg, move_avg_batch
+
+
+class MoveAvgList():
+  # reference, the list based MoveAvg that re-sums the whole window every call
+  def __init__(self):
+    self.data_cnt = 0
+    self.data_steer = []
+
+  def get_data(self, steer_angle_dest, max_cnt):
+    self.data_steer.append(steer_angle_dest)
+    self.data_cnt += 1
+
+    delta = self.data_cnt - max_cnt
+    if self.data_cnt > max_cnt:
+      self.data_cnt = max_cnt
+      del self.data_steer[:delta]
+
+    data_sum = 0
+    for enum in self.data_steer:
+      data_sum += enum
+    return data_sum / self.data_cnt
+
+
+def random_inputs(n, seed=0):
+  # steering angles with the window switching between LatControlPID's sizes
+  rng = random.Random(seed)
+  values, max_cnts = [], []
+  max_cnt = 500
+  for i in range(n):
+    if rng.random() < 0.01:
+      max_cnt = rng.choice([5, 10, 50, 100, 200, 500, 800])
+    values.append(rng.gauss(0., 30.) + 10 * np.sin(i / 100.))
+    max_cnts.append(max_cnt)
+  return values, max_cnts
+
+
+class TestMoveAvg(unittest.TestCase):
+  def test_equivalence(self):
+    for seed in range(3):
+      values, max_cnts = random_inputs(20000, seed)
+      ref, ring = MoveAvgList(), MoveAvg()
+      for v, max_cnt in zip(values, max_cnts):
+        self.assertAlmostEqual(ring.get_data(v, max_cnt), ref.get_data(v, max_cnt), places=9)
+
+  def test_window_changes(self):
+    ref, ring = MoveAvgList(), MoveAvg(capacity=4)
+    for i, max_cnt in enumerate([3, 3, 3, 3, 1, 5, 5, 5, 5, 5, 5, 2, 2, 6, 6]):
+      self.assertEqual(ring.get_data(float(i), max_cnt), ref.get_data(float(i), max_cnt))
+    self.assertEqual(len(ring.data_steer), 6)
+
+  def test_no_realloc(self):
+    ring = MoveAvg()
+    buf = ring.data_steer
+    for v, max_cnt in zip(*random_inputs(5000)):
+      ring.get_data(v, min(max_cnt, 500))
+    self.assertIs(ring.data_steer, buf)
+
+  def test_batch(self):
+    values, max_cnts = random_inputs(20000)
+    ref = MoveAvgList()
+    expected = [ref.get_data(v, max_cnt) for v, max_cnt in zip(values, max_cnts)]
+    np.testing.assert_allclose(move_avg_batch(values, max_cnts), expected, rtol=0, atol=1e-9)
+
+
+if __name__ == "__main__":
+  unittest.main()
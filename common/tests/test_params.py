@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from common.params import Params, ParamsWriter, UnknownKeyName, get_watcher, put_nonblocking
+
+
+def wait_for(cond, timeout=2.):
+  start = time.monotonic()
+  while not cond():
+    if time.monotonic() - start > timeout:
+      return False
+    time.sleep(0.01)
+  return True
+
+
+class TestParams(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.params = Params(self.tmpdir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_params_put_and_get(self):
+    self.params.put("DongleId", "cb38263377b873ee")
+    self.assertEqual(self.params.get("DongleId"), b"cb38263377b873ee")
+    self.assertEqual(self.params.get("DongleId", encoding='utf8'), "cb38263377b873ee")
+
+  def test_params_unknown_key(self):
+    with self.assertRaises(UnknownKeyName):
+      self.params.get("swag")
+    with self.assertRaises(UnknownKeyName):
+      self.params.put("swag", "abc")
+
+  def test_params_delete(self):
+    self.params.put("DongleId", "abc")
+    self.params.delete("DongleId")
+    self.assertIsNone(self.params.get("DongleId"))
+
+  def test_params_clear_all(self):
+    self.params.put("DongleId", "abc")
+    self.params.clear_all()
+    self.assertIsNone(self.params.get("DongleId"))
+    self.params.put("DongleId", "def")
+    self.assertEqual(self.params.get("DongleId"), b"def")
+
+  def test_params_manager_start(self):
+    self.params.put("CarParams", "abc")
+    self.params.put("DongleId", "def")
+    self.params.manager_start()
+    self.assertIsNone(self.params.get("CarParams"))
+    self.assertEqual(self.params.get("DongleId"), b"def")
+
+  def test_cache_sees_other_writers(self):
+    other = Params(self.tmpdir, cache=False)
+    self.params.put("DongleId", "abc")
+    self.assertEqual(self.params.get("DongleId"), b"abc")
+
+    # write from a reader that doesn't share the cache
+    other.put("DongleId", "def")
+    self.assertTrue(wait_for(lambda: self.params.get("DongleId") == b"def"))
+
+    # swapping <params>/d invalidates everything
+    with other.transaction(write=True) as txn:
+      txn.put("DongleId", b"ghi")
+    self.assertTrue(wait_for(lambda: self.params.get("DongleId") == b"ghi"))
+
+  def test_watch(self):
+    if get_watcher(self.tmpdir) is None:
+      raise unittest.SkipTest("inotify not available")
+
+    values = []
+    cb = values.append
+    self.assertTrue(self.params.watch("DongleId", cb))
+    Params(self.tmpdir, cache=False).put("DongleId", "abc")
+    self.assertTrue(wait_for(lambda: values == [b"abc"]))
+
+    self.params.unwatch("DongleId", cb)
+    self.params.put("DongleId", "def")
+    time.sleep(0.1)
+    self.assertEqual(values, [b"abc"])
+
+  def test_get_block(self):
+    def put():
+      time.sleep(0.1)
+      Params(self.tmpdir, cache=False).put("CarParams", "test")
+    threading.Thread(target=put).start()
+
+    self.assertEqual(self.params.get("CarParams", block=True), b"test")
+
+  def test_put_nonblocking(self):
+    put_nonblocking("CarParams", "test", db=self.tmpdir)
+    self.assertTrue(wait_for(lambda: self.params.get("CarParams") == b"test"))
+
+  def test_writer_coalesces(self):
+    writer = ParamsWriter()
+    writer.thread = threading.current_thread()  # hold off the writer thread
+    for i in range(100):
+      writer.put(self.tmpdir, "DongleId", str(i))
+    self.assertEqual(len(writer.pending), 1)
+
+    writer.thread = None
+    writer.put(self.tmpdir, "DongleId", "99")
+    writer.flush()
+    self.assertEqual(self.params.get("DongleId"), b"99")
+    self.assertIsNone(writer.thread)
+
+  def test_writer_survives_failed_write(self):
+    writer = ParamsWriter()
+    writer.put(self.tmpdir, "NotAKey", "test")
+    writer.flush()
+    self.assertIsNone(writer.thread)
+
+    writer.put(self.tmpdir, "DongleId", "abc")
+    writer.flush()
+    self.assertEqual(self.params.get("DongleId"), b"abc")
+
+  def test_params_in_forked_child(self):
+    self.params.put("DongleId", "abc")
+    self.assertEqual(self.params.get("DongleId"), b"abc")
+
+    pid = os.fork()
+    if pid == 0:
+      try:
+        child = Params(self.tmpdir)
+        ok = child.get("DongleId") == b"abc"
+        Params(self.tmpdir, cache=False).put("DongleId", "def")
+        ok = ok and wait_for(lambda: child.get("DongleId") == b"def")
+      finally:
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+
+import common.params as params_module
+from common.params import DBReader, DBWriter
+
+OLD = {"DongleId": b"abc", "AccessToken": b"token", "GitBranch": b"devel", "IsMetric": b"1"}
+NEW = {"DongleId": b"def", "AccessToken": b"token", "GitBranch": b"devel", "CarParams": b"params"}
+
+# filesystem operations a writer can be killed at
+CRASH_POINTS = [(os, "fsync"), (os, "link"), (os, "rename"), (os, "symlink"), (os, "remove"),
+                (shutil, "rmtree"), (params_module, "fsync_dir")]
+
+
+def write_txn(db, vals, incremental=True):
+  with DBWriter(db, incremental=incremental) as txn:
+    for k in list(txn.keys()):
+      if k not in vals:
+        txn.delete(k)
+    for k, v in vals.items():
+      txn.put(k, v)
+
+
+def read_all(db):
+  with DBReader(db) as txn:
+    return {k: txn.get(k) for k in txn.keys()}
+
+
+def crash_after(n):
+  """Kills the process on the nth filesystem operation."""
+  count = [0]
+
+  def wrap(f):
+    def wrapped(*args, **kwargs):
+      count[0] += 1
+      if count[0] == n:
+        os._exit(1)
+      return f(*args, **kwargs)
+    return wrapped
+
+  for mod, name in CRASH_POINTS:
+    setattr(mod, name, wrap(getattr(mod, name)))
+
+
+class TestParamsTransaction(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.db = os.path.join(self.tmpdir, "params")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _reset(self):
+    shutil.rmtree(self.db, ignore_errors=True)
+    write_txn(self.db, OLD)
+
+  def _run_crash_test(self, incremental):
+    for n in range(1, 100):
+      self._reset()
+
+      pid = os.fork()
+      if pid == 0:
+        crash_after(n)
+        write_txn(self.db, NEW, incremental)
+        os._exit(0)
+      _, status = os.waitpid(pid, 0)
+      finished = os.WEXITSTATUS(status) == 0
+
+      # the database is either entirely old or entirely new, never a mix
+      vals = read_all(self.db)
+      self.assertIn(vals, [OLD, NEW], "inconsistent after crash at %d" % n)
+      if finished:
+        self.assertEqual(vals, NEW)
+        break
+
+      # the next writer cleans up what the crashed one left behind
+      write_txn(self.db, NEW, incremental)
+      self.assertEqual(read_all(self.db), NEW)
+      self.assertEqual(sorted(os.listdir(self.db)), sorted([".lock", "d", os.readlink(os.path.join(self.db, "d"))]))
+    else:
+      self.fail("transaction never finished")
+
+  def test_crash_consistency_incremental(self):
+    self._run_crash_test(True)
+
+  def test_crash_consistency_full(self):
+    self._run_crash_test(False)
+
+  def test_incremental_only_writes_changed(self):
+    self._reset()
+    data_path = os.path.realpath(os.path.join(self.db, "d"))
+    inodes = {k: os.stat(os.path.join(data_path, k)).st_ino for k in OLD}
+
+    write_txn(self.db, NEW)
+    data_path = os.path.realpath(os.path.join(self.db, "d"))
+    for k in ["AccessToken", "GitBranch"]:
+      self.assertEqual(os.stat(os.path.join(data_path, k)).st_ino, inodes[k])
+    self.assertNotEqual(os.stat(os.path.join(data_path, "DongleId")).st_ino, inodes["DongleId"])
+    self.assertEqual(read_all(self.db), NEW)
+
+  def test_noop_transaction_keeps_data_dir(self):
+    self._reset()
+    data_path = os.readlink(os.path.join(self.db, "d"))
+    write_txn(self.db, OLD)
+    self.assertEqual(os.readlink(os.path.join(self.db, "d")), data_path)
+
+  def test_single_key_write_after_incremental(self):
+    # write_db replaces files instead of modifying them, so hardlinked inodes are never shared
+    self._reset()
+    write_txn(self.db, NEW)
+    params_module.write_db(self.db, "GitBranch", "release2")
+    with DBWriter(self.db) as txn:
+      txn.put("DongleId", b"ghi")
+    self.assertEqual(read_all(self.db), dict(NEW, DongleId=b"ghi", GitBranch=b"release2"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -35,6 +35,12 @@ public:
   uint8_t counter;
   uint8_t counter_fail;
 
+  // set on every successful parse within the last update
+  bool updated;
+  bool record_history;
+  std::vector<std::vector<double>> all_vals;
+  std::vector<uint16_t> all_ts;
+
   bool parse(uint64_t sec, uint16_t ts_, uint8_t * dat);
   bool update_counter_generic(int64_t v, int cnt_size);
 };
@@ -46,6 +52,9 @@ private:
   const DBC *dbc = NULL;
   std::unordered_map<uint32_t, MessageState> message_states;
 
+  void reset_updates(bool history);
+  void parse_string(const std::string &data, bool sendcan);
+
 public:
   bool can_valid = false;
   uint64_t last_sec = 0;
@@ -55,8 +64,11 @@ public:
             const std::vector<SignalParseOptions> &sigoptions);
   void UpdateCans(uint64_t sec, const capnp::List<cereal::CanData>::Reader& cans);
   void UpdateValid(uint64_t sec);
-  void update_string(std::string data, bool sendcan);
+  void update_string(const std::string &data, bool sendcan);
+  std::vector<bool> update_strings(const std::vector<std::string> &data, bool sendcan, bool history);
   std::vector<SignalValue> query_latest();
+  std::vector<SignalValue> query_updated();
+  std::vector<SignalValues> query_history();
 };
 
 class CANPacker {
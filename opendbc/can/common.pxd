@@ -64,6 +64,12 @@ cdef extern from "common_dbc.h":
     const char* name
     double value
 
+  cdef struct SignalValues:
+    uint32_t address
+    const char* name
+    vector[uint16_t] ts
+    vector[double] values
+
   cdef struct SignalPackValue:
     const char * name
     double value
@@ -76,7 +82,10 @@ cdef extern from "common.h":
     bool can_valid
     CANParser(int, string, vector[MessageParseOptions], vector[SignalParseOptions])
     void update_string(string, bool)
+    vector[bool] update_strings(vector[string], bool, bool)
     vector[SignalValue] query_latest()
+    vector[SignalValue] query_updated()
+    vector[SignalValues] query_history()
 
   cdef cppclass CANPacker:
    CANPacker(string)
@@ -3,6 +3,7 @@
 #include <cstddef>
 #include <cstdint>
 #include <string>
+#include <vector>
 
 #define ARRAYSIZE(x) (sizeof(x)/sizeof(x[0]))
 
@@ -29,6 +30,13 @@ struct SignalValue {
   double value;
 };
 
+struct SignalValues {
+  uint32_t address;
+  const char* name;
+  std::vector<uint16_t> ts;
+  std::vector<double> values;
+};
+
 enum SignalType {
   DEFAULT,
   HONDA_CHECKSUM,
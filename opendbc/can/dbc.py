@@ -1,10 +1,16 @@
 import re
+import io
 import os
+import hashlib
+import pickle
 import struct
 import sys
 import numbers
+import tempfile
 from collections import namedtuple, defaultdict
 
+import numpy as np
+
 def int_or_float(s):
   # return number, trying to maintain int format
   if s.isdigit():
@@ -16,14 +22,69 @@ DBCSignal = namedtuple(
   "DBCSignal", ["name", "start_bit", "size", "is_little_endian", "is_signed",
                 "factor", "offset", "tmin", "tmax", "units"])
 
+# Precomputed decoding and encoding constants of a signal.
+#   shift is applied to the 64 bit message read in the signal's byte order.
+#   sign_bit is 0 for unsigned signals.
+#   enc_mask is the signal mask in the big endian message, already byte reversed
+#   for little endian signals.
+DBCSignalCodec = namedtuple(
+  "DBCSignalCodec", ["name", "is_little_endian", "shift", "mask", "sign_bit",
+                     "factor", "offset", "enc_mask"])
+
+# bump when the parsed representation changes to invalidate existing caches
+CACHE_VERSION = 1
+CACHE_DIR_NAME = ".dbc_cache"
+
 
 class dbc():
-  def __init__(self, fn):
+  def __init__(self, fn, use_cache=True):
     self.name, _ = os.path.splitext(os.path.basename(fn))
-    with open(fn, encoding="ascii") as f:
-      self.txt = f.readlines()
+    with open(fn, "rb") as f:
+      raw = f.read()
+    self.txt = io.StringIO(raw.decode("ascii"), newline=None).readlines()
     self._warned_addresses = set()
 
+    # lookup to bit reverse each byte
+    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
+
+    # The parsed dbc is cached next to the dbc file, keyed by a hash of its contents
+    dbc_hash = hashlib.sha1(raw).hexdigest()
+    cache_fn = os.path.join(os.path.dirname(os.path.abspath(fn)), CACHE_DIR_NAME, self.name + ".pkl")
+
+    cached = self.load_cache(cache_fn, dbc_hash) if use_cache else None
+    if cached is not None:
+      self.msgs, self.def_vals, self.msg_name_to_address = cached
+    else:
+      self.parse()
+      if use_cache:
+        self.write_cache(cache_fn, dbc_hash)
+
+    self.compile()
+
+  @staticmethod
+  def load_cache(cache_fn, dbc_hash):
+    try:
+      with open(cache_fn, "rb") as f:
+        version, cached_hash, parsed = pickle.load(f)
+    except Exception:
+      return None
+
+    if version != CACHE_VERSION or cached_hash != dbc_hash:
+      return None
+    return parsed
+
+  def write_cache(self, cache_fn, dbc_hash):
+    # the cache is only an optimization, a read-only tree just parses every time
+    try:
+      os.makedirs(os.path.dirname(cache_fn), exist_ok=True)
+      with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_fn), delete=False) as f:
+        pickle.dump((CACHE_VERSION, dbc_hash, (self.msgs, self.def_vals, self.msg_name_to_address)), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(f.name, cache_fn)
+    except OSError:
+      pass
+
+  def parse(self):
     # regexps from https://github.com/ebroecker/canmatrix/blob/master/canmatrix/importdbc.py
     bo_regexp = re.compile(r"^BO\_ (\w+) (\w+) *: (\w+) (\w+)")
     sg_regexp = re.compile(r"^SG\_ (\w+) : (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
@@ -40,9 +101,6 @@ class dbc():
     # A dictionary which maps message ids to a list of tuples (signal name, definition value pairs)
     self.def_vals = defaultdict(list)
 
-    # lookup to bit reverse each byte
-    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
-
     for l in self.txt:
       l = l.strip()
 
@@ -115,6 +173,35 @@ class dbc():
       name = m[0][0]
       self.msg_name_to_address[name] = address
 
+  def compile(self):
+    """Precompute shifts, masks and signs of every signal, per message"""
+    # Dictionaries which map message ids to a list of DBCSignalCodec, in the same
+    # order as the signals in self.msgs. Signals which do not fit in 64 bits are left
+    # out of the decode codecs, encoding them raises ValueError like before.
+    self.codecs = {}
+    self.encode_codecs = {}
+    for address, m in self.msgs.items():
+      codec = []
+      for s in m[1]:
+        if s.is_little_endian:
+          shift = s.start_bit
+        else:
+          b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
+          shift = 64 - (b1 + s.size)
+
+        mask = (1 << s.size) - 1
+        sign_bit = (1 << (s.size - 1)) if s.is_signed else 0
+        enc_mask = None
+        if shift >= 0:
+          enc_mask = mask << shift
+          if s.is_little_endian:
+            enc_mask = self.reverse_bytes(enc_mask)
+
+        codec.append(DBCSignalCodec(s.name, s.is_little_endian, shift, mask, sign_bit,
+                                    s.factor, s.offset, enc_mask))
+      self.encode_codecs[address] = codec
+      self.codecs[address] = [c for c in codec if c.shift >= 0]
+
   def lookup_msg_id(self, msg_id):
     if not isinstance(msg_id, numbers.Number):
       msg_id = self.msg_name_to_address[msg_id]
@@ -139,34 +226,24 @@ class dbc():
     """
     msg_id = self.lookup_msg_id(msg_id)
 
-    msg_def = self.msgs[msg_id]
-    size = msg_def[0][1]
+    size = self.msgs[msg_id][0][1]
 
     result = 0
-    for s in msg_def[1]:
+    for s in self.encode_codecs[msg_id]:
       ival = dd.get(s.name)
       if ival is not None:
 
         ival = (ival / s.factor) - s.offset
         ival = int(round(ival))
 
-        if s.is_signed and ival < 0:
-          ival = (1 << s.size) + ival
-
-        if s.is_little_endian:
-          shift = s.start_bit
-        else:
-          b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
-          shift = 64 - (b1 + s.size)
-
-        mask = ((1 << s.size) - 1) << shift
-        dat = (ival & ((1 << s.size) - 1)) << shift
+        if s.sign_bit and ival < 0:
+          ival = (s.mask + 1) + ival
 
+        dat = (ival & s.mask) << s.shift
         if s.is_little_endian:
-          mask = self.reverse_bytes(mask)
-          dat = self.reverse_bytes(dat)
+          dat = int.from_bytes(dat.to_bytes(8, 'little'), 'big')
 
-        result &= ~mask
+        result &= ~s.enc_mask
         result |= dat
 
     result = struct.pack('>Q', result)
@@ -206,50 +283,86 @@ class dbc():
     if debug:
       print(name)
 
+    if arr is not None:
+      # first position of each requested signal
+      arr_index = {}
+      for i, sig_name in enumerate(arr):
+        arr_index.setdefault(sig_name, i)
+
     st = x[2].ljust(8, b'\x00')
     le, be = None, None
 
-    for s in msg[1]:
-      if arr is not None and s[0] not in arr:
+    for s in self.codecs[x[0]]:
+      if arr is not None and s.name not in arr_index:
         continue
 
-      start_bit = s[1]
-      signal_size = s[2]
-      little_endian = s[3]
-      signed = s[4]
-      factor = s[5]
-      offset = s[6]
-
-      if little_endian:
+      if s.is_little_endian:
         if le is None:
           le = struct.unpack("<Q", st)[0]
         tmp = le
-        shift_amount = start_bit
       else:
         if be is None:
           be = struct.unpack(">Q", st)[0]
         tmp = be
-        b1 = (start_bit // 8) * 8 + (-start_bit - 1) % 8
-        shift_amount = 64 - (b1 + signal_size)
 
-      if shift_amount < 0:
-        continue
-
-      tmp = (tmp >> shift_amount) & ((1 << signal_size) - 1)
-      if signed and (tmp >> (signal_size - 1)):
-        tmp -= (1 << signal_size)
-
-      tmp = tmp * factor + offset
+      tmp = (tmp >> s.shift) & s.mask
+      if tmp & s.sign_bit:
+        tmp -= s.mask + 1
 
-      # if debug:
-      #   print("%40s  %2d %2d  %7.2f %s" % (s[0], s[1], s[2], tmp, s[-1]))
+      tmp = tmp * s.factor + s.offset
 
       if arr is None:
-        out[s[0]] = tmp
+        out[s.name] = tmp
       else:
-        out[arr.index(s[0])] = tmp
+        out[arr_index[s.name]] = tmp
     return name, out
 
+  def decode_many(self, addresses, dats, arr=None):
+    """Decode many CAN messages at once using the dbc.
+
+       Inputs:
+        addresses: A sequence of CAN addresses.
+        dats: A sequence of the same length with the CAN data as bytes.
+        arr: Optional list of signals which should be decoded and returned.
+
+       Returns:
+        A dict mapping the name of every known message present in the input
+        to a tuple (idx, data), where idx is an array with the positions of that
+        message in the input and data is a dict mapping signal name to an array
+        of float64 values, one per position.
+    """
+    addresses = np.asarray(addresses, dtype=np.int64)
+    if len(dats):
+      raw = np.frombuffer(b"".join(d.ljust(8, b'\x00') for d in dats), dtype=np.uint8).reshape(-1, 8)
+    else:
+      raw = np.zeros((0, 8), dtype=np.uint8)
+
+    out = {}
+    for address in np.unique(addresses):
+      address = int(address)
+      msg = self.msgs.get(address)
+      if msg is None:
+        continue
+
+      idx = np.flatnonzero(addresses == address)
+      st = raw[idx]
+      le = st.view('<u8').ravel()
+      be = st.view('>u8').ravel().astype(np.uint64)
+
+      data = {}
+      for s in self.codecs[address]:
+        if arr is not None and s.name not in arr:
+          continue
+
+        tmp = ((le if s.is_little_endian else be) >> np.uint64(s.shift)) & np.uint64(s.mask)
+        vals = tmp.astype(np.float64)
+        if s.sign_bit:
+          vals[(tmp & np.uint64(s.sign_bit)) != 0] -= float(s.mask + 1)
+
+        data[s.name] = vals * s.factor + s.offset
+      out[msg[0][0]] = (idx, data)
+    return out
+
   def get_signals(self, msg):
     msg = self.lookup_msg_id(msg)
     return [sgs.name for sgs in self.msgs[msg][1]]
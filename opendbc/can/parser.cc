@@ -72,6 +72,14 @@ bool MessageState::parse(uint64_t sec, uint16_t ts_, uint8_t * dat) {
   }
   ts = ts_;
   seen = sec;
+  updated = true;
+
+  if (record_history) {
+    for (int i=0; i < vals.size(); i++) {
+      all_vals[i].push_back(vals[i]);
+    }
+    all_ts.push_back(ts_);
+  }
 
   return true;
 }
@@ -155,6 +163,7 @@ CANParser::CANParser(int abus, const std::string& dbc_name,
 
     }
 
+    state.all_vals.resize(state.parse_sigs.size());
     message_states[state.address] = state;
   }
 }
@@ -199,7 +208,20 @@ void CANParser::UpdateValid(uint64_t sec) {
   }
 }
 
-void CANParser::update_string(std::string data, bool sendcan) {
+// start a new update, history is only recorded when asked for by this update
+void CANParser::reset_updates(bool history) {
+  for (auto& kv : message_states) {
+    auto& state = kv.second;
+    state.updated = false;
+    state.record_history = history;
+    state.all_ts.clear();
+    for (auto& v : state.all_vals) {
+      v.clear();
+    }
+  }
+}
+
+void CANParser::parse_string(const std::string &data, bool sendcan) {
   // format for board, make copy due to alignment issues, will be freed on out of scope
   auto amsg = kj::heapArray<capnp::word>((data.length() / sizeof(capnp::word)) + 1);
   memcpy(amsg.begin(), data.data(), data.length());
@@ -216,6 +238,24 @@ void CANParser::update_string(std::string data, bool sendcan) {
   UpdateValid(last_sec);
 }
 
+void CANParser::update_string(const std::string &data, bool sendcan) {
+  reset_updates(false);
+  parse_string(data, sendcan);
+}
+
+
+// parse a batch of events in one call, returns can_valid after every event
+std::vector<bool> CANParser::update_strings(const std::vector<std::string> &data, bool sendcan, bool history) {
+  reset_updates(history);
+
+  std::vector<bool> valid;
+  valid.reserve(data.size());
+  for (const auto& d : data) {
+    parse_string(d, sendcan);
+    valid.push_back(can_valid);
+  }
+  return valid;
+}
 
 std::vector<SignalValue> CANParser::query_latest() {
   std::vector<SignalValue> ret;
@@ -237,3 +277,45 @@ std::vector<SignalValue> CANParser::query_latest() {
 
   return ret;
 }
+
+// latest value of every signal in a message seen during the last update
+std::vector<SignalValue> CANParser::query_updated() {
+  std::vector<SignalValue> ret;
+
+  for (const auto& kv : message_states) {
+    const auto& state = kv.second;
+    if (!state.updated) continue;
+
+    for (int i=0; i<state.parse_sigs.size(); i++) {
+      const Signal &sig = state.parse_sigs[i];
+      ret.push_back((SignalValue){
+        .address = state.address,
+        .ts = state.ts,
+        .name = sig.name,
+        .value = state.vals[i],
+      });
+    }
+  }
+
+  return ret;
+}
+
+// every value of every signal parsed during the last update, if it had history enabled
+std::vector<SignalValues> CANParser::query_history() {
+  std::vector<SignalValues> ret;
+
+  for (const auto& kv : message_states) {
+    const auto& state = kv.second;
+
+    for (int i=0; i<state.parse_sigs.size(); i++) {
+      ret.push_back((SignalValues){
+        .address = state.address,
+        .name = state.parse_sigs[i].name,
+        .ts = state.all_ts,
+        .values = state.all_vals[i],
+      });
+    }
+  }
+
+  return ret;
+}
@@ -11,12 +11,13 @@ from libcpp.map cimport map
 from collections import defaultdict
 
 from common cimport CANParser as cpp_CANParser
-from common cimport SignalParseOptions, MessageParseOptions, dbc_lookup, SignalValue, DBC
+from common cimport SignalParseOptions, MessageParseOptions, dbc_lookup, SignalValue, SignalValues, DBC
 
 
 from libcpp cimport bool
 import os
 import numbers
+import numpy as np
 
 cdef int CAN_INVALID_CNT = 5
 
@@ -29,11 +30,14 @@ cdef class CANParser:
     map[uint32_t, string] address_to_msg_name
     vector[SignalValue] can_values
     bool test_mode_enabled
+    bool has_history
 
   cdef public:
     string dbc_name
     dict vl
     dict ts
+    dict vl_all
+    dict ts_all
     bool can_valid
     int can_invalid_cnt
 
@@ -46,6 +50,8 @@ cdef class CANParser:
     self.dbc = dbc_lookup(dbc_name)
     self.vl = {}
     self.ts = {}
+    self.vl_all = {}
+    self.ts_all = {}
 
     self.can_invalid_cnt = CAN_INVALID_CNT
 
@@ -60,6 +66,10 @@ cdef class CANParser:
       self.vl[name] = {}
       self.ts[msg.address] = {}
       self.ts[name] = {}
+      self.vl_all[msg.address] = {}
+      self.vl_all[name] = {}
+      self.ts_all[msg.address] = {}
+      self.ts_all[name] = {}
 
     # Convert message names into addresses
     for i in range(len(signals)):
@@ -98,18 +108,19 @@ cdef class CANParser:
     self.update_vl()
 
   cdef unordered_set[uint32_t] update_vl(self):
-    cdef string sig_name
-    cdef unordered_set[uint32_t] updated_val
-
     can_values = self.can.query_latest()
-    valid = self.can.can_valid
+    self.update_valid(self.can.can_valid)
+    return self.fill_vl(can_values)
 
+  cdef void update_valid(self, bool valid):
     # Update invalid flag
     self.can_invalid_cnt += 1
     if valid:
         self.can_invalid_cnt = 0
     self.can_valid = self.can_invalid_cnt < CAN_INVALID_CNT
 
+  cdef unordered_set[uint32_t] fill_vl(self, vector[SignalValue] can_values):
+    cdef unordered_set[uint32_t] updated_val
 
     for cv in can_values:
       # Cast char * directly to unicde
@@ -126,17 +137,52 @@ cdef class CANParser:
 
     return updated_val
 
+  cdef void fill_history(self):
+    cdef vector[SignalValues] can_values = self.can.query_history()
+
+    for cv in can_values:
+      name = <unicode>self.address_to_msg_name[cv.address].c_str()
+      cv_name = <unicode>cv.name
+
+      vals = np.array(cv.values, dtype=np.float64)
+      ts = np.array(cv.ts, dtype=np.uint16)
+
+      self.vl_all[cv.address][cv_name] = vals
+      self.ts_all[cv.address][cv_name] = ts
+
+      self.vl_all[name][cv_name] = vals
+      self.ts_all[name][cv_name] = ts
+
+  cdef void clear_history(self):
+    if not self.has_history:
+      return
+    for d in self.vl_all.values():
+      d.clear()
+    for d in self.ts_all.values():
+      d.clear()
+    self.has_history = False
+
   def update_string(self, dat, sendcan=False):
     self.can.update_string(dat, sendcan)
+    self.clear_history()
     return self.update_vl()
 
-  def update_strings(self, strings, sendcan=False):
-    updated_vals = set()
-
-    for s in strings:
-      updated_val = self.update_string(s, sendcan)
-      updated_vals.update(updated_val)
-
+  def update_strings(self, strings, sendcan=False, history=False):
+    """Parse all strings in one call. vl and ts hold the latest value of every signal
+    seen in the batch. With history, vl_all and ts_all hold arrays of every parsed value,
+    they are emptied by the next update without history."""
+    cdef vector[string] strings_v = strings
+    cdef vector[bool] valid = self.can.update_strings(strings_v, sendcan, history)
+
+    for v in valid:
+      self.update_valid(v)
+
+    updated_vals = self.fill_vl(self.can.query_updated())
+    if history:
+      self.fill_history()
+      self.has_history = True
+    else:
+      self.clear_history()
     return updated_vals
 
 cdef class CANDefine():
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Compare dbc.decode per frame with the columnar dbc.decode_many.
+
+usage: benchmark_dbc.py [dbc name] [frames]
+"""
+import os
+import random
+import sys
+import time
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+
+
+if __name__ == "__main__":
+  dbc_name = sys.argv[1] if len(sys.argv) > 1 else "toyota_prius_2017_pt_generated"
+  n = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+  t = time.monotonic()
+  can_dbc = dbc(os.path.join(DBC_PATH, dbc_name + ".dbc"))
+  print("load: %.2f ms" % ((time.monotonic() - t) * 1e3))
+
+  random.seed(0)
+  msgs = [(address, min(m[0][1], 8)) for address, m in can_dbc.msgs.items()]
+  addresses, dats = [], []
+  for _ in range(n):
+    address, size = random.choice(msgs)
+    addresses.append(address)
+    dats.append(bytes(random.getrandbits(8) for _ in range(size)))
+
+  t = time.monotonic()
+  for address, dat in zip(addresses, dats):
+    can_dbc.decode((address, 0, dat))
+  dt_decode = time.monotonic() - t
+
+  t = time.monotonic()
+  can_dbc.decode_many(addresses, dats)
+  dt_many = time.monotonic() - t
+
+  print("decode:      %7.2f us/frame" % (dt_decode / n * 1e6))
+  print("decode_many: %7.2f us/frame   %.1fx" % (dt_many / n * 1e6, dt_decode / dt_many))
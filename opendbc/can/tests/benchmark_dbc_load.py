@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""Time loading every DBC in opendbc/ by parsing and from the parsed cache."""
+import glob
+import os
+import time
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+
+
+def load_all(fns, use_cache):
+  t = time.monotonic()
+  for fn in fns:
+    dbc(fn, use_cache=use_cache)
+  return time.monotonic() - t
+
+
+if __name__ == "__main__":
+  fns = sorted(glob.glob(os.path.join(DBC_PATH, "*.dbc")))
+
+  parse = load_all(fns, False)
+  load_all(fns, True)  # make sure the cache is populated
+  cached = load_all(fns, True)
+
+  print("%d dbcs" % len(fns))
+  print("parse:  %7.2f ms total, %5.2f ms/dbc" % (parse * 1e3, parse / len(fns) * 1e3))
+  print("cached: %7.2f ms total, %5.2f ms/dbc   %.1fx" % (cached * 1e3, cached / len(fns) * 1e3, parse / cached))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Compare per-string and batched CANParser updates on recorded CAN.
+
+usage: benchmark_parser.py <rlog.bz2> <car fingerprint> [strings per update]
+
+e.g. benchmark_parser.py rlog.bz2 "TOYOTA RAV4 2017"
+     benchmark_parser.py rlog.bz2 "HYUNDAI SONATA 2020"
+"""
+import bz2
+import importlib
+import sys
+import time
+
+from cereal import log
+from selfdrive.car.car_helpers import interfaces
+
+
+def get_parser(candidate):
+  CarInterface, _, CarState = interfaces[candidate]
+  CP = CarInterface.get_params(candidate)
+  carstate = importlib.import_module(CarState.__module__)
+  get_can_parser = getattr(carstate, 'get_can_parser', None) or CarState.get_can_parser
+  return lambda: get_can_parser(CP)
+
+
+def load_can_strings(fn):
+  with open(fn, 'rb') as f:
+    dat = f.read()
+  if fn.endswith('.bz2'):
+    dat = bz2.decompress(dat)
+  return [e.as_builder().to_bytes() for e in log.Event.read_multiple_bytes(dat) if e.which() == 'can']
+
+
+def run_single(cp, batches):
+  t = time.monotonic()
+  for batch in batches:
+    updated = set()
+    for s in batch:
+      updated.update(cp.update_string(s))
+  return time.monotonic() - t
+
+
+def run_batched(cp, batches, history=False):
+  t = time.monotonic()
+  for batch in batches:
+    cp.update_strings(batch, history=history)
+  return time.monotonic() - t
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 3:
+    print(__doc__)
+    sys.exit(1)
+
+  strings = load_can_strings(sys.argv[1])
+  make_parser = get_parser(sys.argv[2])
+  batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+  batches = [strings[i:i+batch_size] for i in range(0, len(strings), batch_size)]
+  print("%d can events in %d batches" % (len(strings), len(batches)))
+
+  single = run_single(make_parser(), batches)
+  batched = run_batched(make_parser(), batches)
+  history = run_batched(make_parser(), batches, history=True)
+
+  for name, dt in [("update_string", single), ("update_strings", batched), ("update_strings history", history)]:
+    print("%25s: %7.2f us/event   %.2fx" % (name, dt / len(strings) * 1e6, single / dt))
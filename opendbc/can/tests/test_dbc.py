@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc, CACHE_DIR_NAME
+
+DBCS = ["toyota_prius_2017_pt_generated", "hyundai_kia_generic", "subaru_global_2017", "honda_civic_touring_2016_can_generated"]
+
+
+def random_frames(can_dbc, n=10):
+  random.seed(0)
+  addresses, dats = [], []
+  for address, msg in can_dbc.msgs.items():
+    size = min(msg[0][1], 8)
+    for _ in range(n):
+      addresses.append(address)
+      dats.append(bytes(random.getrandbits(8) for _ in range(size)))
+  return addresses, dats
+
+
+class TestDBC(unittest.TestCase):
+  def test_encode_decode(self):
+    can_dbc = dbc(os.path.join(DBC_PATH, 'toyota_prius_2017_pt_generated.dbc'))
+    msg = ('STEER_ANGLE_SENSOR', {'STEER_ANGLE': -6.0, 'STEER_RATE': 4, 'STEER_FRACTION': -0.2})
+    encoded = can_dbc.encode(*msg)
+    self.assertEqual(can_dbc.decode((0x25, 0, encoded)), msg)
+
+    name, out = can_dbc.decode((0x25, 0, encoded), ['STEER_RATE', 'STEER_ANGLE'])
+    self.assertEqual(name, 'STEER_ANGLE_SENSOR')
+    self.assertEqual(out, [4, -6.0])
+
+  def test_signal_out_of_range(self):
+    # NEW_SIGNAL_4 doesn't fit in 64 bits, it can't be decoded and encoding it raises
+    can_dbc = dbc(os.path.join(DBC_PATH, 'mazda_3_2019.dbc'))
+    name, dat = can_dbc.decode((354, 0, b"\x00" * 8))
+    self.assertEqual(name, "CAM_KEEP_ALIVE_1")
+    self.assertNotIn("NEW_SIGNAL_4", dat)
+    with self.assertRaises(ValueError):
+      can_dbc.encode("CAM_KEEP_ALIVE_1", {"NEW_SIGNAL_4": 1})
+
+  def test_decode_many(self):
+    for dbc_name in DBCS:
+      can_dbc = dbc(os.path.join(DBC_PATH, dbc_name + '.dbc'))
+      addresses, dats = random_frames(can_dbc)
+      addresses.append(0x7ff)
+      dats.append(b'\x00')
+
+      out = can_dbc.decode_many(addresses, dats)
+      self.assertEqual(len(out), len(can_dbc.msgs))
+      for name, (idx, data) in out.items():
+        for j, i in enumerate(idx):
+          expected_name, expected = can_dbc.decode((addresses[i], 0, dats[i]))
+          self.assertEqual(name, expected_name)
+          self.assertEqual(set(data.keys()), set(expected.keys()))
+          for sig, val in expected.items():
+            self.assertAlmostEqual(data[sig][j], val, places=6)
+
+  def test_cache(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      fn = os.path.join(tmpdir, "toyota_prius_2017_pt_generated.dbc")
+      shutil.copy(os.path.join(DBC_PATH, "toyota_prius_2017_pt_generated.dbc"), fn)
+      cache_fn = os.path.join(tmpdir, CACHE_DIR_NAME, "toyota_prius_2017_pt_generated.pkl")
+
+      parsed = dbc(fn, use_cache=False)
+      self.assertFalse(os.path.exists(cache_fn))
+
+      first = dbc(fn)
+      self.assertTrue(os.path.exists(cache_fn))
+      cached = dbc(fn)
+      for d in (first, cached):
+        self.assertEqual(d.msgs, parsed.msgs)
+        self.assertEqual(d.def_vals, parsed.def_vals)
+        self.assertEqual(d.msg_name_to_address, parsed.msg_name_to_address)
+
+      # changed dbc contents invalidate the cache
+      with open(fn, "a") as f:
+        f.write('\nBO_ 2047 NEW_MSG: 8 XXX\n SG_ NEW_SIG : 7|8@0+ (1,0) [0|255] "" XXX\n')
+      changed = dbc(fn)
+      self.assertIn("NEW_MSG", changed.msg_name_to_address)
+      self.assertEqual(dbc(fn).msgs, changed.msgs)
+
+      # a corrupted cache is rebuilt
+      with open(cache_fn, "wb") as f:
+        f.write(b"garbage")
+      self.assertEqual(dbc(fn).msgs, changed.msgs)
+      self.assertEqual(dbc(fn).msgs, changed.msgs)
+    finally:
+      shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -100,6 +100,61 @@ class TestCanParserPacker(unittest.TestCase):
 
         idx += 1
 
+  def test_update_strings(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+
+    signals = [
+      ("STEER_TORQUE", "STEERING_CONTROL", 0),
+      ("STEER_TORQUE_REQUEST", "STEERING_CONTROL", 0),
+    ]
+
+    parser_single = CANParser(dbc_file, list(signals), [], 0)
+    parser_batch = CANParser(dbc_file, list(signals), [], 0)
+    packer = CANPacker(dbc_file)
+
+    strings = []
+    for idx, steer in enumerate(range(-256, 255)):
+      msgs = packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": steer, "STEER_TORQUE_REQUEST": idx % 2}, idx)
+      strings.append(can_list_to_can_capnp([msgs]))
+
+    for i in range(0, len(strings), 7):
+      batch = strings[i:i+7]
+      updated_single = set()
+      for s in batch:
+        updated_single.update(parser_single.update_string(s))
+      updated_batch = parser_batch.update_strings(batch, history=True)
+
+      self.assertEqual(updated_single, updated_batch)
+      self.assertEqual(parser_single.vl, parser_batch.vl)
+      self.assertEqual(parser_single.ts, parser_batch.ts)
+      self.assertEqual(parser_single.can_valid, parser_batch.can_valid)
+
+      steer = parser_batch.vl_all["STEERING_CONTROL"]["STEER_TORQUE"]
+      self.assertEqual(list(steer), list(range(-256 + i, -256 + i + len(batch))))
+      self.assertEqual(len(parser_batch.ts_all["STEERING_CONTROL"]["STEER_TORQUE"]), len(batch))
+
+  def test_history_reset(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+    signals = [("STEER_TORQUE", "STEERING_CONTROL", 0)]
+
+    parser = CANParser(dbc_file, signals, [], 0)
+    packer = CANPacker(dbc_file)
+    strings = [can_list_to_can_capnp([packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": i}, i)]) for i in range(6)]
+
+    parser.update_strings(strings[:3], history=True)
+    self.assertEqual(list(parser.vl_all["STEERING_CONTROL"]["STEER_TORQUE"]), [0, 1, 2])
+
+    # an update without history doesn't record it, or leave the last one behind
+    parser.update_string(strings[3])
+    self.assertEqual(parser.vl_all["STEERING_CONTROL"], {})
+    self.assertEqual(parser.vl["STEERING_CONTROL"]["STEER_TORQUE"], 3)
+
+    parser.update_strings(strings[4:5])
+    self.assertEqual(parser.ts_all["STEERING_CONTROL"], {})
+
+    parser.update_strings(strings[5:], history=True)
+    self.assertEqual(list(parser.vl_all["STEERING_CONTROL"]["STEER_TORQUE"]), [5])
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -1,11 +1,41 @@
 import os
+import glob
+import json
+import hashlib
 import subprocess
 
 from cffi import FFI
 
 can_dir = os.path.dirname(os.path.abspath(__file__))
 libpandasafety_fn = os.path.join(can_dir, "libpandasafety.so")
-subprocess.check_call(["make"], cwd=can_dir)
+build_manifest_fn = os.path.join(can_dir, ".build_manifest.json")
+
+# everything test.c includes, make only runs when one of these changed
+SOURCES = ["Makefile", "test.c", "../../board/*.h", "../../board/safety/*.h"]
+
+def sources_hash():
+  h = hashlib.sha1()
+  for pattern in SOURCES:
+    for fn in sorted(glob.glob(os.path.join(can_dir, pattern))):
+      h.update(os.path.relpath(fn, can_dir).encode())
+      with open(fn, "rb") as f:
+        h.update(f.read())
+  return h.hexdigest()
+
+def build():
+  h = sources_hash()
+  try:
+    with open(build_manifest_fn) as f:
+      built = json.load(f)["hash"]
+  except (OSError, ValueError, KeyError):
+    built = None
+
+  if built != h or not os.path.exists(libpandasafety_fn):
+    subprocess.check_call(["make"], cwd=can_dir)
+    with open(build_manifest_fn, "w") as f:
+      json.dump({"hash": h}, f)
+
+build()
 
 ffi = FFI()
 ffi.cdef("""
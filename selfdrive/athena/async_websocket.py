@@ -0,0 +1,134 @@
+"""Websocket client for asyncio streams. Framing comes from websocket-client's ABNF, which
+athenad already depends on, the connection itself is a plain asyncio stream."""
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlparse
+
+from websocket import ABNF
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class WebSocketClosed(Exception):
+  pass
+
+
+def accept_key(key):
+  return base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+
+
+def parse_headers(data):
+  lines = data.decode("latin-1").split("\r\n")
+  headers = {}
+  for line in lines[1:]:
+    if ":" in line:
+      k, v = line.split(":", 1)
+      headers[k.strip().lower()] = v.strip()
+  return lines[0], headers
+
+
+async def read_frame(reader):
+  """Returns (fin, opcode, payload) of the next frame, unmasking client frames."""
+  b1, b2 = await reader.readexactly(2)
+  length = b2 & 0x7f
+  if length == 126:
+    length = struct.unpack("!H", await reader.readexactly(2))[0]
+  elif length == 127:
+    length = struct.unpack("!Q", await reader.readexactly(8))[0]
+  mask_key = await reader.readexactly(4) if b2 & 0x80 else None
+  data = await reader.readexactly(length)
+  if mask_key is not None:
+    data = ABNF.mask(mask_key, data)
+  return b1 >> 7, b1 & 0x0f, data
+
+
+class AsyncWebSocket():
+  def __init__(self, reader, writer, mask=True):
+    self.reader = reader
+    self.writer = writer
+    self.mask = mask
+    self.closed = False
+    # one frame at a time, StreamWriter.drain only allows a single waiter before python 3.10
+    self.send_lock = asyncio.Lock()
+
+  async def recv_data(self, control_frame=False):
+    """Returns (opcode, data) of the next message. Pings are answered here, with
+    control_frame they are also returned."""
+    opcode, parts = None, []
+    while True:
+      try:
+        fin, frame_opcode, data = await read_frame(self.reader)
+      except (asyncio.IncompleteReadError, ConnectionError) as e:
+        self.closed = True
+        raise WebSocketClosed() from e
+
+      if frame_opcode == ABNF.OPCODE_CLOSE:
+        await self.close(data[:2] if len(data) >= 2 else b"")
+        raise WebSocketClosed()
+      elif frame_opcode in (ABNF.OPCODE_PING, ABNF.OPCODE_PONG):
+        if frame_opcode == ABNF.OPCODE_PING:
+          await self.send(data, ABNF.OPCODE_PONG)
+        if control_frame:
+          return frame_opcode, data
+        continue
+
+      if frame_opcode != ABNF.OPCODE_CONT:
+        opcode = frame_opcode
+      parts.append(data)
+      if fin:
+        return opcode, b"".join(parts)
+
+  async def recv(self):
+    opcode, data = await self.recv_data()
+    return data.decode("utf-8") if opcode == ABNF.OPCODE_TEXT else data
+
+  async def send(self, data, opcode=ABNF.OPCODE_TEXT):
+    if isinstance(data, str):
+      data = data.encode("utf-8")
+    frame = ABNF(1, 0, 0, 0, opcode, int(self.mask), data).format()
+    async with self.send_lock:
+      self.writer.write(frame)
+      await self.writer.drain()
+
+  async def close(self, status=struct.pack("!H", 1000)):
+    if not self.closed:
+      self.closed = True
+      try:
+        await self.send(status, ABNF.OPCODE_CLOSE)
+      except ConnectionError:
+        pass
+    self.writer.close()
+
+
+async def connect(uri, cookie=None, timeout=10):
+  u = urlparse(uri)
+  secure = u.scheme == "wss"
+  ctx = ssl.create_default_context() if secure else None
+  reader, writer = await asyncio.wait_for(asyncio.open_connection(u.hostname, u.port or (443 if secure else 80), ssl=ctx), timeout)
+
+  key = base64.b64encode(os.urandom(16)).decode()
+  request = [
+    "GET %s HTTP/1.1" % ((u.path or "/") + ("?" + u.query if u.query else "")),
+    "Host: %s" % u.netloc,
+    "Upgrade: websocket",
+    "Connection: Upgrade",
+    "Sec-WebSocket-Key: %s" % key,
+    "Sec-WebSocket-Version: 13",
+  ]
+  if cookie is not None:
+    request.append("Cookie: %s" % cookie)
+  writer.write(("\r\n".join(request) + "\r\n\r\n").encode())
+
+  try:
+    status, headers = parse_headers(await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout))
+  except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+    writer.close()
+    raise
+  if status.split(" ")[1:2] != ["101"] or headers.get("sec-websocket-accept") != accept_key(key):
+    writer.close()
+    raise ConnectionError("websocket handshake failed: %s" % status)
+  return AsyncWebSocket(reader, writer)
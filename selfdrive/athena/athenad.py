@@ -1,99 +1,240 @@
 #!/usr/bin/env python3.7
+import asyncio
 import json
 import os
 import hashlib
 import io
 import random
-import select
-import socket
 import time
 import threading
 import base64
 import requests
-import queue
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from jsonrpc import JSONRPCResponseManager, dispatcher
-from websocket import create_connection, WebSocketTimeoutException, ABNF
+from websocket import ABNF
+from selfdrive.athena.async_websocket import connect, WebSocketClosed
 from selfdrive.loggerd.config import ROOT
 
 import cereal.messaging as messaging
 from common import android
 from common.basedir import PERSIST
 from common.api import Api
-from common.params import Params
+from common.params import Params, put_nonblocking
 from common.realtime import sec_since_boot
 from cereal.services import service_list
 from selfdrive.swaglog import cloudlog
 
 ATHENA_HOST = os.getenv('ATHENA_HOST', 'wss://athena.comma.ai')
-HANDLER_THREADS = os.getenv('HANDLER_THREADS', 4)
+HANDLER_THREADS = int(os.getenv('HANDLER_THREADS', 4))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 3))
 LOCAL_PORT_WHITELIST = set([8022])
 
 dispatcher["echo"] = lambda s: s
-payload_queue = queue.Queue()
-response_queue = queue.Queue()
-upload_queue = queue.Queue()
-cancelled_uploads = set()
-UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id'])
-
-def handle_long_poll(ws):
-  end_event = threading.Event()
-
-  threads = [
-    threading.Thread(target=ws_recv, args=(ws, end_event)),
-    threading.Thread(target=ws_send, args=(ws, end_event)),
-    threading.Thread(target=upload_handler, args=(end_event,))
-  ] + [
-    threading.Thread(target=jsonrpc_handler, args=(end_event,))
-    for x in range(HANDLER_THREADS)
-  ]
-
-  for thread in threads:
-    thread.start()
+UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id', 'current', 'progress'],
+                        defaults=(False, 0))
+
+class UploadCancelled(Exception):
+  pass
+
+class UploadQueue():
+  """Uploads requested through uploadFileToUrl. Items stay listed while they upload and
+  report the bytes sent so far. The queue is saved to the AthenadUploadQueue param on
+  every change, so it survives an athenad restart."""
+  def __init__(self):
+    self.cv = threading.Condition()
+    self.items = OrderedDict()
+    self.cancelled = set()
+
+    # the param is written outside of cv, only the latest snapshot is kept
+    self.save_lock = threading.Lock()
+    self.version = 0
+    self.saved_version = 0
+
+  def load(self):
+    try:
+      saved = json.loads(Params().get("AthenadUploadQueue") or "[]")
+    except Exception:
+      cloudlog.exception("athena.upload_queue.load_failed")
+      return
+    with self.cv:
+      for d in saved:
+        # interrupted uploads start over
+        item = UploadItem(**d)._replace(current=False, progress=0)
+        if os.path.exists(item.path):
+          self.items[item.id] = item
+      self.cv.notify_all()
+
+  def _snapshot(self):
+    # called with cv held, the param is written by _save once cv is released
+    self.version += 1
+    return self.version, json.dumps([item._asdict() for item in self.items.values()])
+
+  def _save(self, snapshot):
+    version, dat = snapshot
+    with self.save_lock:
+      # a newer snapshot may have been saved while waiting for the lock
+      if version > self.saved_version:
+        Params().put("AthenadUploadQueue", dat)
+        self.saved_version = version
+
+  def put_nowait(self, item):
+    with self.cv:
+      self.items[item.id] = item
+      snapshot = self._snapshot()
+      self.cv.notify()
+    self._save(snapshot)
+
+  def get(self, timeout=None):
+    """Marks the oldest waiting item as current and returns it, None after timeout."""
+    with self.cv:
+      if not self.cv.wait_for(lambda: any(not i.current for i in self.items.values()), timeout):
+        return None
+      item = next(i for i in self.items.values() if not i.current)._replace(current=True)
+      self.items[item.id] = item
+      snapshot = self._snapshot()
+    self._save(snapshot)
+    return item
+
+  def set_progress(self, upload_id, progress):
+    with self.cv:
+      if upload_id in self.cancelled:
+        raise UploadCancelled()
+      if upload_id in self.items:
+        self.items[upload_id] = self.items[upload_id]._replace(progress=progress)
+
+  def done(self, upload_id):
+    with self.cv:
+      self.cancelled.discard(upload_id)
+      if self.items.pop(upload_id, None) is None:
+        return
+      snapshot = self._snapshot()
+    self._save(snapshot)
+
+  def cancel(self, upload_id):
+    with self.cv:
+      item = self.items.get(upload_id)
+      if item is None:
+        return False
+      if item.current:
+        # the upload stops at its next read
+        self.cancelled.add(upload_id)
+        return True
+      del self.items[upload_id]
+      snapshot = self._snapshot()
+    self._save(snapshot)
+    return True
+
+  def qsize(self):
+    with self.cv:
+      return len(self.items)
+
+  def list(self):
+    with self.cv:
+      return list(self.items.values())
+
+class UploadFile():
+  """File wrapper that reports upload progress, the callback raises to abort."""
+  def __init__(self, f, callback):
+    self.f = f
+    self.callback = callback
+    self.sent = 0
+
+  def read(self, size=-1):
+    self.callback(self.sent)
+    data = self.f.read(size)
+    self.sent += len(data)
+    return data
+
+upload_queue = UploadQueue()
+sessions = threading.local()
+
+class SubscriberPool():
+  """One conflated subscriber per service, created on first use and kept for the process."""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.socks = {}
+
+  def recv(self, service, timeout):
+    with self.lock:
+      if service not in self.socks:
+        self.socks[service] = (messaging.sub_sock(service, conflate=True), threading.Lock())
+      sock, sock_lock = self.socks[service]
+
+    with sock_lock:
+      # only messages sent after the request count
+      messaging.drain_sock_raw(sock)
+      sock.setTimeout(timeout)
+      return messaging.recv_one(sock)
+
+sub_pool = SubscriberPool()
+
+async def handle_long_poll(ws):
+  """Serves one websocket connection until it drops. Everything runs on the event loop,
+  RPC handlers that block run on a pool of HANDLER_THREADS threads."""
+  loop = asyncio.get_event_loop()
+  executor = ThreadPoolExecutor(max_workers=HANDLER_THREADS)
+  dispatcher["startLocalProxy"] = partial(startLocalProxy, loop)
+
+  tasks = [loop.create_task(ws_recv(ws, executor)), loop.create_task(upload_handler())]
   try:
-    while not end_event.is_set():
-      time.sleep(0.1)
-  except (KeyboardInterrupt, SystemExit):
-    end_event.set()
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+  finally:
+    for task in tasks + list(proxy_tasks):
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    executor.shutdown(wait=False)
+    await ws.close()
+
+async def jsonrpc_handler(ws, executor, data):
+  loop = asyncio.get_event_loop()
+  try:
+    response = await loop.run_in_executor(executor, JSONRPCResponseManager.handle, data, dispatcher)
+    await ws.send(response.json)
+  except asyncio.CancelledError:
     raise
+  except Exception as e:
+    cloudlog.exception("athena jsonrpc handler failed")
+    await ws.send(json.dumps({"error": str(e)}))
+
+async def upload_handler():
+  loop = asyncio.get_event_loop()
+  executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+  async def worker():
+    while True:
+      await loop.run_in_executor(executor, upload_next)
+
+  try:
+    await asyncio.gather(*[worker() for _ in range(UPLOAD_WORKERS)])
   finally:
-    for i, thread in enumerate(threads):
-      thread.join()
+    executor.shutdown(wait=False)
 
-def jsonrpc_handler(end_event):
-  dispatcher["startLocalProxy"] = partial(startLocalProxy, end_event)
-  while not end_event.is_set():
-    try:
-      data = payload_queue.get(timeout=1)
-      response = JSONRPCResponseManager.handle(data, dispatcher)
-      response_queue.put_nowait(response)
-    except queue.Empty:
-      pass
-    except Exception as e:
-      cloudlog.exception("athena jsonrpc handler failed")
-      response_queue.put_nowait(json.dumps({"error": str(e)}))
-
-def upload_handler(end_event):
-  while not end_event.is_set():
-    try:
-      item = upload_queue.get(timeout=1)
-      if item.id in cancelled_uploads:
-        cancelled_uploads.remove(item.id)
-        continue
-      _do_upload(item)
-    except queue.Empty:
-      pass
-    except Exception:
-      cloudlog.exception("athena.upload_handler.exception")
+def upload_next(timeout=1):
+  item = upload_queue.get(timeout=timeout)
+  if item is None:
+    return
+  try:
+    _do_upload(item, partial(upload_queue.set_progress, item.id))
+  except UploadCancelled:
+    cloudlog.event("athena.upload_handler.cancelled", id=item.id)
+  except Exception:
+    cloudlog.exception("athena.upload_handler.exception")
+  finally:
+    upload_queue.done(item.id)
+
+def _do_upload(upload_item, callback=None):
+  # keep-alive session per upload thread
+  if not hasattr(sessions, "session"):
+    sessions.session = requests.Session()
 
-def _do_upload(upload_item):
   with open(upload_item.path, "rb") as f:
     size = os.fstat(f.fileno()).st_size
-    return requests.put(upload_item.url,
-                        data=f,
-                        headers={**upload_item.headers, 'Content-Length': str(size)},
-                        timeout=10)
+    return sessions.session.put(upload_item.url,
+                                data=UploadFile(f, callback) if callback is not None else f,
+                                headers={**upload_item.headers, 'Content-Length': str(size)},
+                                timeout=10)
 
 # security: user should be able to request any message from their car
 @dispatcher.add_method
@@ -101,8 +242,7 @@ def getMessage(service=None, timeout=1000):
   if service is None or service not in service_list:
     raise Exception("invalid service")
 
-  socket = messaging.sub_sock(service, timeout=timeout)
-  ret = messaging.recv_one(socket)
+  ret = sub_pool.recv(service, timeout)
 
   if ret is None:
     raise TimeoutError
@@ -116,8 +256,7 @@ def listDataDirectory():
 
 @dispatcher.add_method
 def reboot():
-  thermal_sock = messaging.sub_sock("thermal", timeout=1000)
-  ret = messaging.recv_one(thermal_sock)
+  ret = sub_pool.recv("thermal", 1000)
   if ret is None or ret.thermal.started:
     raise Exception("Reboot unavailable")
 
@@ -147,18 +286,22 @@ def uploadFileToUrl(fn, url, headers):
 
 @dispatcher.add_method
 def listUploadQueue():
-  return [item._asdict() for item in list(upload_queue.queue)]
+  return [item._asdict() for item in upload_queue.list()]
 
 @dispatcher.add_method
 def cancelUpload(upload_id):
-  upload_ids = set(item.id for item in list(upload_queue.queue))
-  if upload_id not in upload_ids:
+  if not upload_queue.cancel(upload_id):
     return 404
 
-  cancelled_uploads.add(upload_id)
   return {"success": 1}
 
-def startLocalProxy(global_end_event, remote_ws_uri, local_port):
+proxy_tasks = set()
+
+def startLocalProxy(loop, remote_ws_uri, local_port):
+  # called from a handler thread, the proxy itself runs on the event loop
+  return asyncio.run_coroutine_threadsafe(start_local_proxy(remote_ws_uri, local_port), loop).result()
+
+async def start_local_proxy(remote_ws_uri, local_port):
   try:
     if local_port not in LOCAL_PORT_WHITELIST:
       raise Exception("Requested local port not whitelisted")
@@ -166,22 +309,12 @@ def startLocalProxy(global_end_event, remote_ws_uri, local_port):
     params = Params()
     dongle_id = params.get("DongleId").decode('utf8')
     identity_token = Api(dongle_id).get_token()
-    ws = create_connection(remote_ws_uri,
-                           cookie="jwt=" + identity_token,
-                           enable_multithread=True)
-
-    ssock, csock = socket.socketpair()
-    local_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    local_sock.connect(('127.0.0.1', local_port))
-    local_sock.setblocking(0)
-
-    proxy_end_event = threading.Event()
-    threads = [
-      threading.Thread(target=ws_proxy_recv, args=(ws, local_sock, ssock, proxy_end_event, global_end_event)),
-      threading.Thread(target=ws_proxy_send, args=(ws, local_sock, csock, proxy_end_event))
-    ]
-    for thread in threads:
-      thread.start()
+    ws = await connect(remote_ws_uri, cookie="jwt=" + identity_token)
+    local_reader, local_writer = await asyncio.open_connection('127.0.0.1', local_port)
+
+    task = asyncio.get_event_loop().create_task(ws_proxy(ws, local_reader, local_writer))
+    proxy_tasks.add(task)
+    task.add_done_callback(proxy_tasks.discard)
 
     return {"success": 1}
   except Exception as e:
@@ -235,96 +368,94 @@ def takeSnapshot():
   else:
     raise Exception("not available while camerad is started")
 
-def ws_proxy_recv(ws, local_sock, ssock, end_event, global_end_event):
-  while not (end_event.is_set() or global_end_event.is_set()):
-    try:
-      data = ws.recv()
-      local_sock.sendall(data)
-    except WebSocketTimeoutException:
-      pass
-    except Exception:
-      cloudlog.exception("athenad.ws_proxy_recv.exception")
-      break
-
-  ssock.close()
-  local_sock.close()
-  end_event.set()
-
-def ws_proxy_send(ws, local_sock, signal_sock, end_event):
-  while not end_event.is_set():
-    try:
-      r, _, _ = select.select((local_sock, signal_sock), (), ())
-      if r:
-        if r[0].fileno() == signal_sock.fileno():
-          # got end signal from ws_proxy_recv
-          end_event.set()
-          break
-        data = local_sock.recv(4096)
-        if not data:
-          # local_sock is dead
-          end_event.set()
-          break
-
-        ws.send(data, ABNF.OPCODE_BINARY)
-    except Exception:
-      cloudlog.exception("athenad.ws_proxy_send.exception")
-      end_event.set()
+async def ws_proxy(ws, local_reader, local_writer):
+  tasks = [asyncio.ensure_future(ws_proxy_recv(ws, local_writer)),
+           asyncio.ensure_future(ws_proxy_send(ws, local_reader))]
+  try:
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+  finally:
+    for task in tasks:
+      task.cancel()
+    local_writer.close()
+    await ws.close()
 
-def ws_recv(ws, end_event):
-  while not end_event.is_set():
-    try:
-      opcode, data = ws.recv_data(control_frame=True)
+async def ws_proxy_recv(ws, local_writer):
+  try:
+    while True:
+      data = await ws.recv()
+      local_writer.write(data)
+      await local_writer.drain()
+  except (WebSocketClosed, ConnectionError):
+    pass
+  except Exception:
+    cloudlog.exception("athenad.ws_proxy_recv.exception")
+
+async def ws_proxy_send(ws, local_reader):
+  try:
+    while True:
+      data = await local_reader.read(4096)
+      if not data:
+        # local_sock is dead
+        break
+      await ws.send(data, ABNF.OPCODE_BINARY)
+  except (WebSocketClosed, ConnectionError):
+    pass
+  except Exception:
+    cloudlog.exception("athenad.ws_proxy_send.exception")
+
+async def ws_recv(ws, executor):
+  rpc_tasks = set()
+  try:
+    while True:
+      opcode, data = await ws.recv_data(control_frame=True)
       if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
         if opcode == ABNF.OPCODE_TEXT:
           data = data.decode("utf-8")
-        payload_queue.put_nowait(data)
+        task = asyncio.ensure_future(jsonrpc_handler(ws, executor, data))
+        rpc_tasks.add(task)
+        task.add_done_callback(rpc_tasks.discard)
       elif opcode == ABNF.OPCODE_PING:
-        Params().put("LastAthenaPingTime", str(int(sec_since_boot()*1e9)))
-    except WebSocketTimeoutException:
-      pass
-    except Exception:
-      cloudlog.exception("athenad.ws_recv.exception")
-      end_event.set()
-
-def ws_send(ws, end_event):
-  while not end_event.is_set():
-    try:
-      response = response_queue.get(timeout=1)
-      ws.send(response.json)
-    except queue.Empty:
-      pass
-    except Exception:
-      cloudlog.exception("athenad.ws_send.exception")
-      end_event.set()
+        put_nonblocking("LastAthenaPingTime", str(int(sec_since_boot()*1e9)))
+  except asyncio.CancelledError:
+    raise
+  except WebSocketClosed:
+    cloudlog.warning("athenad.ws_recv.closed")
+  except Exception:
+    cloudlog.exception("athenad.ws_recv.exception")
+  finally:
+    for task in rpc_tasks:
+      task.cancel()
 
 def backoff(retries):
   return random.randrange(0, min(128, int(2 ** retries)))
 
-def main():
-  params = Params()
-  dongle_id = params.get("DongleId").decode('utf-8')
-  ws_uri = ATHENA_HOST + "/ws/v2/" + dongle_id
-
-  api = Api(dongle_id)
-
+async def athena_loop(ws_uri, api, params):
   conn_retries = 0
   while 1:
     try:
-      ws = create_connection(ws_uri,
-                             cookie="jwt=" + api.get_token(),
-                             enable_multithread=True)
+      ws = await connect(ws_uri, cookie="jwt=" + api.get_token())
       cloudlog.event("athenad.main.connected_ws", ws_uri=ws_uri)
-      ws.settimeout(1)
       conn_retries = 0
-      handle_long_poll(ws)
-    except (KeyboardInterrupt, SystemExit):
-      break
+      await handle_long_poll(ws)
     except Exception:
       cloudlog.exception("athenad.main.exception")
       conn_retries += 1
       params.delete("LastAthenaPingTime")
 
-    time.sleep(backoff(conn_retries))
+    await asyncio.sleep(backoff(conn_retries))
+
+def main():
+  params = Params()
+  dongle_id = params.get("DongleId").decode('utf-8')
+  ws_uri = ATHENA_HOST + "/ws/v2/" + dongle_id
+
+  api = Api(dongle_id)
+  upload_queue.load()
+
+  try:
+    asyncio.get_event_loop().run_until_complete(athena_loop(ws_uri, api, params))
+  except (KeyboardInterrupt, SystemExit):
+    pass
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Runs athenad's connection handling in process against the local websocket stand-in
+server and reports JSON-RPC round trip latency, sequential and in bursts, plus thread
+count and RSS with a number of local proxies open.
+
+usage: benchmark_athenad.py [requests] [proxies]
+"""
+import asyncio
+import socket
+import sys
+import threading
+import time
+
+from selfdrive.athena import athenad
+from selfdrive.athena.async_websocket import connect
+from selfdrive.athena.test_helpers import MockApi, MockParams, WebsocketServer
+
+
+def rss_mb():
+  with open("/proc/self/status") as f:
+    for line in f:
+      if line.startswith("VmRSS:"):
+        return int(line.split()[1]) / 1024.
+
+
+def percentile(xs, p):
+  xs = sorted(xs)
+  return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def report(name, times):
+  print("%-22s p50 %6.2f ms  p99 %6.2f ms" % (name, percentile(times, 0.5) * 1000, percentile(times, 0.99) * 1000))
+
+
+def main(n_requests, n_proxies):
+  athenad.Params = MockParams
+  athenad.Api = MockApi
+
+  # local port the proxies connect to, connections are only held open
+  local = socket.socket()
+  local.bind(("127.0.0.1", 0))
+  local.listen(n_proxies + 1)
+  athenad.LOCAL_PORT_WHITELIST = set([local.getsockname()[1]])
+  conns = []
+  threading.Thread(target=lambda: [conns.append(local.accept()) for _ in range(n_proxies)], daemon=True).start()
+
+  server = WebsocketServer()
+  proxy_server = WebsocketServer()
+
+  def client():
+    loop = asyncio.new_event_loop()
+    ws = loop.run_until_complete(connect(server.url))
+    loop.run_until_complete(athenad.handle_long_poll(ws))
+  thread = threading.Thread(target=client, daemon=True)
+  thread.start()
+  server.connected.wait(5)
+  server.rpc("echo", "warmup")
+  print("connected: %d threads, %.1f MB RSS" % (threading.active_count(), rss_mb()))
+
+  times = []
+  for i in range(n_requests):
+    t = time.monotonic()
+    server.rpc("echo", str(i))
+    times.append(time.monotonic() - t)
+  report("echo sequential", times)
+
+  times = []
+  for i in range(n_requests // 50):
+    t = time.monotonic()
+    server.rpc_many([("echo", [str(j)]) for j in range(50)])
+    times.append(time.monotonic() - t)
+  report("echo burst of 50", times)
+
+  for _ in range(n_proxies):
+    server.rpc("startLocalProxy", proxy_server.url, local.getsockname()[1])
+  print("%d proxies: %d threads, %.1f MB RSS" % (n_proxies, threading.active_count(), rss_mb()))
+
+  times = []
+  for i in range(n_requests):
+    t = time.monotonic()
+    server.rpc("echo", str(i))
+    times.append(time.monotonic() - t)
+  report("echo with proxies", times)
+
+  server.stop()
+  proxy_server.stop()
+  thread.join(5)
+
+
+if __name__ == "__main__":
+  n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  n_proxies = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+  main(n_requests, n_proxies)
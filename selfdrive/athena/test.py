@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import asyncio
 import json
 import os
 import requests
@@ -8,15 +9,17 @@ import threading
 import queue
 import unittest
 
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process
 from pathlib import Path
 from unittest import mock
 from websocket import ABNF
-from websocket._exceptions import WebSocketConnectionClosedException
 
 from selfdrive.athena import athenad
 from selfdrive.athena.athenad import dispatcher
-from selfdrive.athena.test_helpers import MockWebsocket, MockParams, MockApi, EchoSocket, with_http_server
+from selfdrive.athena.async_websocket import AsyncWebSocket, connect, WebSocketClosed
+from selfdrive.athena.test_helpers import MockWebsocket, MockParams, MockApi, EchoSocket, WebsocketServer, \
+                                         SlowHTTPRequestHandler, with_http_server
 from cereal import messaging
 
 class TestAthenadMethods(unittest.TestCase):
@@ -28,6 +31,10 @@ class TestAthenadMethods(unittest.TestCase):
     athenad.Api = MockApi
     athenad.LOCAL_PORT_WHITELIST = set([cls.SOCKET_PORT])
 
+  def setUp(self):
+    MockParams.saved.clear()
+    athenad.upload_queue = athenad.UploadQueue()
+
   def test_echo(self):
     assert dispatcher["echo"]("bob") == "bob"
 
@@ -90,7 +97,6 @@ class TestAthenadMethods(unittest.TestCase):
       self.assertIsNotNone(resp['item'].get('id'))
       self.assertEqual(athenad.upload_queue.qsize(), 1)
     finally:
-      athenad.upload_queue = queue.Queue()
       os.unlink(fn)
 
   @with_http_server
@@ -99,94 +105,219 @@ class TestAthenadMethods(unittest.TestCase):
     Path(fn).touch()
     item = athenad.UploadItem(path=fn, url=f"{host}/qlog.bz2", headers={}, created_at=int(time.time()*1000), id='')
 
-    end_event = threading.Event()
-    thread = threading.Thread(target=athenad.upload_handler, args=(end_event,))
-    thread.start()
-
     athenad.upload_queue.put_nowait(item)
     try:
-      now = time.time()
-      while time.time() - now < 5:
-        if athenad.upload_queue.qsize() == 0:
-          break
+      run_until(athenad.upload_handler(), lambda: athenad.upload_queue.qsize() == 0)
       self.assertEqual(athenad.upload_queue.qsize(), 0)
     finally:
-      end_event.set()
-      athenad.upload_queue = queue.Queue()
       os.unlink(fn)
 
+  @with_http_server(handler=SlowHTTPRequestHandler)
+  def test_upload_handler_parallel(self, host):
+    fns = [os.path.join(athenad.ROOT, f'rlog{i}.bz2') for i in range(athenad.UPLOAD_WORKERS)]
+    for i, fn in enumerate(fns):
+      with open(fn, 'wb') as f:
+        f.write(os.urandom(2*1024*1024))
+      athenad.upload_queue.put_nowait(athenad.UploadItem(path=fn, url=f"{host}/{i}", headers={}, created_at=0, id=str(i)))
+
+    try:
+      run_until(athenad.upload_handler(), lambda: all(i.current for i in athenad.upload_queue.list()))
+      self.assertTrue(all(i.current for i in athenad.upload_queue.list()), "Uploads did not run in parallel")
+
+      start = time.time()
+      run_until(athenad.upload_handler(), lambda: athenad.upload_queue.qsize() == 0, timeout=10)
+      self.assertEqual(athenad.upload_queue.qsize(), 0)
+      # one file takes about 0.3 s on the slow server
+      self.assertLess(time.time() - start, 0.3 * len(fns))
+    finally:
+      for fn in fns:
+        os.unlink(fn)
+
   def test_cancelUpload(self):
     item = athenad.UploadItem(path="qlog.bz2", url="http://localhost:44444/qlog.bz2", headers={}, created_at=int(time.time()*1000), id='id')
     athenad.upload_queue.put_nowait(item)
-    dispatcher["cancelUpload"](item.id)
+    self.assertEqual(dispatcher["cancelUpload"](item.id), {"success": 1})
+    self.assertEqual(athenad.upload_queue.qsize(), 0)
+    self.assertEqual(dispatcher["cancelUpload"](item.id), 404)
+
+  @with_http_server(handler=SlowHTTPRequestHandler)
+  def test_cancelUpload_in_flight(self, host):
+    fn = os.path.join(athenad.ROOT, 'fcamera.hevc')
+    with open(fn, 'wb') as f:
+      f.write(os.urandom(20*1024*1024))
+    item = athenad.UploadItem(path=fn, url=f"{host}/fcamera.hevc", headers={}, created_at=0, id='id')
+    athenad.upload_queue.put_nowait(item)
 
-    self.assertIn(item.id, athenad.cancelled_uploads)
+    def progress():
+      items = dispatcher["listUploadQueue"]()
+      return items[0]['progress'] if items else 0
 
-    end_event = threading.Event()
-    thread = threading.Thread(target=athenad.upload_handler, args=(end_event,))
-    thread.start()
     try:
-      now = time.time()
-      while time.time() - now < 5:
-        if athenad.upload_queue.qsize() == 0 and len(athenad.cancelled_uploads) == 0:
-          break
+      run_until(athenad.upload_handler(), lambda: progress() > 0)
+      items = dispatcher["listUploadQueue"]()
+      self.assertTrue(items[0]['current'])
+      self.assertGreater(items[0]['progress'], 0)
+
+      self.assertEqual(dispatcher["cancelUpload"](item.id), {"success": 1})
+      start = time.time()
+      run_until(athenad.upload_handler(), lambda: athenad.upload_queue.qsize() == 0)
       self.assertEqual(athenad.upload_queue.qsize(), 0)
-      self.assertEqual(len(athenad.cancelled_uploads), 0)
+      self.assertLess(time.time() - start, 1, "Upload was not stopped")
     finally:
-      end_event.set()
-      athenad.upload_queue = queue.Queue()
+      os.unlink(fn)
 
   def test_listUploadQueue(self):
     item = athenad.UploadItem(path="qlog.bz2", url="http://localhost:44444/qlog.bz2", headers={}, created_at=int(time.time()*1000), id='id')
     athenad.upload_queue.put_nowait(item)
 
+    items = dispatcher["listUploadQueue"]()
+    self.assertEqual(len(items), 1)
+    self.assertDictEqual(items[0], item._asdict())
+
+  def test_upload_queue_persist(self):
+    fn = os.path.join(athenad.ROOT, 'qlog.bz2')
+    Path(fn).touch()
     try:
-      items = dispatcher["listUploadQueue"]()
-      self.assertEqual(len(items), 1)
-      self.assertDictEqual(items[0], item._asdict())
+      items = [athenad.UploadItem(path=fn, url=f"http://localhost:44444/{i}", headers={}, created_at=0, id=str(i)) for i in range(3)]
+      items.append(athenad.UploadItem(path="does_not_exist.bz2", url="http://localhost:44444/gone", headers={}, created_at=0, id='gone'))
+      for item in items:
+        athenad.upload_queue.put_nowait(item)
+      self.assertEqual(athenad.upload_queue.get(timeout=0).id, '0')
+
+      # restart
+      athenad.upload_queue = athenad.UploadQueue()
+      athenad.upload_queue.load()
+      self.assertEqual(athenad.upload_queue.list(), items[:3])
     finally:
-      athenad.upload_queue = queue.Queue()
+      os.unlink(fn)
 
-  @mock.patch('selfdrive.athena.athenad.create_connection')
-  def test_startLocalProxy(self, mock_create_connection):
-    end_event = threading.Event()
+  def test_upload_queue_save_unlocked(self):
+    # a slow param write doesn't block the queue
+    saving = threading.Event()
+    release = threading.Event()
 
-    ws_recv = queue.Queue()
-    ws_send = queue.Queue()
+    class SlowParams(MockParams):
+      def put(self, k, v):
+        saving.set()
+        release.wait(5)
+        super().put(k, v)
+
+    item = athenad.UploadItem(path="qlog.bz2", url="http://localhost:44444/qlog.bz2", headers={}, created_at=0, id='id')
+    with mock.patch('selfdrive.athena.athenad.Params', SlowParams):
+      t = threading.Thread(target=athenad.upload_queue.put_nowait, args=(item,))
+      t.start()
+      self.assertTrue(saving.wait(5))
+      try:
+        self.assertEqual(athenad.upload_queue.qsize(), 1)
+        self.assertFalse(athenad.upload_queue.cancel('missing'))
+      finally:
+        release.set()
+        t.join()
+    self.assertEqual(json.loads(MockParams.saved["AthenadUploadQueue"]), [item._asdict()])
+
+  @mock.patch('selfdrive.athena.athenad.connect')
+  def test_startLocalProxy(self, mock_connect):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    ws_recv = asyncio.Queue()
+    ws_send = asyncio.Queue()
     mock_ws = MockWebsocket(ws_recv, ws_send)
-    mock_create_connection.return_value = mock_ws
+
+    async def fake_connect(*args, **kwargs):
+      return mock_ws
+    mock_connect.side_effect = fake_connect
 
     echo_socket = EchoSocket(self.SOCKET_PORT)
     socket_thread = threading.Thread(target=echo_socket.run)
     socket_thread.start()
 
-    athenad.startLocalProxy(end_event, 'ws://localhost:1234', self.SOCKET_PORT)
+    async def run():
+      await athenad.start_local_proxy('ws://localhost:1234', self.SOCKET_PORT)
 
-    ws_recv.put_nowait(b'ping')
-    try:
-      recv = ws_send.get(timeout=5)
-      assert recv == (b'ping', ABNF.OPCODE_BINARY), recv
-    finally:
-      # signal websocket close to athenad.ws_proxy_recv
-      ws_recv.put_nowait(WebSocketConnectionClosedException())
-      socket_thread.join()
+      ws_recv.put_nowait(b'ping')
+      try:
+        recv = await asyncio.wait_for(ws_send.get(), 5)
+        assert recv == (b'ping', ABNF.OPCODE_BINARY), recv
+      finally:
+        # signal websocket close to athenad.ws_proxy_recv
+        ws_recv.put_nowait(WebSocketClosed())
+        await asyncio.wait(list(athenad.proxy_tasks), timeout=5)
+
+    loop.run_until_complete(run())
+    socket_thread.join()
 
   def test_getSshAuthorizedKeys(self):
     keys = dispatcher["getSshAuthorizedKeys"]()
     self.assertEqual(keys, MockParams().params["GithubSshKeys"].decode('utf-8'))
 
   def test_jsonrpc_handler(self):
-    end_event = threading.Event()
-    thread = threading.Thread(target=athenad.jsonrpc_handler, args=(end_event,))
-    thread.daemon = True
+    ws_send = queue.Queue()
+    mock_ws = MockWebsocket(None, ws_send)
+    data = json.dumps({"method": "echo", "params": ["hello"], "jsonrpc": "2.0", "id": 0})
+    executor = ThreadPoolExecutor(max_workers=1)
+    asyncio.new_event_loop().run_until_complete(athenad.jsonrpc_handler(mock_ws, executor, data))
+    executor.shutdown()
+
+    resp, _ = ws_send.get(timeout=3)
+    self.assertDictEqual(json.loads(resp), {'result': 'hello', 'id': 0, 'jsonrpc': '2.0'})
+
+  def test_handle_long_poll(self):
+    server = WebsocketServer()
+
+    def client():
+      loop = asyncio.new_event_loop()
+      ws = loop.run_until_complete(connect(server.url))
+      loop.run_until_complete(athenad.handle_long_poll(ws))
+    thread = threading.Thread(target=client)
     thread.start()
-    athenad.payload_queue.put_nowait(json.dumps({"method": "echo", "params": ["hello"], "jsonrpc": "2.0", "id": 0}))
+
     try:
-      resp = athenad.response_queue.get(timeout=3)
-      self.assertDictEqual(resp.data, {'result': 'hello', 'id': 0, 'jsonrpc': '2.0'})
+      self.assertTrue(server.connected.wait(5))
+      self.assertEqual(server.rpc("echo", "hello")["result"], "hello")
+      resps = server.rpc_many([("echo", [str(i)]) for i in range(20)])
+      self.assertEqual([r["result"] for r in resps], [str(i) for i in range(20)])
     finally:
-      end_event.set()
-      thread.join()
+      # closing the connection ends handle_long_poll
+      server.stop()
+      thread.join(5)
+    self.assertFalse(thread.is_alive())
+
+  def test_websocket_send_serialized(self):
+    class SlowWriter():
+      def __init__(self):
+        self.frames = []
+        self.draining = 0
+        self.max_draining = 0
+
+      def write(self, data):
+        self.frames.append(data)
+
+      async def drain(self):
+        self.draining += 1
+        self.max_draining = max(self.max_draining, self.draining)
+        await asyncio.sleep(0.01)
+        self.draining -= 1
+
+    async def run():
+      writer = SlowWriter()
+      ws = AsyncWebSocket(None, writer)
+      await asyncio.gather(*[ws.send("x" * 100000) for _ in range(5)])
+      return writer
+
+    writer = asyncio.new_event_loop().run_until_complete(run())
+    self.assertEqual(len(writer.frames), 5)
+    self.assertEqual(writer.max_draining, 1)
+
+def run_until(coro, done, timeout=5):
+  # runs coro as a task until done() or timeout
+  async def run():
+    task = asyncio.ensure_future(coro)
+    start = time.time()
+    while not done() and time.time() - start < timeout:
+      await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+  asyncio.new_event_loop().run_until_complete(run())
 
 if __name__ == '__main__':
   unittest.main()
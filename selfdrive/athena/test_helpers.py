@@ -1,13 +1,18 @@
+import asyncio
 import http.server
+import json
 import multiprocessing
 import queue
 import random
 import requests
 import socket
+import threading
 import time
 from functools import wraps
 from multiprocessing import Process
 
+from selfdrive.athena.async_websocket import AsyncWebSocket, WebSocketClosed, accept_key, parse_headers
+
 class EchoSocket():
   def __init__(self, port):
     self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -40,6 +45,9 @@ class MockApi():
     return "fake-token"
 
 class MockParams():
+  # puts are shared by all instances, like the real params
+  saved = {}
+
   def __init__(self):
     self.params = {
       "DongleId": b"0000000000000000",
@@ -47,25 +55,98 @@ class MockParams():
     }
 
   def get(self, k, encoding=None):
-    ret = self.params.get(k)
+    ret = self.saved.get(k, self.params.get(k))
     if ret is not None and encoding is not None:
       ret = ret.decode(encoding)
     return ret
 
+  def put(self, k, v):
+    self.saved[k] = v.encode('utf8') if isinstance(v, str) else v
+
+  def delete(self, k):
+    self.saved.pop(k, None)
+
 class MockWebsocket():
   def __init__(self, recv_queue, send_queue):
     self.recv_queue = recv_queue
     self.send_queue = send_queue
 
-  def recv(self):
-    data = self.recv_queue.get()
+  async def recv(self):
+    data = await self.recv_queue.get()
     if isinstance(data, Exception):
       raise data
     return data
 
-  def send(self, data, opcode):
+  async def send(self, data, opcode=None):
     self.send_queue.put_nowait((data, opcode))
 
+  async def close(self):
+    pass
+
+class WebsocketServer():
+  """Local stand-in for the athena websocket server. It runs its own event loop on a
+  thread, rpc() sends a JSON-RPC request to the connected athenad and waits for the reply."""
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    self.connected = threading.Event()
+    self.ws = None
+    self.clients = []
+    self.pending = {}
+    self.next_id = 0
+
+    started = threading.Event()
+    def run():
+      asyncio.set_event_loop(self.loop)
+      self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, '127.0.0.1', 0))
+      started.set()
+      self.loop.run_forever()
+    self.thread = threading.Thread(target=run, daemon=True)
+    self.thread.start()
+    started.wait()
+    self.url = 'ws://127.0.0.1:%d/ws/v2/0000000000000000' % self.server.sockets[0].getsockname()[1]
+
+  async def handle(self, reader, writer):
+    _, headers = parse_headers(await reader.readuntil(b"\r\n\r\n"))
+    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  "Sec-WebSocket-Accept: %s\r\n\r\n" % accept_key(headers["sec-websocket-key"])).encode())
+    self.ws = AsyncWebSocket(reader, writer, mask=False)
+    self.clients.append(self.ws)
+    self.connected.set()
+    try:
+      while True:
+        msg = json.loads(await self.ws.recv())
+        fut = self.pending.pop(msg.get("id"), None)
+        if fut is not None:
+          fut.set_result(msg)
+    except WebSocketClosed:
+      pass
+
+  async def _rpc(self, method, params):
+    self.next_id += 1
+    msg_id = self.next_id
+    self.pending[msg_id] = self.loop.create_future()
+    await self.ws.send(json.dumps({"method": method, "params": params, "jsonrpc": "2.0", "id": msg_id}))
+    return await self.pending[msg_id]
+
+  def rpc(self, method, *params, timeout=10):
+    return asyncio.run_coroutine_threadsafe(self._rpc(method, list(params)), self.loop).result(timeout)
+
+  def rpc_many(self, calls, timeout=10):
+    """Sends all (method, params) requests at once and waits for every reply."""
+    async def run():
+      return await asyncio.gather(*[self._rpc(method, list(params)) for method, params in calls])
+    return asyncio.run_coroutine_threadsafe(run(), self.loop).result(timeout)
+
+  def stop(self):
+    async def close():
+      for ws in self.clients:
+        await ws.close()
+      await asyncio.sleep(0.1)
+    asyncio.run_coroutine_threadsafe(close(), self.loop).result(5)
+    self.loop.call_soon_threadsafe(self.server.close)
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join()
+
 class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
   def do_PUT(self):
     length = int(self.headers['Content-Length'])
@@ -73,6 +154,19 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     self.send_response(201, "Created")
     self.end_headers()
 
+class SlowHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def do_PUT(self):
+    # about 6 MB/s
+    length = int(self.headers['Content-Length'])
+    while length > 0:
+      length -= len(self.rfile.read(min(length, 64*1024)))
+      time.sleep(0.01)
+    self.send_response(201, "Created")
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+
 def http_server(port_queue, **kwargs):
   while 1:
     try:
@@ -83,7 +177,10 @@ def http_server(port_queue, **kwargs):
       if e.errno == 98:
         continue
 
-def with_http_server(func):
+def with_http_server(func=None, handler=HTTPRequestHandler):
+  if func is None:
+    return lambda f: with_http_server(f, handler)
+
   @wraps(func)
   def inner(*args, **kwargs):
     port_queue = multiprocessing.Queue()
@@ -91,7 +188,7 @@ def with_http_server(func):
     p = Process(target=http_server,
                 args=(port_queue,),
                 kwargs={
-                  'HandlerClass': HTTPRequestHandler,
+                  'HandlerClass': handler,
                   'bind': host})
     p.start()
     now = time.time()
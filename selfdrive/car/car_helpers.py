@@ -1,7 +1,8 @@
 import os
+from collections.abc import Mapping
 from common.params import Params
 from common.basedir import BASEDIR
-from selfdrive.car.fingerprints import eliminate_incompatible_cars, all_known_cars
+from selfdrive.car.fingerprints import compatible_cars_mask, cars_from_mask, ALL_CARS_MASK, MANIFEST
 from selfdrive.car.vin import get_vin, VIN_UNKNOWN
 from selfdrive.car.fw_versions import get_fw_versions, match_fw_to_car
 from selfdrive.swaglog import cloudlog
@@ -22,47 +23,52 @@ def get_startup_alert(car_recognized, controller_available):
   return alert
 
 
-def load_interfaces(brand_names):
-  ret = {}
-  for brand_name in brand_names:
-    path = ('selfdrive.car.%s' % brand_name)
-    CarInterface = __import__(path + '.interface', fromlist=['CarInterface']).CarInterface
+def load_interface(brand_name):
+  path = ('selfdrive.car.%s' % brand_name)
+  CarInterface = __import__(path + '.interface', fromlist=['CarInterface']).CarInterface
 
-    if os.path.exists(BASEDIR + '/' + path.replace('.', '/') + '/carstate.py'):
-      CarState = __import__(path + '.carstate', fromlist=['CarState']).CarState
-    else:
-      CarState = None
+  if os.path.exists(BASEDIR + '/' + path.replace('.', '/') + '/carstate.py'):
+    CarState = __import__(path + '.carstate', fromlist=['CarState']).CarState
+  else:
+    CarState = None
 
-    if os.path.exists(BASEDIR + '/' + path.replace('.', '/') + '/carcontroller.py'):
-      CarController = __import__(path + '.carcontroller', fromlist=['CarController']).CarController
-      CarState = __import__(path + '.carstate', fromlist=['CarState']).CarState
-    else:
-      CarController = None
-    for model_name in brand_names[brand_name]:
-      ret[model_name] = (CarInterface, CarController, CarState)
-  return ret
+  if os.path.exists(BASEDIR + '/' + path.replace('.', '/') + '/carcontroller.py'):
+    CarController = __import__(path + '.carcontroller', fromlist=['CarController']).CarController
+    CarState = __import__(path + '.carstate', fromlist=['CarState']).CarState
+  else:
+    CarController = None
+  return CarInterface, CarController, CarState
 
 
-def _get_interface_names():
-  # read all the folders in selfdrive/car and return a dict where:
-  # - keys are all the car names that which we have an interface for
-  # - values are lists of spefic car models for a given car
-  brand_names = {}
-  for car_folder in [x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]:
-    try:
-      brand_name = car_folder.split('/')[-1]
-      model_names = __import__('selfdrive.car.%s.values' % brand_name, fromlist=['CAR']).CAR
-      model_names = [getattr(model_names, c) for c in model_names.__dict__.keys() if not c.startswith("__")]
-      brand_names[brand_name] = model_names
-    except (ImportError, IOError):
-      pass
+class Interfaces(Mapping):
+  """Car model -> (CarInterface, CarController, CarState). A brand's modules are imported
+     the first time one of its models is looked up."""
+  def __init__(self, brand_names):
+    self.brands = {model_name: brand_name for brand_name, model_names in brand_names.items() for model_name in model_names}
+    self.loaded = {}
 
-  return brand_names
+  def __getitem__(self, model_name):
+    brand_name = self.brands[model_name]
+    if brand_name not in self.loaded:
+      self.loaded[brand_name] = load_interface(brand_name)
+    return self.loaded[brand_name]
+
+  def __iter__(self):
+    return iter(self.brands)
+
+  def __len__(self):
+    return len(self.brands)
+
+
+def load_interfaces(brand_names):
+  return {model_name: load_interface(brand_name) for brand_name, model_names in brand_names.items() for model_name in model_names}
 
 
-# imports from directory selfdrive/car/<name>/
-interface_names = _get_interface_names()
-interfaces = load_interfaces(interface_names)
+# dict where:
+# - keys are all the car names that which we have an interface for
+# - values are lists of spefic car models for a given car
+interface_names = {brand_name: entry["models"] for brand_name, entry in MANIFEST.items()}
+interfaces = Interfaces(interface_names)
 
 
 def only_toyota_left(candidate_cars):
@@ -99,7 +105,10 @@ def fingerprint(logcan, sendcan, has_relay):
   Params().put("CarVin", vin)
 
   finger = gen_empty_fingerprint()
-  candidate_cars = {i: all_known_cars() for i in [0, 1]}  # attempt fingerprint on both bus 0 and 1
+  # attempt fingerprint on both bus 0 and 1. Candidates are kept as a bitmask of cars
+  candidate_masks = {i: ALL_CARS_MASK for i in [0, 1]}
+  candidate_cars = {i: cars_from_mask(ALL_CARS_MASK) for i in [0, 1]}
+  toyota_left = {i: only_toyota_left(candidate_cars[i]) for i in [0, 1]}
   frame = 0
   frame_fingerprint = 10  # 0.1s
   car_fingerprint = None
@@ -117,9 +126,13 @@ def fingerprint(logcan, sendcan, has_relay):
       if can.src in range(0, 4):
         finger[can.src][can.address] = len(can.dat)
       for b in candidate_cars:
-        if (can.src == b or (only_toyota_left(candidate_cars[b]) and can.src == 2)) and \
+        if (can.src == b or (toyota_left[b] and can.src == 2)) and \
            can.address < 0x800 and can.address not in [0x7df, 0x7e0, 0x7e8]:
-          candidate_cars[b] = eliminate_incompatible_cars(can, candidate_cars[b])
+          mask = candidate_masks[b] & compatible_cars_mask(can)
+          if mask != candidate_masks[b]:
+            candidate_masks[b] = mask
+            candidate_cars[b] = cars_from_mask(mask)
+            toyota_left[b] = only_toyota_left(candidate_cars[b])
 
     # if we only have one car choice and the time since we got our first
     # message has elapsed, exit
@@ -1,32 +1,14 @@
-import os
-from common.basedir import BASEDIR
+from selfdrive.car.manifest import get_manifest, get_attr_from_manifest
+
+# brand name -> models and values.py attributes, cached across runs
+MANIFEST = get_manifest()
 
 
 def get_attr_from_cars(attr, result=dict):
-  # read all the folders in selfdrive/car and return a dict where:
+  # return a dict where:
   # - keys are all the car models
   # - values are attr values from all car folders
-  result = result()
-
-  for car_folder in [x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]:
-    try:
-      car_name = car_folder.split('/')[-1]
-      values = __import__('selfdrive.car.%s.values' % car_name, fromlist=[attr])
-      if hasattr(values, attr):
-        attr_values = getattr(values, attr)
-      else:
-        continue
-
-      if isinstance(attr_values, dict):
-        for f, v in attr_values.items():
-          result[f] = v
-      elif isinstance(attr_values, list):
-        result += attr_values
-
-    except (ImportError, IOError):
-      pass
-
-  return result
+  return get_attr_from_manifest(MANIFEST, attr, result)
 
 
 FW_VERSIONS = get_attr_from_cars('FW_VERSIONS')
@@ -41,6 +23,37 @@ def is_valid_for_fingerprint(msg, car_fingerprint):
   return (adr in car_fingerprint and car_fingerprint[adr] == len(msg.dat)) or adr >= 0x800
 
 
+def _build_fingerprint_index():
+  # inverted index from (address, length) to a bitmask of the cars that have it in any of
+  # their fingerprints. Bit i of a mask is the i-th car in _INDEXED_CARS.
+  indexed_cars = [c for c in _FINGERPRINTS if c not in IGNORED_FINGERPRINTS]
+  index = {}
+  for i, car_name in enumerate(indexed_cars):
+    bit = 1 << i
+    for fingerprint in _FINGERPRINTS[car_name]:
+      for adr_len in list(fingerprint.items()) + list(_DEBUG_ADDRESS.items()):  # add alien debug address
+        index[adr_len] = index.get(adr_len, 0) | bit
+  return indexed_cars, index
+
+
+_INDEXED_CARS, _FINGERPRINT_INDEX = _build_fingerprint_index()
+_CAR_BITS = {car_name: 1 << i for i, car_name in enumerate(_INDEXED_CARS)}
+ALL_CARS_MASK = (1 << len(_INDEXED_CARS)) - 1
+
+
+def compatible_cars_mask(msg):
+  """Returns the bitmask of all cars that could have sent msg."""
+  # ignore addresses that are more than 11 bits
+  if msg.address >= 0x800:
+    return ALL_CARS_MASK
+  return _FINGERPRINT_INDEX.get((msg.address, len(msg.dat)), 0)
+
+
+def cars_from_mask(mask):
+  """Returns the list of cars set in a bitmask from compatible_cars_mask."""
+  return [car_name for car_name in _INDEXED_CARS if _CAR_BITS[car_name] & mask]
+
+
 def eliminate_incompatible_cars(msg, candidate_cars):
   """Removes cars that could not have sent msg.
 
@@ -51,22 +64,8 @@ def eliminate_incompatible_cars(msg, candidate_cars):
      Returns:
       A list containing the subset of candidate_cars that could have sent msg.
   """
-  compatible_cars = []
-
-  for car_name in candidate_cars:
-    if car_name in IGNORED_FINGERPRINTS:
-      continue
-
-    car_fingerprints = _FINGERPRINTS[car_name]
-
-    for fingerprint in car_fingerprints:
-      fingerprint.update(_DEBUG_ADDRESS)  # add alien debug address
-
-      if is_valid_for_fingerprint(msg, fingerprint):
-        compatible_cars.append(car_name)
-        break
-
-  return compatible_cars
+  mask = compatible_cars_mask(msg)
+  return [car_name for car_name in candidate_cars if _CAR_BITS.get(car_name, 0) & mask]
 
 
 def all_known_cars():
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 import traceback
 import struct
-from tqdm import tqdm
+from collections import defaultdict
 
-from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
+from selfdrive.car.isotp_parallel_query import IsoTpQueryScheduler
 from selfdrive.swaglog import cloudlog
 from selfdrive.car.fingerprints import FW_VERSIONS
 from selfdrive.car.toyota.values import CAR as TOYOTA
@@ -65,14 +65,64 @@ REQUESTS = [
 ]
 
 
-def chunks(l, n=128):
-  for i in range(0, len(l), n):
-    yield l[i:i + n]
-
-
-def match_fw_to_car(fw_versions):
-  candidates = FW_VERSIONS
-  invalid = []
+ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa, Ecu.electricBrakeBooster]
+
+# ECUs that are essential but may not respond for some cars
+OPTIONAL_ECUS = {
+  Ecu.esp: [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER],
+  # TODO: COROLLA_TSS2 engine can show on two different addresses
+  Ecu.engine: [TOYOTA.COROLLA_TSS2, TOYOTA.CHR],
+}
+
+
+def build_fw_index(fw_versions):
+  """Index FW versions by ECU for matching with set operations.
+
+     Returns a dict with:
+      cars: all cars
+      ecu_count: car -> number of ECUs
+      versions: (addr, sub_addr, version) -> cars that have this version on that ECU
+      ecu_cars: (addr, sub_addr) -> cars that have that ECU
+      required: (addr, sub_addr) -> cars for which that ECU has to respond
+      essential: (addr, sub_addr) -> cars for which that ECU is essential
+      essential_count: car -> number of essential ECUs
+  """
+  index = {
+    'cars': set(fw_versions.keys()),
+    'ecu_count': defaultdict(int),
+    'versions': defaultdict(set),
+    'ecu_cars': defaultdict(set),
+    'required': defaultdict(set),
+    'essential': defaultdict(set),
+    'essential_count': defaultdict(int),
+  }
+
+  for candidate, fws in fw_versions.items():
+    for (ecu_type, addr, sub_addr), expected_versions in fws.items():
+      ecu = (addr, sub_addr)
+      index['ecu_cars'][ecu].add(candidate)
+      index['ecu_count'][candidate] += 1
+      for version in expected_versions:
+        index['versions'][(addr, sub_addr, version)].add(candidate)
+
+      if ecu_type in ESSENTIAL_ECUS:
+        index['essential'][ecu].add(candidate)
+        index['essential_count'][candidate] += 1
+        if candidate not in OPTIONAL_ECUS.get(ecu_type, []):
+          index['required'][ecu].add(candidate)
+
+  return index
+
+
+_FW_INDEX = build_fw_index(FW_VERSIONS)
+
+
+def match_fw_to_car_ranked(fw_versions, fw_index=None):
+  """Returns the cars compatible with the queried FW versions as a list of (car, confidence),
+     best match first. Confidence is the fraction of the car's essential ECUs with a matching
+     version, or of all its ECUs for cars without essential ECUs."""
+  if fw_index is None:
+    fw_index = _FW_INDEX
 
   fw_versions_dict = {}
   for fw in fw_versions:
@@ -80,39 +130,51 @@ def match_fw_to_car(fw_versions):
     sub_addr = fw.subAddress if fw.subAddress != 0 else None
     fw_versions_dict[(addr, sub_addr)] = fw.fwVersion
 
-  for candidate, fws in candidates.items():
-    for ecu, expected_versions in fws.items():
-      ecu_type = ecu[0]
-      addr = ecu[1:]
-      found_version = fw_versions_dict.get(addr, None)
-      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa, Ecu.electricBrakeBooster]
-      if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
-        continue
-
-      # TODO: COROLLA_TSS2 engine can show on two different addresses
-      if ecu_type == Ecu.engine and candidate in [TOYOTA.COROLLA_TSS2, TOYOTA.CHR] and found_version is None:
-        continue
+  invalid = set()
+  matched = defaultdict(int)
+  matched_essential = defaultdict(int)
+
+  for ecu, version in fw_versions_dict.items():
+    cars = fw_index['versions'].get(ecu + (version,), set())
+    # cars with this ECU must have a matching version, essential or not
+    invalid |= fw_index['ecu_cars'].get(ecu, set()) - cars
+    for c in cars:
+      matched[c] += 1
+    for c in cars & fw_index['essential'].get(ecu, set()):
+      matched_essential[c] += 1
+
+  # required ECUs that did not respond
+  for ecu, cars in fw_index['required'].items():
+    if ecu not in fw_versions_dict:
+      invalid |= cars
+
+  ranked = []
+  for c in fw_index['cars'] - invalid:
+    if fw_index['essential_count'][c]:
+      confidence = matched_essential[c] / fw_index['essential_count'][c]
+    elif fw_index['ecu_count'][c]:
+      confidence = matched[c] / fw_index['ecu_count'][c]
+    else:
+      confidence = 0.
+    ranked.append((c, confidence, matched[c]))
+
+  ranked.sort(key=lambda x: (-x[1], -x[2], x[0]))
+  return [(c, confidence) for c, confidence, _ in ranked]
 
-      # ignore non essential ecus
-      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
-        continue
 
-      if found_version not in expected_versions:
-        invalid.append(candidate)
-        break
-
-  return set(candidates.keys()) - set(invalid)
+def match_fw_to_car(fw_versions):
+  return {c for c, _ in match_fw_to_car_ranked(fw_versions)}
 
 
 def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False, progress=False):
   ecu_types = {}
 
   # Extract ECU adresses to query from fingerprints
-  # ECUs using a subadress need be queried one by one, the rest can be done in parallel
+  # All ECUs, including the ones using a subaddress, are queried in parallel and every
+  # ECU runs through all REQUESTS patterns on its own
   addrs = []
-  parallel_addrs = []
 
-  versions = FW_VERSIONS
+  versions = dict(FW_VERSIONS)
   if extra is not None:
     versions.update(extra)
 
@@ -121,26 +183,15 @@ def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False,
       a = (addr, sub_addr)
       if a not in ecu_types:
         ecu_types[a] = ecu_type
-
-      if sub_addr is None:
-        if a not in parallel_addrs:
-          parallel_addrs.append(a)
-      else:
-        if [a] not in addrs:
-          addrs.append([a])
-
-  addrs.insert(0, parallel_addrs)
+        addrs.append(a)
 
   fw_versions = {}
-  for i, addr in enumerate(tqdm(addrs, disable=not progress)):
-    for addr_chunk in chunks(addr):
-      for request, response in REQUESTS:
-        try:
-          query = IsoTpParallelQuery(sendcan, logcan, bus, addr_chunk, request, response, debug=debug)
-          t = 2 * timeout if i == 0 else timeout
-          fw_versions.update(query.get_data(t))
-        except Exception:
-          cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
+  try:
+    query = IsoTpQueryScheduler(sendcan, logcan, bus, addrs, REQUESTS, debug=debug)
+    fw_versions = query.get_data(2 * timeout, sub_addr_timeout=timeout, progress=progress)
+    cloudlog.info("FW query ECU latency: %s", {f"{hex(a[0])}/{a[1]}": round(t, 3) for a, t in query.latency.items()})
+  except Exception:
+    cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
 
   # Build capnp list to put into CarParams
   car_fw = []
@@ -193,7 +244,7 @@ if __name__ == "__main__":
 
   t = time.time()
   fw_vers = get_fw_versions(logcan, sendcan, 1, extra=extra, debug=args.debug, progress=True)
-  candidates = match_fw_to_car(fw_vers)
+  candidates = match_fw_to_car_ranked(fw_vers)
 
   print()
   print("Found FW versions")
@@ -7,8 +7,8 @@ from selfdrive.car import create_gas_command
 from selfdrive.car.honda import hondacan
 from selfdrive.car.honda.values import CruiseButtons, CAR, VISUAL_HUD
 from opendbc.can.packer import CANPacker
-from selfdrive.kegman_conf import kegman_conf
-kegman = kegman_conf()
+from selfdrive.kegman_conf import kegman_store
+kegman = kegman_store()
 
 VisualAlert = car.CarControl.HUDControl.VisualAlert
 
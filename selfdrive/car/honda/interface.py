@@ -10,7 +10,7 @@ from selfdrive.car.honda.values import CruiseButtons, CAR, HONDA_BOSCH, Ecu, ECU
 from selfdrive.car import STD_CARGO_KG, CivicParams, scale_rot_inertia, scale_tire_stiffness, is_ecu_disconnected, gen_empty_fingerprint
 from selfdrive.controls.lib.planner import _A_CRUISE_MAX_V_FOLLOWING
 from selfdrive.car.interfaces import CarInterfaceBase
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 
 A_ACC_MAX = max(_A_CRUISE_MAX_V_FOLLOWING)
 
@@ -150,7 +150,7 @@ class CarInterface(CarInterfaceBase):
 
     eps_modified = False
 
-    kegman = kegman_conf()
+    kegman = kegman_store()
     if int(kegman.conf['epsModded']):
       eps_modified = True
 
@@ -1,12 +1,16 @@
 import time
+import traceback
 from collections import defaultdict
 from functools import partial
+from tqdm import tqdm
 
 import cereal.messaging as messaging
 from selfdrive.swaglog import cloudlog
 from selfdrive.boardd.boardd import can_list_to_can_capnp
 from panda.python.uds import CanClient, IsoTpMessage, FUNCTIONAL_ADDRS, get_rx_addr_for_tx_addr
 
+NEGATIVE_RESPONSE = 0x7F
+
 
 class IsoTpParallelQuery():
   def __init__(self, sendcan, logcan, bus, addrs, request, response, functional_addr=False, debug=False):
@@ -26,6 +30,7 @@ class IsoTpParallelQuery():
         self.real_addrs.append((a, None))
 
     self.msg_addrs = {tx_addr: get_rx_addr_for_tx_addr(tx_addr[0]) for tx_addr in self.real_addrs}
+    self.rx_addrs = set(self.msg_addrs.values())
     self.msg_buffer = defaultdict(list)
 
   def rx(self):
@@ -39,7 +44,7 @@ class IsoTpParallelQuery():
             if (0x7E8 <= msg.address <= 0x7EF) or (0x18DAF100 <= msg.address <= 0x18DAF1FF):
               fn_addr = next(a for a in FUNCTIONAL_ADDRS if msg.address - a <= 32)
               self.msg_buffer[fn_addr].append((msg.address, msg.busTime, msg.dat, msg.src))
-          elif msg.address in self.msg_addrs.values():
+          elif msg.address in self.rx_addrs:
             self.msg_buffer[msg.address].append((msg.address, msg.busTime, msg.dat, msg.src))
 
   def _can_tx(self, tx_addr, dat, bus):
@@ -70,6 +75,17 @@ class IsoTpParallelQuery():
     messaging.drain_sock(self.logcan)
     self.msg_buffer = defaultdict(list)
 
+  def _create_msg(self, tx_addr, rx_addr):
+    # rx_addr not set when using functional tx addr
+    id_addr = rx_addr or tx_addr[0]
+    sub_addr = tx_addr[1]
+
+    can_client = CanClient(self._can_tx, partial(self._can_rx, id_addr, sub_addr=sub_addr), tx_addr[0], rx_addr, self.bus, sub_addr=sub_addr, debug=self.debug)
+
+    max_len = 8 if sub_addr is None else 7
+
+    return IsoTpMessage(can_client, timeout=0, max_len=max_len, debug=self.debug)
+
   def get_data(self, timeout):
     self._drain_rx()
 
@@ -78,15 +94,7 @@ class IsoTpParallelQuery():
     request_counter = {}
     request_done = {}
     for tx_addr, rx_addr in self.msg_addrs.items():
-      # rx_addr not set when using functional tx addr
-      id_addr = rx_addr or tx_addr[0]
-      sub_addr = tx_addr[1]
-
-      can_client = CanClient(self._can_tx, partial(self._can_rx, id_addr, sub_addr=sub_addr), tx_addr[0], rx_addr, self.bus, sub_addr=sub_addr, debug=self.debug)
-
-      max_len = 8 if sub_addr is None else 7
-
-      msg = IsoTpMessage(can_client, timeout=0, max_len=max_len, debug=self.debug)
+      msg = self._create_msg(tx_addr, rx_addr)
       msg.send(self.request[0])
 
       msgs[tx_addr] = msg
@@ -126,3 +134,109 @@ class IsoTpParallelQuery():
         break
 
     return results
+
+
+class EcuQueryState():
+  def __init__(self, tx_addr, rx_addr, timeout):
+    self.tx_addr = tx_addr
+    self.rx_addr = rx_addr
+    self.msg = None
+    self.timeout = timeout
+    self.pattern = -1
+    self.counter = 0
+    self.deadline = 0.
+    self.start_time = None
+    self.response_time = None
+    self.result = None
+
+
+class IsoTpQueryScheduler(IsoTpParallelQuery):
+  """Runs a list of (request, response) patterns on many ECUs at once.
+
+  Every ECU goes through the patterns in order, independently of the other ECUs.
+  All ECUs share a single drain of logcan and at most max_parallel ECUs are queried
+  at the same time. The query ends as soon as every ECU went through all patterns.
+  """
+  def __init__(self, sendcan, logcan, bus, addrs, requests, max_parallel=128, debug=False):
+    super().__init__(sendcan, logcan, bus, addrs, None, None, debug=debug)
+    self.requests = requests
+    self.max_parallel = max_parallel
+    self.latency = {}
+
+  def _next_pattern(self, ecu, now):
+    ecu.pattern += 1
+    ecu.counter = 0
+    if ecu.pattern >= len(self.requests):
+      return False
+
+    # a fresh message for every pattern, the send drops what is left of the previous one
+    ecu.msg = self._create_msg(ecu.tx_addr, ecu.rx_addr)
+    ecu.deadline = now + ecu.timeout
+    ecu.msg.send(self.requests[ecu.pattern][0][0])
+    return True
+
+  def get_data(self, timeout, sub_addr_timeout=None, progress=False):
+    """Returns the response of the last pattern each ECU answered. Every pattern
+       gets timeout seconds per ECU, or sub_addr_timeout for sub addressed ECUs.
+       The time from the first request to the last response of each ECU that
+       answered is stored in self.latency."""
+    if sub_addr_timeout is None:
+      sub_addr_timeout = timeout
+
+    self._drain_rx()
+
+    pending = list(self.msg_addrs.items())
+    active = {}
+    results = {}
+    self.latency = {}
+
+    with tqdm(total=len(pending), disable=not progress) as pbar:
+      while pending or active:
+        now = time.monotonic()
+        while pending and len(active) < self.max_parallel:
+          tx_addr, rx_addr = pending.pop(0)
+          ecu = EcuQueryState(tx_addr, rx_addr, timeout if tx_addr[1] is None else sub_addr_timeout)
+          ecu.start_time = now
+          self._next_pattern(ecu, now)
+          active[tx_addr] = ecu
+
+        self.rx()
+        now = time.monotonic()
+
+        for tx_addr, ecu in list(active.items()):
+          try:
+            dat = ecu.msg.recv()
+          except Exception:
+            cloudlog.warning(f"iso-tp query exception: {traceback.format_exc()}")
+            dat, ecu.deadline = None, now
+
+          request, response = self.requests[ecu.pattern]
+
+          if dat:
+            expected_response = response[ecu.counter]
+            if dat[:len(expected_response)] == expected_response:
+              if ecu.counter + 1 < len(request):
+                ecu.counter += 1
+                ecu.msg.send(request[ecu.counter])
+                continue
+
+              ecu.result = dat[len(expected_response):]
+              ecu.response_time = now
+            elif dat[0] == NEGATIVE_RESPONSE and dat[1:2] == request[ecu.counter][:1]:
+              cloudlog.warning(f"iso-tp query bad response: 0x{bytes.hex(dat)}")
+            else:
+              # late reply to an earlier pattern, keep waiting for this one
+              cloudlog.debug(f"iso-tp query ignored response: 0x{bytes.hex(dat)}")
+              if now < ecu.deadline:
+                continue
+          elif now < ecu.deadline:
+            continue
+
+          if not self._next_pattern(ecu, now):
+            del active[tx_addr]
+            pbar.update(1)
+            if ecu.result is not None:
+              results[tx_addr] = ecu.result
+              self.latency[tx_addr] = ecu.response_time - ecu.start_time
+
+    return results
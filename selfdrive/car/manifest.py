@@ -0,0 +1,90 @@
+"""Manifest of the supported cars: for every brand its models, fingerprints and FW versions,
+read from the brand's values.py. Building it imports every brand's values, so it is cached
+in MANIFEST_DIR keyed by a hash of those files and rebuilt when one of them changes. The
+cache is a pickle, so it is only used from a directory that no other user can write to.
+"""
+import os
+import stat
+import pickle
+import hashlib
+
+from common.basedir import BASEDIR
+from common.file_helpers import atomic_write_in_dir
+
+CAR_DIR = os.path.join(BASEDIR, "selfdrive/car")
+MANIFEST_DIR = os.getenv("CAR_MANIFEST_DIR", os.path.join(CAR_DIR, ".manifest_cache"))
+MANIFEST_ATTRS = ["FINGERPRINTS", "FW_VERSIONS", "IGNORED_FINGERPRINTS"]
+# bump when the manifest layout changes
+MANIFEST_VERSION = 1
+
+
+def get_brand_names():
+  """Returns the sorted names of the folders in selfdrive/car that have a values.py."""
+  return sorted(d for d in os.listdir(CAR_DIR) if os.path.isfile(os.path.join(CAR_DIR, d, "values.py")))
+
+
+def manifest_key(brand_names):
+  h = hashlib.sha1(str(MANIFEST_VERSION).encode())
+  for brand_name in brand_names:
+    h.update(brand_name.encode())
+    with open(os.path.join(CAR_DIR, brand_name, "values.py"), "rb") as f:
+      h.update(f.read())
+  return h.hexdigest()
+
+
+def build_manifest(brand_names):
+  manifest = {}
+  for brand_name in brand_names:
+    try:
+      values = __import__('selfdrive.car.%s.values' % brand_name, fromlist=['CAR'])
+    except (ImportError, IOError):
+      continue
+
+    entry = {attr: getattr(values, attr) for attr in MANIFEST_ATTRS if hasattr(values, attr)}
+    model_names = values.CAR
+    entry["models"] = [getattr(model_names, c) for c in model_names.__dict__.keys() if not c.startswith("__")]
+    manifest[brand_name] = entry
+  return manifest
+
+
+def is_private_dir(path):
+  """True if path is a directory owned by this user that nobody else can write to."""
+  st = os.lstat(path)
+  return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def get_manifest(manifest_dir=MANIFEST_DIR):
+  """Returns a dict from brand name to a dict with its "models" and the values.py attributes
+     in MANIFEST_ATTRS that the brand defines."""
+  brand_names = get_brand_names()
+  path = os.path.join(manifest_dir, manifest_key(brand_names))
+
+  try:
+    if is_private_dir(manifest_dir):
+      with open(path, "rb") as f:
+        return pickle.load(f)
+  except (OSError, EOFError, pickle.UnpicklingError):
+    pass
+
+  manifest = build_manifest(brand_names)
+  try:
+    os.makedirs(manifest_dir, mode=0o700, exist_ok=True)
+    if is_private_dir(manifest_dir):
+      with atomic_write_in_dir(path, mode="wb", overwrite=True) as f:
+        pickle.dump(manifest, f)
+  except OSError:
+    # read only or full, use it uncached
+    pass
+  return manifest
+
+
+def get_attr_from_manifest(manifest, attr, result=dict):
+  """Merges attr over all brands, dicts by key and lists by concatenation."""
+  result = result()
+  for entry in manifest.values():
+    attr_values = entry.get(attr)
+    if isinstance(attr_values, dict):
+      result.update(attr_values)
+    elif isinstance(attr_values, list):
+      result += attr_values
+  return result
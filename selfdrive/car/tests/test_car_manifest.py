@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from selfdrive.car import manifest
+from selfdrive.car.manifest import get_manifest, get_attr_from_manifest, get_brand_names
+
+
+class TestCarManifest(unittest.TestCase):
+  def setUp(self):
+    self.manifest_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.manifest_dir)
+
+  def test_matches_values(self):
+    m = get_manifest(self.manifest_dir)
+    self.assertEqual(sorted(m), get_brand_names())
+
+    from selfdrive.car.toyota.values import CAR, FINGERPRINTS, FW_VERSIONS
+    self.assertIn(CAR.RAV4, m["toyota"]["models"])
+    self.assertEqual(m["toyota"]["FINGERPRINTS"], FINGERPRINTS)
+    self.assertEqual(m["toyota"]["FW_VERSIONS"], FW_VERSIONS)
+    self.assertEqual(m["mock"]["models"], ["mock"])
+
+  def test_cached(self):
+    built = get_manifest(self.manifest_dir)
+    with mock.patch.object(manifest, "build_manifest", side_effect=AssertionError("rebuilt")):
+      self.assertEqual(get_manifest(self.manifest_dir), built)
+
+  def test_rebuilt_on_change(self):
+    get_manifest(self.manifest_dir)
+    with mock.patch.object(manifest, "MANIFEST_VERSION", manifest.MANIFEST_VERSION + 1), \
+         mock.patch.object(manifest, "build_manifest", return_value={}) as build:
+      self.assertEqual(get_manifest(self.manifest_dir), {})
+      build.assert_called_once()
+
+  def test_shared_dir_not_used(self):
+    get_manifest(self.manifest_dir)
+    os.chmod(self.manifest_dir, 0o777)
+    with mock.patch.object(manifest, "build_manifest", return_value={}) as build:
+      self.assertEqual(get_manifest(self.manifest_dir), {})
+      build.assert_called_once()
+
+    # and nothing is written there
+    shutil.rmtree(self.manifest_dir)
+    os.mkdir(self.manifest_dir, 0o777)
+    os.chmod(self.manifest_dir, 0o777)
+    get_manifest(self.manifest_dir)
+    self.assertEqual(os.listdir(self.manifest_dir), [])
+
+  def test_merge(self):
+    m = {"a": {"FW_VERSIONS": {"A": 1}, "IGNORED_FINGERPRINTS": ["A"]}, "b": {"FW_VERSIONS": {"B": 2}}}
+    self.assertEqual(get_attr_from_manifest(m, "FW_VERSIONS"), {"A": 1, "B": 2})
+    self.assertEqual(get_attr_from_manifest(m, "IGNORED_FINGERPRINTS", list), ["A"])
+
+
+if __name__ == "__main__":
+  unittest.main()
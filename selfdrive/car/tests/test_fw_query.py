@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import time
+import unittest
+
+from cereal import log
+import cereal.messaging as messaging
+from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.car.fw_versions import REQUESTS, TOYOTA_VERSION_REQUEST, UDS_VERSION_REQUEST, \
+                                      SHORT_TESTER_PRESENT_REQUEST, TESTER_PRESENT_REQUEST, \
+                                      TOYOTA_VERSION_RESPONSE, UDS_VERSION_RESPONSE, \
+                                      DEFAULT_DIAGNOSTIC_REQUEST, EXTENDED_DIAGNOSTIC_REQUEST, OBD_VERSION_REQUEST
+from selfdrive.car.isotp_parallel_query import IsoTpQueryScheduler
+from panda.python.uds import get_rx_addr_for_tx_addr
+
+BUS = 1
+
+
+class SimulatedEcu():
+  """ISO-TP responder for a single ECU, answers every request in responses with a positive response,
+  after the delay in delays for that request"""
+  def __init__(self, tx_addr, sub_addr, responses, delays=None):
+    self.tx_addr = tx_addr
+    self.rx_addr = get_rx_addr_for_tx_addr(tx_addr)
+    self.sub_addr = sub_addr
+    self.responses = responses
+    self.delays = delays or {}
+    self.delay = 0.
+    self.pending_frames = []
+
+  def _frame(self, dat):
+    if self.sub_addr is not None:
+      dat = bytes([self.sub_addr]) + dat
+    return [self.rx_addr, 0, dat.ljust(8, b"\x00"), BUS]
+
+  def process(self, address, dat):
+    if address != self.tx_addr:
+      return []
+    if self.sub_addr is not None:
+      if dat[0] != self.sub_addr:
+        return []
+      dat = dat[1:]
+
+    # flow control for a multi frame response
+    if dat[0] == 0x30:
+      frames, self.pending_frames = self.pending_frames, []
+      self.delay = 0.
+      return frames
+
+    request = dat[1:1 + (dat[0] & 0xF)]
+    if request not in self.responses:
+      return []
+
+    self.delay = self.delays.get(request, 0.)
+    response = bytes([request[0] + 0x40]) + request[1:] + self.responses[request]
+    max_len = 7 if self.sub_addr is None else 6
+    if len(response) <= max_len:
+      return [self._frame(bytes([len(response)]) + response)]
+
+    first = bytes([0x10 | (len(response) >> 8), len(response) & 0xFF]) + response[:max_len - 1]
+    rest = response[max_len - 1:]
+    self.pending_frames = [self._frame(bytes([0x20 | ((i + 1) & 0xF)]) + rest[j:j + max_len])
+                           for i, j in enumerate(range(0, len(rest), max_len))]
+    return [self._frame(first)]
+
+
+class SimulatedCar():
+  """Fake logcan and sendcan sockets backed by a list of simulated ECUs"""
+  def __init__(self, ecus):
+    self.ecus = ecus
+    self.queue = []  # (time, dat) sorted by time
+    self.sent = 0
+
+  # sendcan
+  def send(self, dat):
+    self.sent += 1
+    for msg in log.Event.from_bytes(dat).sendcan:
+      for ecu in self.ecus:
+        frames = ecu.process(msg.address, bytes(msg.dat))
+        if frames:
+          self.queue.append((time.monotonic() + ecu.delay, can_list_to_can_capnp(frames)))
+          self.queue.sort(key=lambda q: q[0])
+
+  # logcan
+  def receive(self, non_blocking=False):
+    if self.queue and self.queue[0][0] <= time.monotonic():
+      return self.queue.pop(0)[1]
+    if non_blocking:
+      return None
+    # real can traffic is never quiet
+    time.sleep(0.001)
+    return messaging.new_message('can', 0).to_bytes()
+
+
+UDS_RESPONSES = {
+  TESTER_PRESENT_REQUEST: b"",
+  DEFAULT_DIAGNOSTIC_REQUEST: b"\x00\x32\x01\xf4",
+  EXTENDED_DIAGNOSTIC_REQUEST: b"\x00\x32\x01\xf4",
+  UDS_VERSION_REQUEST: b"UDS-FW-VERSION-1234",
+}
+TOYOTA_RESPONSES = {
+  SHORT_TESTER_PRESENT_REQUEST: b"",
+  TOYOTA_VERSION_REQUEST: b"\x018965B4209000\x00\x00\x00\x00",
+}
+
+
+class TestFwQueryScheduler(unittest.TestCase):
+  def test_all_patterns_and_sub_addrs(self):
+    ecus = [
+      SimulatedEcu(0x7e0, None, TOYOTA_RESPONSES),
+      SimulatedEcu(0x18da30f1, None, UDS_RESPONSES),
+      SimulatedEcu(0x750, 0x5, TOYOTA_RESPONSES),
+      SimulatedEcu(0x750, 0xf, TOYOTA_RESPONSES),
+    ]
+    car = SimulatedCar(ecus)
+    addrs = [(0x7e0, None), (0x18da30f1, None), (0x750, 0x5), (0x750, 0xf), (0x7e1, None), (0x750, 0x6c)]
+
+    query = IsoTpQueryScheduler(car, car, BUS, addrs, REQUESTS)
+    results = query.get_data(0.1, sub_addr_timeout=0.1)
+
+    self.assertEqual(results, {
+      (0x7e0, None): TOYOTA_RESPONSES[TOYOTA_VERSION_REQUEST],
+      (0x18da30f1, None): UDS_RESPONSES[UDS_VERSION_REQUEST],
+      (0x750, 0x5): TOYOTA_RESPONSES[TOYOTA_VERSION_REQUEST],
+      (0x750, 0xf): TOYOTA_RESPONSES[TOYOTA_VERSION_REQUEST],
+    })
+    self.assertEqual(set(query.latency.keys()), set(results.keys()))
+
+  def test_early_exit(self):
+    # every pattern on every ECU is answered, so the query must not wait for any timeout
+    responses = dict(UDS_RESPONSES)
+    responses.update({SHORT_TESTER_PRESENT_REQUEST: b"", TOYOTA_VERSION_REQUEST: b"", OBD_VERSION_REQUEST: b""})
+    ecus = [SimulatedEcu(0x7e0 + i, None, responses) for i in range(4)]
+    car = SimulatedCar(ecus)
+
+    query = IsoTpQueryScheduler(car, car, BUS, [(0x7e0 + i, None) for i in range(4)], REQUESTS)
+    t = time.monotonic()
+    results = query.get_data(5.)
+    self.assertLess(time.monotonic() - t, 1.)
+    self.assertEqual(len(results), 4)
+
+  def test_late_response(self):
+    # the reply to the first pattern comes after its timeout, while the second pattern is running
+    requests = [([TOYOTA_VERSION_REQUEST], [TOYOTA_VERSION_RESPONSE]), ([UDS_VERSION_REQUEST], [UDS_VERSION_RESPONSE])]
+    responses = {TOYOTA_VERSION_REQUEST: b"TOYOTA", UDS_VERSION_REQUEST: b"UDS"}
+    ecu = SimulatedEcu(0x7e0, None, responses, delays={TOYOTA_VERSION_REQUEST: 0.25, UDS_VERSION_REQUEST: 0.15})
+    car = SimulatedCar([ecu])
+
+    query = IsoTpQueryScheduler(car, car, BUS, [(0x7e0, None)], requests)
+    self.assertEqual(query.get_data(0.2), {(0x7e0, None): b"UDS"})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from cereal import car
+from selfdrive.car.fingerprints import FW_VERSIONS
+from selfdrive.car.fw_versions import match_fw_to_car, match_fw_to_car_ranked
+from selfdrive.car.toyota.values import CAR as TOYOTA
+
+Ecu = car.CarParams.Ecu
+
+
+def match_fw_to_car_linear(fw_versions):
+  # reference implementation, scans every ECU of every candidate
+  candidates = FW_VERSIONS
+  invalid = []
+
+  fw_versions_dict = {}
+  for fw in fw_versions:
+    addr = fw.address
+    sub_addr = fw.subAddress if fw.subAddress != 0 else None
+    fw_versions_dict[(addr, sub_addr)] = fw.fwVersion
+
+  for candidate, fws in candidates.items():
+    for ecu, expected_versions in fws.items():
+      ecu_type = ecu[0]
+      addr = ecu[1:]
+      found_version = fw_versions_dict.get(addr, None)
+      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa, Ecu.electricBrakeBooster]
+      if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
+        continue
+
+      if ecu_type == Ecu.engine and candidate in [TOYOTA.COROLLA_TSS2, TOYOTA.CHR] and found_version is None:
+        continue
+
+      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
+        continue
+
+      if found_version not in expected_versions:
+        invalid.append(candidate)
+        break
+
+  return set(candidates.keys()) - set(invalid)
+
+
+def car_fw_from_versions(fws, version_idx=0, drop=()):
+  car_fw = []
+  for (ecu, addr, sub_addr), versions in fws.items():
+    if (addr, sub_addr) in drop or not versions:
+      continue
+    f = car.CarParams.CarFw.new_message()
+    f.ecu = ecu
+    f.address = addr
+    if sub_addr is not None:
+      f.subAddress = sub_addr
+    f.fwVersion = versions[version_idx % len(versions)]
+    car_fw.append(f)
+  return car_fw
+
+
+def all_known_fw():
+  # every known FW version of every car, plus the same lists with one ECU missing
+  random.seed(0)
+  for candidate, fws in FW_VERSIONS.items():
+    max_versions = max([len(v) for v in fws.values()] + [1])
+    for i in range(max_versions):
+      yield candidate, car_fw_from_versions(fws, i), True
+    for ecu in fws:
+      yield candidate, car_fw_from_versions(fws, random.randrange(max_versions), drop=[ecu[1:]]), False
+
+
+class TestFwMatching(unittest.TestCase):
+  def test_known_fw_versions(self):
+    for candidate, car_fw, complete in all_known_fw():
+      matches = match_fw_to_car(car_fw)
+      self.assertEqual(matches, match_fw_to_car_linear(car_fw), candidate)
+      if complete:
+        self.assertIn(candidate, matches)
+
+  def test_ranked(self):
+    for candidate, fws in FW_VERSIONS.items():
+      ranked = match_fw_to_car_ranked(car_fw_from_versions(fws))
+      confidences = [c for _, c in ranked]
+      self.assertEqual(confidences, sorted(confidences, reverse=True))
+
+      confidence = dict(ranked)[candidate]
+      if any(ecu[0] in (Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera) for ecu in fws):
+        self.assertEqual(confidence, 1.0)
+
+  def test_unknown_fw(self):
+    f = car.CarParams.CarFw.new_message()
+    f.ecu = Ecu.eps
+    f.address = 0x7a1
+    f.fwVersion = b'NOT A REAL VERSION'
+    self.assertEqual(match_fw_to_car([f]), match_fw_to_car_linear([f]))
+
+
+if __name__ == "__main__":
+  unittest.main()
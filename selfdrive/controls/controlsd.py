@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import os
 import gc
-import capnp
 from cereal import car, log
 from common.numpy_fast import clip
 from common.realtime import sec_since_boot, set_realtime_priority, Ratekeeper, DT_CTRL
@@ -12,8 +11,7 @@ from selfdrive.config import Conversions as CV
 from selfdrive.boardd.boardd import can_list_to_can_capnp
 from selfdrive.car.car_helpers import get_car, get_startup_alert
 from selfdrive.controls.lib.lane_planner import CAMERA_OFFSET
-from selfdrive.controls.lib.drive_helpers import get_events, \
-                                                 create_event, \
+from selfdrive.controls.lib.drive_helpers import Events, \
                                                  EventTypes as ET, \
                                                  update_v_cruise, \
                                                  initialize_v_cruise
@@ -41,11 +39,11 @@ LaneChangeBSM = log.PathPlan.LaneChangeBSM
 def add_lane_change_event(events, path_plan):
   if path_plan.laneChangeState == LaneChangeState.preLaneChange:
     if path_plan.laneChangeDirection == LaneChangeDirection.left:
-      events.append(create_event('preLaneChangeLeft', [ET.WARNING]))
+      events.add('preLaneChangeLeft', [ET.WARNING])
     else:
-      events.append(create_event('preLaneChangeRight', [ET.WARNING]))
+      events.add('preLaneChangeRight', [ET.WARNING])
   elif path_plan.laneChangeState in [LaneChangeState.laneChangeStarting, LaneChangeState.laneChangeFinishing]:
-      events.append(create_event('laneChange', [ET.WARNING]))
+      events.add('laneChange', [ET.WARNING])
 
 
 def isActive(state):
@@ -57,18 +55,6 @@ def isEnabled(state):
   """Check if openpilot is engaged"""
   return (isActive(state) or state == State.preEnabled)
 
-def events_to_bytes(events):
-  # optimization when comparing capnp structs: str() or tree traverse are much slower
-  ret = []
-  for e in events:
-    if isinstance(e, capnp.lib.capnp._DynamicStructReader):
-      e = e.as_builder()
-    if not e.is_root:
-      e = e.copy()
-    ret.append(e.to_bytes())
-  return ret
-
-
 def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter, params):
   """Receive data from sockets and create events for battery, temperature and disk space"""
 
@@ -78,8 +64,9 @@ def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter
 
   sm.update(0)
 
-  events = list(CS.events)
-  events += list(sm['dMonitoringState'].events)
+  events = Events()
+  events.add_from_msg(CS.events)
+  events.add_from_msg(sm['dMonitoringState'].events)
   add_lane_change_event(events, sm['pathPlan'])
   enabled = isEnabled(state)
   lane_change_bsm = sm['pathPlan'].laneChangeBSM
@@ -87,7 +74,7 @@ def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter
   # Check for CAN timeout
   if not can_strs:
     can_error_counter += 1
-    events.append(create_event('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+    events.add('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE])
 
   overtemp = sm['thermal'].thermalStatus >= ThermalStatus.red
   free_space = sm['thermal'].freeSpace < 0.07  # under 7% of space free no enable allowed
@@ -96,22 +83,22 @@ def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter
 
   #bsm alerts
   if lane_change_bsm == LaneChangeBSM.left:
-      events.append(create_event('preventLCA', [ET.WARNING]))
+      events.add('preventLCA', [ET.WARNING])
   if lane_change_bsm == LaneChangeBSM.right:
-      events.append(create_event('preventLCA', [ET.WARNING]))
+      events.add('preventLCA', [ET.WARNING])
   
   # Create events for battery, temperature and disk space
   if low_battery:
-    events.append(create_event('lowBattery', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+    events.add('lowBattery', [ET.NO_ENTRY, ET.SOFT_DISABLE])
   if overtemp:
-    events.append(create_event('overheat', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+    events.add('overheat', [ET.NO_ENTRY, ET.SOFT_DISABLE])
   if free_space:
-    events.append(create_event('outOfSpace', [ET.NO_ENTRY]))
+    events.add('outOfSpace', [ET.NO_ENTRY])
   if mem_low:
-    events.append(create_event('lowMemory', [ET.NO_ENTRY, ET.SOFT_DISABLE, ET.PERMANENT]))
+    events.add('lowMemory', [ET.NO_ENTRY, ET.SOFT_DISABLE, ET.PERMANENT])
 
   if CS.stockAeb:
-    events.append(create_event('stockAeb', []))
+    events.add('stockAeb', [])
 
   # Handle calibration
   cal_status = sm['liveCalibration'].calStatus
@@ -119,12 +106,12 @@ def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter
 
   if cal_status != Calibration.CALIBRATED:
     if cal_status == Calibration.UNCALIBRATED:
-      events.append(create_event('calibrationIncomplete', [ET.NO_ENTRY, ET.SOFT_DISABLE, ET.PERMANENT]))
+      events.add('calibrationIncomplete', [ET.NO_ENTRY, ET.SOFT_DISABLE, ET.PERMANENT])
     else:
-      events.append(create_event('calibrationInvalid', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      events.add('calibrationInvalid', [ET.NO_ENTRY, ET.SOFT_DISABLE])
 
   if CS.vEgo > 150 * CV.KPH_TO_MS:
-    events.append(create_event('speedTooHigh', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+    events.add('speedTooHigh', [ET.NO_ENTRY, ET.SOFT_DISABLE])
 
   # When the panda and controlsd do not agree on controls_allowed
   # we want to disengage openpilot. However the status from the panda goes through
@@ -137,7 +124,7 @@ def data_sample(CI, CC, sm, can_sock, state, mismatch_counter, can_error_counter
   if not controls_allowed and enabled:
     mismatch_counter += 1
   if mismatch_counter >= 200:
-    events.append(create_event('controlsMismatch', [ET.IMMEDIATE_DISABLE]))
+    events.add('controlsMismatch', [ET.IMMEDIATE_DISABLE])
 
   return CS, events, cal_perc, mismatch_counter, can_error_counter
 
@@ -160,13 +147,13 @@ def state_transition(frame, CS, CP, state, events, soft_disable_timer, v_cruise_
 
   # DISABLED
   if state == State.disabled:
-    if get_events(events, [ET.ENABLE]):
-      if get_events(events, [ET.NO_ENTRY]):
-        for e in get_events(events, [ET.NO_ENTRY]):
+    if events.any([ET.ENABLE]):
+      if events.any([ET.NO_ENTRY]):
+        for e in events.names([ET.NO_ENTRY]):
           AM.add(frame, str(e) + "NoEntry", enabled)
 
       else:
-        if get_events(events, [ET.PRE_ENABLE]):
+        if events.any([ET.PRE_ENABLE]):
           state = State.preEnabled
         else:
           state = State.enabled
@@ -175,38 +162,38 @@ def state_transition(frame, CS, CP, state, events, soft_disable_timer, v_cruise_
 
   # ENABLED
   elif state == State.enabled:
-    if get_events(events, [ET.USER_DISABLE]):
+    if events.any([ET.USER_DISABLE]):
       state = State.disabled
       AM.add(frame, "disable", enabled)
 
-    elif get_events(events, [ET.IMMEDIATE_DISABLE]):
+    elif events.any([ET.IMMEDIATE_DISABLE]):
       state = State.disabled
-      for e in get_events(events, [ET.IMMEDIATE_DISABLE]):
+      for e in events.names([ET.IMMEDIATE_DISABLE]):
         AM.add(frame, e, enabled)
 
-    elif get_events(events, [ET.SOFT_DISABLE]):
+    elif events.any([ET.SOFT_DISABLE]):
       state = State.softDisabling
       soft_disable_timer = 300   # 3s
-      for e in get_events(events, [ET.SOFT_DISABLE]):
+      for e in events.names([ET.SOFT_DISABLE]):
         AM.add(frame, e, enabled)
 
   # SOFT DISABLING
   elif state == State.softDisabling:
-    if get_events(events, [ET.USER_DISABLE]):
+    if events.any([ET.USER_DISABLE]):
       state = State.disabled
       AM.add(frame, "disable", enabled)
 
-    elif get_events(events, [ET.IMMEDIATE_DISABLE]):
+    elif events.any([ET.IMMEDIATE_DISABLE]):
       state = State.disabled
-      for e in get_events(events, [ET.IMMEDIATE_DISABLE]):
+      for e in events.names([ET.IMMEDIATE_DISABLE]):
         AM.add(frame, e, enabled)
 
-    elif not get_events(events, [ET.SOFT_DISABLE]):
+    elif not events.any([ET.SOFT_DISABLE]):
       # no more soft disabling condition, so go back to ENABLED
       state = State.enabled
 
-    elif get_events(events, [ET.SOFT_DISABLE]) and soft_disable_timer > 0:
-      for e in get_events(events, [ET.SOFT_DISABLE]):
+    elif events.any([ET.SOFT_DISABLE]) and soft_disable_timer > 0:
+      for e in events.names([ET.SOFT_DISABLE]):
         AM.add(frame, e, enabled)
 
     elif soft_disable_timer <= 0:
@@ -214,16 +201,16 @@ def state_transition(frame, CS, CP, state, events, soft_disable_timer, v_cruise_
 
   # PRE ENABLING
   elif state == State.preEnabled:
-    if get_events(events, [ET.USER_DISABLE]):
+    if events.any([ET.USER_DISABLE]):
       state = State.disabled
       AM.add(frame, "disable", enabled)
 
-    elif get_events(events, [ET.IMMEDIATE_DISABLE, ET.SOFT_DISABLE]):
+    elif events.any([ET.IMMEDIATE_DISABLE, ET.SOFT_DISABLE]):
       state = State.disabled
-      for e in get_events(events, [ET.IMMEDIATE_DISABLE, ET.SOFT_DISABLE]):
+      for e in events.names([ET.IMMEDIATE_DISABLE, ET.SOFT_DISABLE]):
         AM.add(frame, e, enabled)
 
-    elif not get_events(events, [ET.PRE_ENABLE]):
+    elif not events.any([ET.PRE_ENABLE]):
       state = State.enabled
 
   return state, soft_disable_timer, v_cruise_kph, v_cruise_kph_last
@@ -257,7 +244,7 @@ def state_control(frame, rcv_frame, plan, path_plan, CS, CP, state, events, v_cr
 
   elif state in [State.enabled, State.softDisabling]:
     # parse warnings from car specific interface
-    for e in get_events(events, [ET.WARNING]):
+    for e in events.names([ET.WARNING]):
       extra_text = ""
       if e == "belowSteerSpeed":
         if is_metric:
@@ -294,7 +281,7 @@ def state_control(frame, rcv_frame, plan, path_plan, CS, CP, state, events, v_cr
       AM.add(frame, "steerSaturated", enabled)
 
   # Parse permanent warnings to display constantly
-  for e in get_events(events, [ET.PERMANENT]):
+  for e in events.names([ET.PERMANENT]):
     extra_text_1, extra_text_2 = "", ""
     if e == "calibrationIncomplete":
       extra_text_1 = str(cal_perc) + "%"
@@ -352,7 +339,7 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
 
   if CC.hudControl.rightLaneDepart or CC.hudControl.leftLaneDepart:
     AM.add(sm.frame, 'ldwPermanent', False)
-    events.append(create_event('ldw', [ET.PERMANENT]))
+    events.add('ldw', [ET.PERMANENT])
 
   AM.process_alerts(sm.frame)
   CC.hudControl.visualAlert = AM.visual_alert
@@ -387,7 +374,7 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
     "curvature": VM.calc_curvature((CS.steeringAngle - sm['pathPlan'].angleOffset) * CV.DEG_TO_RAD, CS.vEgo),
     "steerOverride": CS.steeringPressed,
     "state": state,
-    "engageable": not bool(get_events(events, [ET.NO_ENTRY])),
+    "engageable": not events.any([ET.NO_ENTRY]),
     "longControlState": LoC.long_control_state,
     "vPid": float(LoC.v_pid),
     "vCruise": float(v_cruise_kph),
@@ -420,14 +407,15 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
   cs_send = messaging.new_message('carState')
   cs_send.valid = CS.canValid
   cs_send.carState = CS
-  cs_send.carState.events = events
+  events_msg = events.to_msg()
+  cs_send.carState.events = events_msg
   pm.send('carState', cs_send)
 
   # carEvents - logged every second or on change
-  events_bytes = events_to_bytes(events)
-  if (sm.frame % int(1. / DT_CTRL) == 0) or (events_bytes != events_prev):
+  events_key = events.key()
+  if (sm.frame % int(1. / DT_CTRL) == 0) or (events_key != events_prev):
     ce_send = messaging.new_message('carEvents', len(events))
-    ce_send.carEvents = events
+    ce_send.carEvents = events_msg
     pm.send('carEvents', ce_send)
 
   # carParams - logged every 50 seconds (> 1 per segment)
@@ -442,10 +430,10 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
   cc_send.carControl = CC
   pm.send('carControl', cc_send)
 
-  return CC, events_bytes
+  return CC, events_key
 
 
-def controlsd_thread(sm=None, pm=None, can_sock=None):
+def controlsd_steps(sm=None, pm=None, can_sock=None):
   gc.disable()
 
   # start the loop
@@ -471,7 +459,7 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
 
   if sm is None:
     sm = messaging.SubMaster(['thermal', 'health', 'liveCalibration', 'dMonitoringState', 'plan', 'pathPlan', \
-                              'model'])
+                              'model'], lazy=True)
 
   if can_sock is None:
     can_timeout = None if os.environ.get('NO_CAN_TIMEOUT', False) else 100
@@ -523,7 +511,7 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
   can_error_counter = 0
   last_blinker_frame = 0
   saturated_count = 0
-  events_prev = []
+  events_prev = ()
 
   sm['liveCalibration'].calStatus = Calibration.INVALID
   sm['pathPlan'].sensorValid = True
@@ -544,6 +532,7 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
   
   hyundai_lkas = read_only
   while True:
+    yield
     start_time = sec_since_boot()
     prof.checkpoint("Ratekeeper", ignore=True)
 
@@ -560,38 +549,38 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
 
     # Create alerts
     if not sm.alive['plan'] and sm.alive['pathPlan']:  # only plan not being received: radar not communicating
-      events.append(create_event('radarCommIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      events.add('radarCommIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE])
     elif not sm.all_alive_and_valid():
-      events.append(create_event('commIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      events.add('commIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE])
     if not sm['pathPlan'].mpcSolutionValid:
-      events.append(create_event('plannerError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+      events.add('plannerError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE])
     if not sm['pathPlan'].sensorValid and os.getenv("NOSENSOR") is None:
-      events.append(create_event('sensorDataInvalid', [ET.NO_ENTRY, ET.PERMANENT]))
+      events.add('sensorDataInvalid', [ET.NO_ENTRY, ET.PERMANENT])
     if not sm['pathPlan'].paramsValid:
-      events.append(create_event('vehicleModelInvalid', [ET.WARNING]))
+      events.add('vehicleModelInvalid', [ET.WARNING])
     if not sm['pathPlan'].posenetValid:
-      events.append(create_event('posenetInvalid', [ET.NO_ENTRY, ET.WARNING]))
+      events.add('posenetInvalid', [ET.NO_ENTRY, ET.WARNING])
     if not sm['plan'].radarValid:
-      events.append(create_event('radarFault', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      events.add('radarFault', [ET.NO_ENTRY, ET.SOFT_DISABLE])
     if sm['plan'].radarCanError:
-      events.append(create_event('radarCanError', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      events.add('radarCanError', [ET.NO_ENTRY, ET.SOFT_DISABLE])
     if not CS.canValid:
-      events.append(create_event('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+      events.add('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE])
     if not sounds_available:
-      events.append(create_event('soundsUnavailable', [ET.NO_ENTRY, ET.PERMANENT]))
+      events.add('soundsUnavailable', [ET.NO_ENTRY, ET.PERMANENT])
 #    if internet_needed:
-#      events.append(create_event('internetConnectivityNeeded', [ET.NO_ENTRY, ET.PERMANENT]))
+#      events.add('internetConnectivityNeeded', [ET.NO_ENTRY, ET.PERMANENT])
 #    if community_feature_disallowed:
-#      events.append(create_event('communityFeatureDisallowed', [ET.PERMANENT]))
+#      events.add('communityFeatureDisallowed', [ET.PERMANENT])
     if read_only and not passive:
-      events.append(create_event('carUnrecognized', [ET.PERMANENT]))
+      events.add('carUnrecognized', [ET.PERMANENT])
     if log.HealthData.FaultType.relayMalfunction in sm['health'].faults:
-      events.append(create_event('relayMalfunction', [ET.NO_ENTRY, ET.PERMANENT, ET.IMMEDIATE_DISABLE]))
+      events.add('relayMalfunction', [ET.NO_ENTRY, ET.PERMANENT, ET.IMMEDIATE_DISABLE])
 
 
     # Only allow engagement with brake pressed when stopped behind another stopped car
     if CS.brakePressed and sm['plan'].vTargetFuture >= STARTING_TARGET_SPEED and not CP.radarOffCan and CS.vEgo < 0.3:
-      events.append(create_event('noTarget', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+      events.add('noTarget', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE])
 
     if not hyundai_lkas:
       # update control state
@@ -620,6 +609,11 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
       hyundai_lkas = True
 
 
+def controlsd_thread(sm=None, pm=None, can_sock=None):
+  for _ in controlsd_steps(sm, pm, can_sock):
+    pass
+
+
 def main(sm=None, pm=None, logcan=None):
   controlsd_thread(sm, pm, logcan)
 
@@ -7,7 +7,7 @@ from selfdrive.controls.lib.drive_helpers import create_event, EventTypes as ET
 from selfdrive.controls.lib.driver_monitor import DriverStatus, MAX_TERMINAL_ALERTS, MAX_TERMINAL_DURATION
 from selfdrive.locationd.calibration_helpers import Calibration
 
-def dmonitoringd_thread(sm=None, pm=None):
+def dmonitoringd_steps(sm=None, pm=None):
   gc.disable()
 
   # start the loop
@@ -42,6 +42,7 @@ def dmonitoringd_thread(sm=None, pm=None):
 
   # 10Hz <- dmonitoringmodeld
   while True:
+    yield
     sm.update()
 
     # Handle calibration
@@ -96,6 +97,10 @@ def dmonitoringd_thread(sm=None, pm=None):
       }
       pm.send('dMonitoringState', dat)
 
+def dmonitoringd_thread(sm=None, pm=None):
+  for _ in dmonitoringd_steps(sm, pm):
+    pass
+
 def main(sm=None, pm=None):
   dmonitoringd_thread(sm, pm)
 
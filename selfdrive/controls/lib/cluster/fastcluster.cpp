@@ -11,6 +11,7 @@
 #include <vector>
 #include <algorithm>
 #include <cmath>
+#include <cstdint>
 
 
 extern "C" {
@@ -203,6 +204,12 @@ extern "C" {
   }
 
   void cluster_points_centroid(int n, int m, double* pts, double dist, int* idx) {
+    // the linkage needs at least two points
+    if (n <= 1) {
+      if (n == 1) idx[0] = 0;
+      return;
+    }
+
     double* pdist = new double[n * (n - 1) / 2];
     int* merge = new int[2 * (n - 1)];
     double* height = new double[n - 1];
@@ -215,4 +222,182 @@ extern "C" {
     delete[] merge;
     delete[] height;
   }
+
+  //
+  // Like cluster_points_centroid, but for points that persist across calls
+  // and keeps the clusters of the previous call where they can't have
+  // changed. Intermediate centroids lie in the bounding box of their points,
+  // so groups of clusters whose boxes are at least sqrt(dist) away from all
+  // other points never merge with them. Groups that only contain whole
+  // previous clusters, whose points moved together by up to sqrt(tol) since
+  // they were clustered, keep those clusters. The other groups are clustered
+  // again. The result only differs from cluster_points_centroid when a
+  // cluster distance is within 2 * sqrt(tol) of the cutoff.
+  //
+  // Input arguments:
+  //   n            = number of observables
+  //   m            = dimension of observable
+  //   ids          = n ids of the observables, ascending
+  //   pts          = n x m points
+  //   prev_n       = number of observables in the previous call
+  //   prev_ids     = ids of the previous call
+  //   prev_labels  = labels of the previous call
+  //   prev_anchors = anchors of the previous call
+  //   dist         = squared cutoff distance
+  //   tol          = squared tolerance
+  // Output arguments:
+  //   labels       = allocated integer array of size n for the cluster labels
+  //                  (0, ..., nclust-1), numbered in order of first
+  //                  appearance like cutree_k
+  //   anchors      = allocated n x m array for the points at the time they
+  //                  were clustered
+  // Return: the number of clusters
+  //
+  int cluster_points_centroid_incremental(int n, int m, const int64_t* ids, const double* pts,
+                                          int prev_n, const int64_t* prev_ids, const int* prev_labels, const double* prev_anchors,
+                                          double dist, double tol, int* labels, double* anchors) {
+    if (n == 0) return 0;
+
+    int nlabels = 0;
+    for (int j = 0; j < prev_n; j++) nlabels = std::max(nlabels, prev_labels[j] + 1);
+
+    // take over label and anchor of the points seen before
+    std::vector<int> lost(nlabels, 0);
+    for (int j = 0; j < prev_n; j++) lost[prev_labels[j]]++;
+    for (int i = 0, j = 0; i < n; i++) {
+      while (j < prev_n && prev_ids[j] < ids[i]) j++;
+      if (j < prev_n && prev_ids[j] == ids[i]) {
+        labels[i] = prev_labels[j];
+        lost[labels[i]]--;
+        std::copy(prev_anchors + j * m, prev_anchors + (j + 1) * m, anchors + i * m);
+      } else {
+        labels[i] = -1;
+      }
+    }
+
+    // clusters that lost points are redone
+    for (int i = 0; i < n; i++) {
+      if (labels[i] >= 0 && lost[labels[i]] > 0) labels[i] = -1;
+    }
+
+    // one group per previous cluster and per point to cluster again
+    std::vector<int> group_of_label(nlabels, -1);
+    std::vector<int> group(n);
+    int ngroups = 0;
+    for (int i = 0; i < n; i++) {
+      if (labels[i] < 0) {
+        group[i] = ngroups++;
+      } else {
+        if (group_of_label[labels[i]] < 0) group_of_label[labels[i]] = ngroups++;
+        group[i] = group_of_label[labels[i]];
+      }
+    }
+
+    // join groups whose boxes are closer than the cutoff until all are apart
+    std::vector<int> parent(ngroups);
+    for (int g = 0; g < ngroups; g++) parent[g] = g;
+    auto root = [&](int g) {
+      while (parent[g] != g) g = parent[g] = parent[parent[g]];
+      return g;
+    };
+
+    std::vector<double> lo(ngroups * m), hi(ngroups * m);
+    bool joined = true;
+    while (joined) {
+      joined = false;
+      std::fill(lo.begin(), lo.end(), INFINITY);
+      std::fill(hi.begin(), hi.end(), -INFINITY);
+      for (int i = 0; i < n; i++) {
+        int r = root(group[i]);
+        for (int k = 0; k < m; k++) {
+          lo[r * m + k] = std::min(lo[r * m + k], pts[i * m + k]);
+          hi[r * m + k] = std::max(hi[r * m + k], pts[i * m + k]);
+        }
+      }
+
+      for (int g = 0; g < ngroups; g++) {
+        if (parent[g] != g) continue;
+        for (int h = g + 1; h < ngroups; h++) {
+          if (parent[h] != h) continue;
+          double d = 0;
+          for (int k = 0; k < m; k++) {
+            double gap = std::max(lo[g * m + k] - hi[h * m + k], lo[h * m + k] - hi[g * m + k]);
+            if (gap > 0) d += gap * gap;
+          }
+          if (d < dist) {
+            // boxes stay as they are until the next pass
+            parent[h] = g;
+            joined = true;
+          }
+        }
+      }
+    }
+
+    // a group is clustered again if it has new points or didn't move rigidly
+    std::vector<int> count(ngroups, 0);
+    std::vector<bool> redo(ngroups, false);
+    std::vector<double> mean_move(ngroups * m, 0.);
+    for (int i = 0; i < n; i++) {
+      int r = root(group[i]);
+      count[r]++;
+      if (labels[i] < 0) {
+        redo[r] = true;
+      } else {
+        for (int k = 0; k < m; k++) mean_move[r * m + k] += pts[i * m + k] - anchors[i * m + k];
+      }
+    }
+    for (int g = 0; g < ngroups; g++) {
+      for (int k = 0; k < m; k++) mean_move[g * m + k] /= std::max(count[g], 1);
+    }
+    for (int i = 0; i < n; i++) {
+      int r = root(group[i]);
+      if (redo[r]) continue;
+      double d = 0;
+      for (int k = 0; k < m; k++) {
+        double e = pts[i * m + k] - anchors[i * m + k] - mean_move[r * m + k];
+        d += e * e;
+      }
+      redo[r] = redo[r] || d > tol;
+    }
+
+    // cluster the groups to redo on their own, past the previous labels so
+    // they stay apart from the kept ones
+    std::vector<int> members;
+    std::vector<double> sub_pts;
+    std::vector<int> sub_idx;
+    int next_label = nlabels;
+    for (int g = 0; g < ngroups; g++) {
+      if (parent[g] != g || !redo[g]) continue;
+
+      members.clear();
+      for (int i = 0; i < n; i++) {
+        if (root(group[i]) == g) members.push_back(i);
+      }
+      int k = members.size();
+      sub_pts.resize(k * m);
+      sub_idx.resize(k);
+      for (int j = 0; j < k; j++) {
+        for (int l = 0; l < m; l++) {
+          sub_pts[j * m + l] = anchors[members[j] * m + l] = pts[members[j] * m + l];
+        }
+      }
+
+      cluster_points_centroid(k, m, sub_pts.data(), dist, sub_idx.data());
+      int nclust = 0;
+      for (int j = 0; j < k; j++) {
+        labels[members[j]] = next_label + sub_idx[j];
+        nclust = std::max(nclust, sub_idx[j] + 1);
+      }
+      next_label += nclust;
+    }
+
+    // number in order of first appearance
+    std::vector<int> z(next_label, -1);
+    int nclust = 0;
+    for (int i = 0; i < n; i++) {
+      if (z[labels[i]] < 0) z[labels[i]] = nclust++;
+      labels[i] = z[labels[i]];
+    }
+    return nclust;
+  }
 }
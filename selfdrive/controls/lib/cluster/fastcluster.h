@@ -10,6 +10,8 @@
 #ifndef fastclustercpp_H
 #define fastclustercpp_H
 
+#include <stdint.h>
+
 //
 // Assigns cluster labels (0, ..., nclust-1) to the n points such
 // that the cluster result is split into nclust clusters.
@@ -72,6 +74,9 @@ enum hclust_fast_methods {
 
 void hclust_pdist(int n, int m, double* pts, double* out);
 void cluster_points_centroid(int n, int m, double* pts, double dist, int* idx);
+int cluster_points_centroid_incremental(int n, int m, const int64_t* ids, const double* pts,
+                                        int prev_n, const int64_t* prev_ids, const int* prev_labels, const double* prev_anchors,
+                                        double dist, double tol, int* labels, double* anchors);
 
 
 #endif
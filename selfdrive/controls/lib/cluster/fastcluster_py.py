@@ -13,6 +13,9 @@ int hclust_fast(int n, double* distmat, int method, int* merge, double* height);
 void cutree_cdist(int n, const int* merge, double* height, double cdist, int* labels);
 void hclust_pdist(int n, int m, double* pts, double* out);
 void cluster_points_centroid(int n, int m, double* pts, double dist, int* idx);
+int cluster_points_centroid_incremental(int n, int m, const int64_t* ids, const double* pts,
+                                        int prev_n, const int64_t* prev_ids, const int* prev_labels, const double* prev_anchors,
+                                        double dist, double tol, int* labels, double* anchors);
 """)
 
 hclust = ffi.dlopen(cluster_fn)
@@ -26,3 +29,38 @@ def cluster_points_centroid(pts, dist):
   labels_ptr = ffi.new("int[]", n)
   hclust.cluster_points_centroid(n, m, pts_ptr, dist**2, labels_ptr)
   return list(labels_ptr)
+
+
+class IncrementalClustering():
+  """cluster_points_centroid for points that persist across calls, keyed by id. Only the
+  parts with new points, lost points or points that moved relative to each other by more
+  than tol since they were clustered are clustered again, the rest keep their clusters.
+  Gives the same clusters as cluster_points_centroid unless a cluster distance is within
+  2 * tol of dist."""
+  def __init__(self, dist, tol=0.05):
+    self.dist = dist
+    self.tol = tol
+    self.ids = np.zeros(0, dtype=np.int64)
+    self.labels = np.zeros(0, dtype=np.int32)
+    self.anchors = np.zeros((0, 0))
+    self._bufs = self._buffers(self.ids, self.labels, self.anchors)
+
+  @staticmethod
+  def _buffers(ids, labels, anchors):
+    return ffi.from_buffer("int64_t[]", ids), ffi.from_buffer("int[]", labels), ffi.from_buffer("double[]", anchors)
+
+  def update(self, ids, pts):
+    """ids ascending, returns a cluster label per point."""
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    pts = np.ascontiguousarray(pts, dtype=np.float64)
+    n, m = pts.shape
+
+    labels = np.empty(n, dtype=np.int32)
+    anchors = np.empty((n, m))
+    bufs = self._buffers(ids, labels, anchors)
+    prev_n = len(self.ids) if self.anchors.shape[1] == m else 0
+    hclust.cluster_points_centroid_incremental(n, m, bufs[0], ffi.from_buffer("double[]", pts), prev_n, *self._bufs,
+                                               self.dist**2, self.tol**2, bufs[1], bufs[2])
+    self.ids, self.labels, self.anchors = ids, labels, anchors
+    self._bufs = bufs
+    return labels
@@ -1,10 +1,10 @@
 from cereal import car
 from common.numpy_fast import clip, interp
 from selfdrive.config import Conversions as CV
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 
 # kph
-kegman = kegman_conf()
+kegman = kegman_store()
 V_CRUISE_MAX = 144
 V_CRUISE_MIN = 8
 V_CRUISE_DELTA = int(kegman.conf['CruiseDelta'])
@@ -55,6 +55,72 @@ def get_events(events, types):
   return out
 
 
+EVENT_TYPES = [v for k, v in vars(EventTypes).items() if not k.startswith('_')]
+EVENT_TYPE_BITS = {t: 1 << i for i, t in enumerate(EVENT_TYPES)}
+_types_masks = {}
+_event_msgs = {}
+
+
+def types_mask(types):
+  key = tuple(types)
+  mask = _types_masks.get(key)
+  if mask is None:
+    mask = 0
+    for t in types:
+      mask |= EVENT_TYPE_BITS[t]
+    _types_masks[key] = mask
+  return mask
+
+
+class Events():
+  """Events of a single cycle, kept as (name, type bitmask) pairs. Queries by type are a single
+  mask test, capnp CarEvents are only built when publishing."""
+  def __init__(self):
+    self.events = []
+    self.mask = 0
+
+  def __len__(self):
+    return len(self.events)
+
+  def add(self, name, types):
+    mask = types_mask(types)
+    self.events.append((name, mask))
+    self.mask |= mask
+
+  def add_from_msg(self, events):
+    for e in events:
+      mask = 0
+      for t, bit in EVENT_TYPE_BITS.items():
+        if getattr(e, t):
+          mask |= bit
+      self.events.append((str(e.name), mask))
+      self.mask |= mask
+
+  def any(self, types):
+    return bool(self.mask & types_mask(types))
+
+  def names(self, types):
+    """Same result as get_events on the capnp events."""
+    mask = types_mask(types)
+    if not self.mask & mask:
+      return []
+    bits = [EVENT_TYPE_BITS[t] for t in types]
+    return [name for name, m in self.events if m & mask for bit in bits if m & bit]
+
+  def key(self):
+    return tuple(self.events)
+
+  def to_msg(self):
+    ret = []
+    for name, mask in self.events:
+      e = _event_msgs.get((name, mask))
+      if e is None:
+        e = create_event(name, [t for t in EVENT_TYPES if mask & EVENT_TYPE_BITS[t]])
+        _event_msgs[(name, mask)] = e
+      ret.append(e)
+    return ret
+
+
 def rate_limit(new_value, last_value, dw_step, up_step):
   return clip(new_value, last_value + dw_step, last_value + up_step)
 
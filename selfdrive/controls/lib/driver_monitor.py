@@ -4,8 +4,8 @@ from common.realtime import DT_DMON
 from selfdrive.controls.lib.drive_helpers import create_event, EventTypes as ET
 from common.filter_simple import FirstOrderFilter
 from common.stat_live import RunningStatFilter
-from selfdrive.kegman_conf import kegman_conf
-kegman = kegman_conf()
+from selfdrive.kegman_conf import kegman_store
+kegman = kegman_store()
 
 
 _AWARENESS_TIME = min(int(kegman.conf['wheelTouchSeconds']), 600)    # x minutes limit without user touching steering wheels make the car enter a terminal status
@@ -1,9 +1,9 @@
 from common.numpy_fast import interp
 import numpy as np
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 from cereal import log
 
-kegman = kegman_conf()
+kegman = kegman_store()
 CAMERA_OFFSET = float(kegman.conf['cameraOffset'])  # m from center car to camera
 
 #zorrobyte
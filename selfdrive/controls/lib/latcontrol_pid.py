@@ -2,7 +2,7 @@ from selfdrive.controls.lib.pid import PIController
 from selfdrive.controls.lib.drive_helpers import get_steer_max
 from cereal import car
 from cereal import log
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_conf, kegman_store
 
 import common.MoveAvg as  moveavg1
 from selfdrive.config import Conversions as CV
@@ -15,7 +15,8 @@ class LatControlPID():
                             (CP.lateralTuning.pid.kiBP, CP.lateralTuning.pid.kiV),
                             k_f=CP.lateralTuning.pid.kf, pos_limit=1.0, sat_limit=CP.steerLimitTimer)
     self.angle_steers_des = 0.
-    self.mpc_frame = 0
+    self.kegman_version = None
+    self.gains = None
 
     self.movAvg = moveavg1.MoveAvg()
 
@@ -23,20 +24,20 @@ class LatControlPID():
     self.pid.reset()
     
   def live_tune(self, CP):
-    self.mpc_frame += 1
-    if self.mpc_frame % 300 == 0:
+    kegman = kegman_store()
+    if kegman.poll() != self.kegman_version:
       # live tuning through /data/openpilot/tune.py overrides interface.py settings
-      self.kegman = kegman_conf()
-      if self.kegman.conf['tuneGernby'] == "1":
-        self.steerKpV = [float(self.kegman.conf['Kp'])]
-        self.steerKiV = [float(self.kegman.conf['Ki'])]
-        self.steerKf = float(self.kegman.conf['Kf'])
-        self.pid = PIController((CP.lateralTuning.pid.kpBP, self.steerKpV),
-                            (CP.lateralTuning.pid.kiBP, self.steerKiV),
-                            k_f=self.steerKf, pos_limit=1.0)
-        self.deadzone = float(self.kegman.conf['deadzone'])
-        
-      self.mpc_frame = 0    
+      self.kegman_version = kegman.version
+      if kegman.conf['tuneGernby'] == "1":
+        gains = ([kegman.floats['Kp']], [kegman.floats['Ki']], kegman.floats['Kf'])
+        # only a change of gains resets the controller
+        if gains != self.gains:
+          self.gains = gains
+          self.steerKpV, self.steerKiV, self.steerKf = gains
+          self.pid = PIController((CP.lateralTuning.pid.kpBP, self.steerKpV),
+                              (CP.lateralTuning.pid.kiBP, self.steerKiV),
+                              k_f=self.steerKf, pos_limit=1.0)
+        self.deadzone = kegman.floats['deadzone']
 
   def update(self, active, v_ego, angle_steers, angle_steers_rate, eps_torque, steer_override, rate_limited, CP, path_plan):
 
@@ -8,10 +8,10 @@ from common.realtime import sec_since_boot
 from selfdrive.controls.lib.radar_helpers import _LEAD_ACCEL_TAU
 from selfdrive.controls.lib.longitudinal_mpc import libmpc_py
 from selfdrive.controls.lib.drive_helpers import MPC_COST_LONG
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 
 # One, two and three bar distances (in s)
-kegman = kegman_conf()
+kegman = kegman_store()
 if "ONE_BAR_DISTANCE" in kegman.conf:
     ONE_BAR_DISTANCE = float(kegman.conf['ONE_BAR_DISTANCE'])
 else:
@@ -86,18 +86,21 @@ class LongitudinalMpc():
     self.v_rel = 10
     self.last_cloudlog_t = 0.0
     
-    self.bp_counter = 0  
-    
-    kegman = kegman_conf()
-    self.oneBarBP = [float(kegman.conf['1barBP0']), float(kegman.conf['1barBP1'])]
-    self.twoBarBP = [float(kegman.conf['2barBP0']), float(kegman.conf['2barBP1'])]
-    self.threeBarBP = [float(kegman.conf['3barBP0']), float(kegman.conf['3barBP1'])]
-    self.oneBarProfile = [ONE_BAR_DISTANCE, float(kegman.conf['1barMax'])]
-    self.twoBarProfile = [TWO_BAR_DISTANCE, float(kegman.conf['2barMax'])]
-    self.threeBarProfile = [THREE_BAR_DISTANCE, float(kegman.conf['3barMax'])]
-    self.oneBarHwy = [ONE_BAR_DISTANCE, ONE_BAR_DISTANCE+float(kegman.conf['1barHwy'])]
-    self.twoBarHwy = [TWO_BAR_DISTANCE, TWO_BAR_DISTANCE+float(kegman.conf['2barHwy'])]
-    self.threeBarHwy = [THREE_BAR_DISTANCE, THREE_BAR_DISTANCE+float(kegman.conf['3barHwy'])]
+    self.kegman_version = None
+    self.update_profiles()
+
+  def update_profiles(self):
+    kegman = kegman_store()
+    self.kegman_version = kegman.version
+    self.oneBarBP = [kegman.floats['1barBP0'], kegman.floats['1barBP1']]
+    self.twoBarBP = [kegman.floats['2barBP0'], kegman.floats['2barBP1']]
+    self.threeBarBP = [kegman.floats['3barBP0'], kegman.floats['3barBP1']]
+    self.oneBarProfile = [ONE_BAR_DISTANCE, kegman.floats['1barMax']]
+    self.twoBarProfile = [TWO_BAR_DISTANCE, kegman.floats['2barMax']]
+    self.threeBarProfile = [THREE_BAR_DISTANCE, kegman.floats['3barMax']]
+    self.oneBarHwy = [ONE_BAR_DISTANCE, ONE_BAR_DISTANCE+kegman.floats['1barHwy']]
+    self.twoBarHwy = [TWO_BAR_DISTANCE, TWO_BAR_DISTANCE+kegman.floats['2barHwy']]
+    self.threeBarHwy = [THREE_BAR_DISTANCE, THREE_BAR_DISTANCE+kegman.floats['3barHwy']]
 
   def send_mpc_solution(self, pm, qp_iterations, calculation_time):
     qp_iterations = max(0, qp_iterations)
@@ -175,19 +178,8 @@ class LongitudinalMpc():
 
       
     # Live Tuning of breakpoints for braking profile change
-    self.bp_counter += 1
-    if self.bp_counter % 500 == 0:
-      kegman = kegman_conf()
-      self.oneBarBP = [float(kegman.conf['1barBP0']), float(kegman.conf['1barBP1'])]
-      self.twoBarBP = [float(kegman.conf['2barBP0']), float(kegman.conf['2barBP1'])]
-      self.threeBarBP = [float(kegman.conf['3barBP0']), float(kegman.conf['3barBP1'])]
-      self.oneBarProfile = [ONE_BAR_DISTANCE, float(kegman.conf['1barMax'])]
-      self.twoBarProfile = [TWO_BAR_DISTANCE, float(kegman.conf['2barMax'])]
-      self.threeBarProfile = [THREE_BAR_DISTANCE, float(kegman.conf['3barMax'])]
-      self.oneBarHwy = [ONE_BAR_DISTANCE, ONE_BAR_DISTANCE+float(kegman.conf['1barHwy'])]
-      self.twoBarHwy = [TWO_BAR_DISTANCE, TWO_BAR_DISTANCE+float(kegman.conf['2barHwy'])]
-      self.threeBarHwy = [THREE_BAR_DISTANCE, THREE_BAR_DISTANCE+float(kegman.conf['3barHwy'])]
-      self.bp_counter = 0  
+    if kegman_store().poll() != self.kegman_version:
+      self.update_profiles()
       
       
     # Calculate mpc
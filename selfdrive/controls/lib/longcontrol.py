@@ -1,9 +1,9 @@
 from cereal import log
 from common.numpy_fast import clip, interp
 from selfdrive.controls.lib.pid import PIController
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 
-kegman = kegman_conf()
+kegman = kegman_store()
 LongCtrlState = log.ControlsState.LongControlState
 
 STOPPING_EGO_SPEED = 0.5
@@ -1,20 +1,19 @@
 import os
-import platform
-import subprocess
 
 from cffi import FFI
-from common.ffi_wrapper import suffix
+from common.ffi_wrapper import suffix, make_once
 
 mpc_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)))
 
-if platform.machine() == "x86_64":
-  try:
-    FFI().dlopen(os.path.join(mpc_dir, "libmpc1.so"))
-  except OSError:
-    # libmpc1.so is likely built for aarch64. cleaning...
-    subprocess.check_call(["make", "clean"], cwd=mpc_dir)
-
-subprocess.check_call(["make", "-j4"], cwd=mpc_dir)
+# everything the Makefile builds libmpc from
+SOURCES = [
+  "Makefile",
+  "longitudinal_mpc.c",
+  "lib_mpc_export/*.[ch]",
+  "lib_mpc_export/*.[ch]pp",
+  "../../../../phonelibs/qpoases/**",
+]
+TARGETS = ["libmpc1.so", "libmpc2.so"]
 
 def _get_libmpc(mpc_id):
     libmpc_fn = os.path.join(mpc_dir, "libmpc%d%s" % (mpc_id, suffix()))
@@ -45,7 +44,12 @@ def _get_libmpc(mpc_id):
 
     return (ffi, ffi.dlopen(libmpc_fn))
 
-mpcs = [_get_libmpc(1), _get_libmpc(2)]
+mpcs = {}
 
 def get_libmpc(mpc_id):
-    return mpcs[mpc_id - 1]
+    if mpc_id not in mpcs:
+        # build once, skipped when the sources didn't change since the last build
+        if not mpcs:
+            make_once(mpc_dir, SOURCES, TARGETS)
+        mpcs[mpc_id] = _get_libmpc(mpc_id)
+    return mpcs[mpc_id]
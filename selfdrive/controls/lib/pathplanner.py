@@ -5,7 +5,7 @@ from selfdrive.swaglog import cloudlog
 from selfdrive.controls.lib.lateral_mpc import libmpc_py
 from selfdrive.controls.lib.drive_helpers import MPC_COST_LAT
 from selfdrive.controls.lib.lane_planner import LanePlanner
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_conf, kegman_store
 from selfdrive.config import Conversions as CV
 from common.params import Params
 from common.numpy_fast import interp
@@ -57,7 +57,7 @@ class PathPlanner():
     self.lane_change_enabled = Params().get('LaneChangeEnabled') == b'1'
     self.path_offset_i = 0.0
 
-    self.mpc_frame = 0
+    self.kegman_version = None
     self.sR_delay_counter = 0
     self.steerRatio_new = 0.0
     self.sR_time = 1
@@ -118,22 +118,20 @@ class PathPlanner():
     VM.update_params(sm['liveParameters'].stiffnessFactor, sm['liveParameters'].steerRatio)
     curvature_factor = VM.curvature_factor(v_ego)
 
-    # Get steerRatio and steerRateCost from kegman.json every x seconds
-    self.mpc_frame += 1
-    if self.mpc_frame % 500 == 0:
+    # Get steerRatio and steerRateCost from kegman.json when it changed
+    kegman = kegman_store()
+    if kegman.poll() != self.kegman_version:
       # live tuning through /data/openpilot/tune.py overrides interface.py settings
-      kegman = kegman_conf()
+      self.kegman_version = kegman.version
       if kegman.conf['tuneGernby'] == "1":
-        self.steerRateCost = float(kegman.conf['steerRateCost'])
+        self.steerRateCost = kegman.floats['steerRateCost']
         if self.steerRateCost != self.steerRateCost_prev:
           self.setup_mpc()
           self.steerRateCost_prev = self.steerRateCost
 
-        self.sR = [float(kegman.conf['steerRatio']), (float(kegman.conf['steerRatio']) + float(kegman.conf['sR_boost']))]
-        self.sRBP = [float(kegman.conf['sR_BP0']), float(kegman.conf['sR_BP1'])]
-        self.sR_time = int(float(kegman.conf['sR_time']) * 100.)
-
-      self.mpc_frame = 0
+        self.sR = [kegman.floats['steerRatio'], kegman.floats['steerRatio'] + kegman.floats['sR_boost']]
+        self.sRBP = [kegman.floats['sR_BP0'], kegman.floats['sR_BP1']]
+        self.sR_time = int(kegman.floats['sR_time'] * 100.)
 
     if v_ego > 11.111:
       # boost steerRatio by boost amount if desired steer angle is high
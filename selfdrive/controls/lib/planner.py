@@ -13,7 +13,7 @@ from selfdrive.controls.lib.speed_smoother import speed_smoother
 from selfdrive.controls.lib.longcontrol import LongCtrlState, MIN_CAN_SPEED
 from selfdrive.controls.lib.fcw import FCWChecker
 from selfdrive.controls.lib.long_mpc import LongitudinalMpc
-from selfdrive.kegman_conf import kegman_conf
+from selfdrive.kegman_conf import kegman_store
 
 
 MAX_SPEED = 255.0
@@ -87,8 +87,7 @@ class Planner():
     self.path_x = np.arange(192)
 
     self.params = Params()
-    self.kegman = kegman_conf()
-    self.mpc_frame = 0
+    self.kegman = kegman_store()
     self.first_loop = True
 
   def choose_solution(self, v_cruise_setpoint, enabled):
@@ -134,12 +133,7 @@ class Planner():
     enabled = (long_control_state == LongCtrlState.pid) or (long_control_state == LongCtrlState.stopping)
     following = lead_1.status and lead_1.dRel < 45.0 and lead_1.vLeadK > v_ego and lead_1.aLeadK > 0.0
 
-    if self.mpc_frame % 1000 == 0:
-      self.kegman = kegman_conf()
-      self.mpc_frame = 0
-      
-    self.mpc_frame += 1
-    
+    self.kegman.poll()
     if len(sm['model'].path.poly) and int(self.kegman.conf['slowOnCurves']):
       path = list(sm['model'].path.poly)
 
@@ -1,4 +1,5 @@
-from common.kalman.simple_kalman import KF1D
+import numpy as np
+
 from selfdrive.config import RADAR_TO_CAMERA
 
 
@@ -6,154 +7,141 @@ from selfdrive.config import RADAR_TO_CAMERA
 # TODO is this a good default?
 _LEAD_ACCEL_TAU = 1.5
 
-# radar tracks
-SPEED, ACCEL = 0, 1   # Kalman filter states enum
-
 # stationary qualification parameters
 v_ego_stationary = 4.   # no stationary object flag below this speed
 
 
-class Track():
-  def __init__(self, v_lead, kalman_params):
-    self.cnt = 0
-    self.aLeadTau = _LEAD_ACCEL_TAU
-    self.K_A = kalman_params.A
-    self.K_C = kalman_params.C
-    self.K_K = kalman_params.K
-    self.kf = KF1D([[v_lead], [0.0]], self.K_A, self.K_C, self.K_K)
-
-  def update(self, d_rel, y_rel, v_rel, v_lead, measured):
-    # relative values, copy
-    self.dRel = d_rel   # LONG_DIST
-    self.yRel = y_rel   # -LAT_DIST
-    self.vRel = v_rel   # REL_SPEED
-    self.vLead = v_lead
-    self.measured = measured   # measured or estimate
-
-    # computed velocity and accelerations
-    if self.cnt > 0:
-      self.kf.update(self.vLead)
-
-    self.vLeadK = float(self.kf.x[SPEED][0])
-    self.aLeadK = float(self.kf.x[ACCEL][0])
+class Tracks():
+  """All radar tracks as arrays, one entry per track sorted by trackId. The constant gain
+  Kalman filters of all tracks are stepped at once."""
+  def __init__(self, kalman_params):
+    A, C, K = kalman_params.A, kalman_params.C, kalman_params.K
+    self.A_K = [A[0][0] - K[0][0] * C[0], A[0][1] - K[0][0] * C[1],
+                A[1][0] - K[1][0] * C[0], A[1][1] - K[1][0] * C[1]]
+    self.K = [K[0][0], K[1][0]]
+
+    self.ids = np.zeros(0, dtype=np.int64)
+    self.dRel = np.zeros(0)      # LONG_DIST
+    self.yRel = np.zeros(0)      # -LAT_DIST
+    self.vRel = np.zeros(0)      # REL_SPEED
+    self.vLead = np.zeros(0)
+    self.measured = np.zeros(0, dtype=bool)   # measured or estimate
+    # Kalman filter states
+    self.vLeadK = np.zeros(0)
+    self.aLeadK = np.zeros(0)
+    self.aLeadTau = np.zeros(0)
+    self.cnt = np.zeros(0, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def update(self, ids, d_rel, y_rel, v_rel, v_lead, measured):
+    """Replaces the tracks with the given points, ids must be unique. Tracks seen before
+    keep their filter state, the others start a new one."""
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    v_lead = v_lead[order]
+
+    # look up the previous entry of every track
+    prev = np.searchsorted(self.ids, ids)
+    seen = prev < len(self.ids)
+    seen[seen] = self.ids[prev[seen]] == ids[seen]
+    prev = prev[seen]
+
+    # new tracks start at the measured speed with no acceleration
+    x0, x1 = v_lead.copy(), np.zeros(len(ids))
+    tau, cnt = np.full(len(ids), _LEAD_ACCEL_TAU), np.zeros(len(ids), dtype=np.int64)
+    x0[seen], x1[seen] = self.vLeadK[prev], self.aLeadK[prev]
+    tau[seen], cnt[seen] = self.aLeadTau[prev], self.cnt[prev]
+
+    # computed velocity and accelerations, only tracks seen before
+    A_K, K = self.A_K, self.K
+    self.vLeadK = np.where(seen, A_K[0] * x0 + A_K[1] * x1 + K[0] * v_lead, x0)
+    self.aLeadK = np.where(seen, A_K[2] * x0 + A_K[3] * x1 + K[1] * v_lead, x1)
 
     # Learn if constant acceleration
-    if abs(self.aLeadK) < 0.5:
-      self.aLeadTau = _LEAD_ACCEL_TAU
-    else:
-      self.aLeadTau *= 0.9
+    self.aLeadTau = np.where(np.abs(self.aLeadK) < 0.5, _LEAD_ACCEL_TAU, tau * 0.9)
+    self.cnt = cnt + 1
 
-    self.cnt += 1
+    self.ids = ids
+    self.dRel = d_rel[order]
+    self.yRel = y_rel[order]
+    self.vRel = v_rel[order]
+    self.vLead = v_lead
+    self.measured = measured[order]
 
-  def get_key_for_cluster(self):
+  def get_keys_for_cluster(self):
     # Weigh y higher since radar is inaccurate in this dimension
-    return [self.dRel, self.yRel*2, self.vRel]
-
-  def reset_a_lead(self, aLeadK, aLeadTau):
-    self.kf = KF1D([[self.vLead], [aLeadK]], self.K_A, self.K_C, self.K_K)
-    self.aLeadK = aLeadK
-    self.aLeadTau = aLeadTau
-
-def mean(l):
-  return sum(l) / len(l)
-
-
-class Cluster():
-  def __init__(self):
-    self.tracks = set()
-
-  def add(self, t):
-    # add the first track
-    self.tracks.add(t)
-
-  # TODO: make generic
-  @property
-  def dRel(self):
-    return mean([t.dRel for t in self.tracks])
-
-  @property
-  def yRel(self):
-    return mean([t.yRel for t in self.tracks])
-
-  @property
-  def vRel(self):
-    return mean([t.vRel for t in self.tracks])
-
-  @property
-  def aRel(self):
-    return mean([t.aRel for t in self.tracks])
-
-  @property
-  def vLead(self):
-    return mean([t.vLead for t in self.tracks])
-
-  @property
-  def dPath(self):
-    return mean([t.dPath for t in self.tracks])
-
-  @property
-  def vLat(self):
-    return mean([t.vLat for t in self.tracks])
-
-  @property
-  def vLeadK(self):
-    return mean([t.vLeadK for t in self.tracks])
-
-  @property
-  def aLeadK(self):
-    if all(t.cnt <= 1 for t in self.tracks):
-      return 0.
-    else:
-      return mean([t.aLeadK for t in self.tracks if t.cnt > 1])
-
-  @property
-  def aLeadTau(self):
-    if all(t.cnt <= 1 for t in self.tracks):
-      return _LEAD_ACCEL_TAU
-    else:
-      return mean([t.aLeadTau for t in self.tracks if t.cnt > 1])
-
-  @property
-  def measured(self):
-    return any(t.measured for t in self.tracks)
-
-  def get_RadarState(self, model_prob=0.0):
+    return np.column_stack((self.dRel, self.yRel * 2, self.vRel))
+
+  def reset_a_lead(self, mask, aLeadK, aLeadTau):
+    self.vLeadK[mask] = self.vLead[mask]
+    self.aLeadK[mask] = aLeadK
+    self.aLeadTau[mask] = aLeadTau
+
+
+class Clusters():
+  """Means of the tracks in every cluster, as arrays indexed by cluster."""
+  def __init__(self, tracks, labels):
+    n = int(labels.max()) + 1 if len(labels) else 0
+    cnt = np.bincount(labels, minlength=n)
+
+    def mean(values):
+      return np.bincount(labels, values, n) / cnt
+
+    self.dRel = mean(tracks.dRel)
+    self.yRel = mean(tracks.yRel)
+    self.vRel = mean(tracks.vRel)
+    self.vLead = mean(tracks.vLead)
+    self.vLeadK = mean(tracks.vLeadK)
+    self.measured = np.bincount(labels, tracks.measured, n) > 0
+
+    # acceleration only from tracks with a filter that ran
+    old = tracks.cnt > 1
+    old_cnt = np.bincount(labels, old, n)
+    has_old = old_cnt > 0
+    old_cnt[~has_old] = 1
+    self.aLeadK = np.where(has_old, np.bincount(labels, np.where(old, tracks.aLeadK, 0.), n) / old_cnt, 0.)
+    self.aLeadTau = np.where(has_old, np.bincount(labels, np.where(old, tracks.aLeadTau, 0.), n) / old_cnt, _LEAD_ACCEL_TAU)
+
+  def __len__(self):
+    return len(self.dRel)
+
+  def get_RadarState(self, i, model_prob=0.0):
     return {
-      "dRel": float(self.dRel),
-      "yRel": float(self.yRel),
-      "vRel": float(self.vRel),
-      "vLead": float(self.vLead),
-      "vLeadK": float(self.vLeadK),
-      "aLeadK": float(self.aLeadK),
+      "dRel": float(self.dRel[i]),
+      "yRel": float(self.yRel[i]),
+      "vRel": float(self.vRel[i]),
+      "vLead": float(self.vLead[i]),
+      "vLeadK": float(self.vLeadK[i]),
+      "aLeadK": float(self.aLeadK[i]),
       "status": True,
-      "fcw": self.is_potential_fcw(model_prob),
+      "fcw": is_potential_fcw(model_prob),
       "modelProb": model_prob,
       "radar": True,
-      "aLeadTau": float(self.aLeadTau)
+      "aLeadTau": float(self.aLeadTau[i])
     }
 
-  def get_RadarState_from_vision(self, lead_msg, v_ego):
-    return {
-      "dRel": float(lead_msg.dist - RADAR_TO_CAMERA),
-      "yRel": float(lead_msg.relY),
-      "vRel": float(lead_msg.relVel),
-      "vLead": float(v_ego + lead_msg.relVel),
-      "vLeadK": float(v_ego + lead_msg.relVel),
-      "aLeadK": float(0),
-      "aLeadTau": _LEAD_ACCEL_TAU,
-      "fcw": False,
-      "modelProb": float(lead_msg.prob),
-      "radar": False,
-      "status": True
-    }
-
-  def __str__(self):
-    ret = "x: %4.1f  y: %4.1f  v: %4.1f  a: %4.1f" % (self.dRel, self.yRel, self.vRel, self.aLeadK)
-    return ret
-
   def potential_low_speed_lead(self, v_ego):
     # stop for stuff in front of you and low speed, even without model confirmation
-    return abs(self.yRel) < 1.5 and (v_ego < v_ego_stationary) and self.dRel < 25
-
-  def is_potential_fcw(self, model_prob):
-    return model_prob > .9
+    return (np.abs(self.yRel) < 1.5) & (v_ego < v_ego_stationary) & (self.dRel < 25)
+
+
+def get_RadarState_from_vision(lead_msg, v_ego):
+  return {
+    "dRel": float(lead_msg.dist - RADAR_TO_CAMERA),
+    "yRel": float(lead_msg.relY),
+    "vRel": float(lead_msg.relVel),
+    "vLead": float(v_ego + lead_msg.relVel),
+    "vLeadK": float(v_ego + lead_msg.relVel),
+    "aLeadK": float(0),
+    "aLeadTau": _LEAD_ACCEL_TAU,
+    "fcw": False,
+    "modelProb": float(lead_msg.prob),
+    "radar": False,
+    "status": True
+  }
+
+
+def is_potential_fcw(model_prob):
+  return model_prob > .9
@@ -11,7 +11,7 @@ from selfdrive.controls.lib.pathplanner import PathPlanner
 import cereal.messaging as messaging
 
 
-def plannerd_thread(sm=None, pm=None):
+def plannerd_steps(sm=None, pm=None):
   gc.disable()
 
   # start the loop
@@ -38,6 +38,7 @@ def plannerd_thread(sm=None, pm=None):
   sm['liveParameters'].stiffnessFactor = 1.0
 
   while True:
+    yield
     sm.update()
 
     if sm.updated['model']:
@@ -46,6 +47,11 @@ def plannerd_thread(sm=None, pm=None):
       PL.update(sm, pm, CP, VM, PP)
 
 
+def plannerd_thread(sm=None, pm=None):
+  for _ in plannerd_steps(sm, pm):
+    pass
+
+
 def main(sm=None, pm=None):
   plannerd_thread(sm, pm)
 
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from cereal import car
+from selfdrive.controls.lib.drive_helpers import Events, EVENT_TYPES, create_event, get_events
+
+EVENT_NAMES = list(car.CarEvent.EventName.schema.enumerants.keys())
+
+
+class TestEvents(unittest.TestCase):
+  def test_matches_capnp_events(self):
+    random.seed(0)
+    for _ in range(200):
+      capnp_events = []
+      events = Events()
+      for _ in range(random.randint(0, 8)):
+        name = random.choice(EVENT_NAMES)
+        types = random.sample(EVENT_TYPES, random.randint(0, 3))
+        capnp_events.append(create_event(name, types))
+        events.add(name, types)
+
+      from_msg = Events()
+      from_msg.add_from_msg(capnp_events)
+      self.assertEqual(events.key(), from_msg.key())
+
+      for _ in range(10):
+        types = random.sample(EVENT_TYPES, random.randint(1, 3))
+        expected = get_events(capnp_events, types)
+        self.assertEqual(events.names(types), expected)
+        self.assertEqual(events.any(types), bool(expected))
+
+      self.assertEqual([e.to_dict() for e in events.to_msg()], [e.to_dict() for e in capnp_events])
+
+
+if __name__ == "__main__":
+  unittest.main()
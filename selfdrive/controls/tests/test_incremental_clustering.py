@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import numpy as np
+
+from selfdrive.controls.lib.cluster.fastcluster_py import IncrementalClustering, cluster_points_centroid, hclust, ffi
+
+DIST = 2.5
+HCLUST_METHOD_CENTROID = 5
+
+
+def radar_sequence(n_tracks, n_frames, seed=0, noise=0.02, dt=0.05):
+  """(ids, pts) per frame of radar tracks on objects, with pts the cluster keys
+  [dRel, 2*yRel, vRel]. Static objects and vehicles, a few tracks per object that
+  come and go, a little noise on every track."""
+  rng = random.Random(seed)
+  v_ego = 20.
+  objects = []
+  tracks = {}
+  next_id = 0
+  for _ in range(n_frames):
+    while len(tracks) < n_tracks:
+      if rng.random() < 0.5 or len(objects) == 0:
+        v_rel = -v_ego if rng.random() < 0.5 else rng.uniform(-5., 5.)
+        objects.append([rng.uniform(5., 150.), rng.uniform(-10., 10.), v_rel])
+      tracks[next_id] = (rng.choice(objects), rng.gauss(0., 0.5), rng.gauss(0., 0.3))
+      next_id += 1
+
+    for o in objects:
+      o[0] += o[2] * dt
+    for i, (o, dd, dy) in list(tracks.items()):
+      if rng.random() < 0.01 or not 0. < o[0] + dd < 200.:
+        del tracks[i]
+
+    ids = np.array(sorted(tracks), dtype=np.int64)
+    pts = np.zeros((len(ids), 3))
+    for j, i in enumerate(ids):
+      o, dd, dy = tracks[i]
+      pts[j] = [o[0] + dd + rng.gauss(0., noise), 2 * (o[1] + dy + rng.gauss(0., noise)), o[2] + rng.gauss(0., noise)]
+    yield ids, pts
+
+
+def merge_heights(pts):
+  n, m = pts.shape
+  pdist = ffi.new("double[]", n * (n - 1) // 2)
+  merge = ffi.new("int[]", 2 * (n - 1))
+  height = ffi.new("double[]", n - 1)
+  hclust.hclust_pdist(n, m, ffi.from_buffer("double[]", np.ascontiguousarray(pts)), pdist)
+  hclust.hclust_fast(n, pdist, HCLUST_METHOD_CENTROID, merge, height)
+  return np.sqrt(list(height))
+
+
+class TestIncrementalClustering(unittest.TestCase):
+  def test_few_points(self):
+    self.assertEqual(cluster_points_centroid(np.zeros((0, 3)), DIST), [])
+    self.assertEqual(cluster_points_centroid([[1., 2., 3.]], DIST), [0])
+
+    c = IncrementalClustering(DIST)
+    for ids, pts, expected in [([], np.zeros((0, 3)), []),
+                               ([1], [[1., 2., 3.]], [0]),
+                               ([1, 2], [[1., 2., 3.], [1., 2., 4.]], [0, 0]),
+                               ([2, 3], [[1., 2., 4.], [10., 2., 4.]], [0, 1]),
+                               ([], np.zeros((0, 3)), [])]:
+      self.assertEqual(list(c.update(ids, pts)), expected)
+
+  def test_exact_without_tolerance(self):
+    for n_tracks in [1, 2, 16, 64]:
+      c = IncrementalClustering(DIST, tol=0.)
+      for ids, pts in radar_sequence(n_tracks, 300, seed=n_tracks):
+        self.assertEqual(list(c.update(ids, pts)), cluster_points_centroid(pts, DIST))
+
+  def test_keeps_rigid_clusters(self):
+    c = IncrementalClustering(DIST, tol=1e-6)
+    ids, pts = next(radar_sequence(32, 1))
+    c.update(ids, pts)
+
+    # moving together keeps all clusters and the points they were clustered at
+    moved = pts + [1., 0., -0.5]
+    labels = c.update(ids, moved)
+    self.assertEqual(list(labels), cluster_points_centroid(moved, DIST))
+    np.testing.assert_array_equal(c.anchors, pts)
+
+    # a new point only redoes its surroundings
+    ids = np.append(ids, ids[-1] + 1)
+    moved = np.vstack([moved, moved[0] + [0.1, 0., 0.]])
+    labels = c.update(ids, moved)
+    self.assertEqual(list(labels), cluster_points_centroid(moved, DIST))
+    redone = np.all(c.anchors == moved, axis=1)
+    self.assertTrue(redone[0] and redone[-1])
+    self.assertFalse(np.all(redone))
+
+  def test_within_tolerance(self):
+    # the result may only differ from clustering from scratch when a cluster distance
+    # is within 2 * tol of the cutoff
+    for tol in [0.05, 0.25]:
+      for n_tracks in [16, 64]:
+        c = IncrementalClustering(DIST, tol=tol)
+        for ids, pts in radar_sequence(n_tracks, 300, seed=n_tracks):
+          labels = c.update(ids, pts)
+          expected = cluster_points_centroid(pts, DIST)
+          if list(labels) != expected:
+            self.assertLessEqual(np.min(np.abs(merge_heights(pts) - DIST)), 2 * tol)
+
+
+if __name__ == "__main__":
+  unittest.main()
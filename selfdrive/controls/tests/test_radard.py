@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+import math
+import random
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from common.kalman.simple_kalman import KF1D
+from selfdrive.config import RADAR_TO_CAMERA
+from selfdrive.controls.lib.cluster.fastcluster_py import cluster_points_centroid
+from selfdrive.controls.lib.radar_helpers import _LEAD_ACCEL_TAU, get_RadarState_from_vision
+from selfdrive.controls.radard import KalmanParams, RadarD
+
+RADAR_TS = 0.05
+LEAD_KEYS = ["dRel", "yRel", "vRel", "vLead", "vLeadK", "aLeadK", "aLeadTau", "status", "fcw", "modelProb", "radar"]
+
+
+# reference, one object per track and per cluster
+class Track():
+  def __init__(self, v_lead, kalman_params):
+    self.cnt = 0
+    self.aLeadTau = _LEAD_ACCEL_TAU
+    self.K_A = kalman_params.A
+    self.K_C = kalman_params.C
+    self.K_K = kalman_params.K
+    self.kf = KF1D([[v_lead], [0.0]], self.K_A, self.K_C, self.K_K)
+
+  def update(self, d_rel, y_rel, v_rel, v_lead, measured):
+    self.dRel = d_rel
+    self.yRel = y_rel
+    self.vRel = v_rel
+    self.vLead = v_lead
+    self.measured = measured
+    if self.cnt > 0:
+      self.kf.update(self.vLead)
+    self.vLeadK = float(self.kf.x[0][0])
+    self.aLeadK = float(self.kf.x[1][0])
+    if abs(self.aLeadK) < 0.5:
+      self.aLeadTau = _LEAD_ACCEL_TAU
+    else:
+      self.aLeadTau *= 0.9
+    self.cnt += 1
+
+  def get_key_for_cluster(self):
+    return [self.dRel, self.yRel*2, self.vRel]
+
+  def reset_a_lead(self, aLeadK, aLeadTau):
+    self.kf = KF1D([[self.vLead], [aLeadK]], self.K_A, self.K_C, self.K_K)
+    self.aLeadK = aLeadK
+    self.aLeadTau = aLeadTau
+
+
+def mean(l):
+  return sum(l) / len(l)
+
+
+class Cluster():
+  def __init__(self):
+    self.tracks = set()
+
+  def add(self, t):
+    self.tracks.add(t)
+
+  @property
+  def dRel(self):
+    return mean([t.dRel for t in self.tracks])
+
+  @property
+  def yRel(self):
+    return mean([t.yRel for t in self.tracks])
+
+  @property
+  def vRel(self):
+    return mean([t.vRel for t in self.tracks])
+
+  @property
+  def vLead(self):
+    return mean([t.vLead for t in self.tracks])
+
+  @property
+  def vLeadK(self):
+    return mean([t.vLeadK for t in self.tracks])
+
+  @property
+  def aLeadK(self):
+    if all(t.cnt <= 1 for t in self.tracks):
+      return 0.
+    return mean([t.aLeadK for t in self.tracks if t.cnt > 1])
+
+  @property
+  def aLeadTau(self):
+    if all(t.cnt <= 1 for t in self.tracks):
+      return _LEAD_ACCEL_TAU
+    return mean([t.aLeadTau for t in self.tracks if t.cnt > 1])
+
+  def get_RadarState(self, model_prob=0.0):
+    return {
+      "dRel": float(self.dRel),
+      "yRel": float(self.yRel),
+      "vRel": float(self.vRel),
+      "vLead": float(self.vLead),
+      "vLeadK": float(self.vLeadK),
+      "aLeadK": float(self.aLeadK),
+      "status": True,
+      "fcw": model_prob > .9,
+      "modelProb": model_prob,
+      "radar": True,
+      "aLeadTau": float(self.aLeadTau)
+    }
+
+  def potential_low_speed_lead(self, v_ego):
+    return abs(self.yRel) < 1.5 and (v_ego < 4.) and self.dRel < 25
+
+
+def laplacian_cdf(x, mu, b):
+  b = max(b, 1e-4)
+  return math.exp(-abs(x-mu)/b)
+
+
+def match_vision_to_cluster(v_ego, lead, clusters):
+  offset_vision_dist = lead.dist - RADAR_TO_CAMERA
+
+  def prob(c):
+    prob_d = laplacian_cdf(c.dRel, offset_vision_dist, lead.std)
+    prob_y = laplacian_cdf(c.yRel, lead.relY, lead.relYStd)
+    prob_v = laplacian_cdf(c.vRel, lead.relVel, lead.relVelStd)
+    return prob_d * prob_y * prob_v
+
+  cluster = max(clusters, key=prob)
+  dist_sane = abs(cluster.dRel - offset_vision_dist) < max([(offset_vision_dist)*.25, 5.0])
+  vel_sane = (abs(cluster.vRel - lead.relVel) < 10) or (v_ego + cluster.vRel > 2)
+  return cluster if dist_sane and vel_sane else None
+
+
+def get_lead(v_ego, ready, clusters, lead_msg, low_speed_override=True):
+  if len(clusters) > 0 and ready and lead_msg.prob > .5:
+    cluster = match_vision_to_cluster(v_ego, lead_msg, clusters)
+  else:
+    cluster = None
+
+  lead_dict = {'status': False}
+  if cluster is not None:
+    lead_dict = cluster.get_RadarState(lead_msg.prob)
+  elif ready and (lead_msg.prob > .5):
+    lead_dict = get_RadarState_from_vision(lead_msg, v_ego)
+
+  if low_speed_override:
+    low_speed_clusters = [c for c in clusters if c.potential_low_speed_lead(v_ego)]
+    if len(low_speed_clusters) > 0:
+      closest_cluster = min(low_speed_clusters, key=lambda c: c.dRel)
+      if (not lead_dict['status']) or (closest_cluster.dRel < lead_dict['dRel']):
+        lead_dict = closest_cluster.get_RadarState()
+  return lead_dict
+
+
+class RadarDReference():
+  def __init__(self, radar_ts):
+    self.tracks = {}
+    self.kalman_params = KalmanParams(radar_ts)
+
+  def update(self, v_ego, rr, lead, lead_future):
+    ar_pts = {}
+    for pt in rr.points:
+      ar_pts[pt.trackId] = [pt.dRel, pt.yRel, pt.vRel, pt.measured]
+
+    for ids in list(self.tracks.keys()):
+      if ids not in ar_pts:
+        self.tracks.pop(ids, None)
+
+    for ids, rpt in ar_pts.items():
+      v_lead = rpt[2] + v_ego
+      if ids not in self.tracks:
+        self.tracks[ids] = Track(v_lead, self.kalman_params)
+      self.tracks[ids].update(rpt[0], rpt[1], rpt[2], v_lead, rpt[3])
+
+    idens = sorted(self.tracks.keys())
+    track_pts = [self.tracks[iden].get_key_for_cluster() for iden in idens]
+    if len(track_pts) > 1:
+      cluster_idxs = cluster_points_centroid(track_pts, 2.5)
+      clusters = [None] * (max(cluster_idxs) + 1)
+      for idx in range(len(track_pts)):
+        if clusters[cluster_idxs[idx]] is None:
+          clusters[cluster_idxs[idx]] = Cluster()
+        clusters[cluster_idxs[idx]].add(self.tracks[idens[idx]])
+    elif len(track_pts) == 1:
+      cluster_idxs = [0]
+      clusters = [Cluster()]
+      clusters[0].add(self.tracks[idens[0]])
+    else:
+      clusters = []
+
+    for idx in range(len(track_pts)):
+      if self.tracks[idens[idx]].cnt <= 1:
+        c = clusters[cluster_idxs[idx]]
+        self.tracks[idens[idx]].reset_a_lead(c.aLeadK, c.aLeadTau)
+
+    return get_lead(v_ego, True, clusters, lead, True), get_lead(v_ego, True, clusters, lead_future, False)
+
+
+def synthetic_frames(n_tracks, n_frames, seed=0):
+  """(v_ego, rr, model) per frame: a lead vehicle with a few points on it, clutter and
+  tracks that come and go."""
+  rng = random.Random(seed)
+  next_id = 0
+  tracks = {}
+  for frame in range(n_frames):
+    # slowing down to a stop, to get low speed leads too
+    v_ego = max(0., 10. - 0.05 * frame + rng.gauss(0., 0.05))
+    # replace some tracks
+    for i in list(tracks):
+      if rng.random() < 0.02:
+        del tracks[i]
+    while len(tracks) < n_tracks:
+      lead_point = len(tracks) < 3
+      d = rng.uniform(20., 30.) if lead_point else rng.uniform(1., 150.)
+      y = rng.gauss(0., 0.3) if lead_point else rng.uniform(-10., 10.)
+      v = rng.gauss(-1., 0.2) if lead_point else rng.uniform(-15., 5.)
+      tracks[next_id] = [d, y, v]
+      next_id += 1
+    for t in tracks.values():
+      t[2] += rng.gauss(0., 0.1)
+      t[0] = max(0.5, t[0] + t[2] * RADAR_TS)
+      t[1] += rng.gauss(0., 0.02)
+
+    points = [SimpleNamespace(trackId=i, dRel=t[0], yRel=t[1], vRel=t[2], measured=rng.random() < 0.9)
+              for i, t in tracks.items()]
+    rr = SimpleNamespace(points=points, canMonoTimes=[], errors=[])
+    lead = SimpleNamespace(dist=25. + RADAR_TO_CAMERA, std=1., relY=0., relYStd=1., relVel=-1., relVelStd=1., prob=0.9)
+    lead_future = SimpleNamespace(dist=35. + RADAR_TO_CAMERA, std=2., relY=0., relYStd=1., relVel=-1., relVelStd=2.,
+                                  prob=0.4 if frame % 50 < 10 else 0.6)
+    yield v_ego, rr, SimpleNamespace(lead=lead, leadFuture=lead_future)
+
+
+class FakeSubMaster():
+  def __init__(self, v_ego, model):
+    self.logMonoTime = {'controlsState': 0, 'model': 0}
+    self.updated = {'controlsState': True, 'model': True}
+    self.data = {'controlsState': SimpleNamespace(active=True, vEgo=v_ego), 'model': model}
+
+  def __getitem__(self, s):
+    return self.data[s]
+
+  def all_alive_and_valid(self, service_list=None):
+    return True
+
+
+class TestRadard(unittest.TestCase):
+  def test_matches_reference(self):
+    for n_tracks in [1, 2, 16, 64]:
+      ref, rd = RadarDReference(RADAR_TS), RadarD(RADAR_TS)
+      # the reference clusters every frame from scratch
+      rd.clustering.tol = 0.
+      for frame, (v_ego, rr, model) in enumerate(synthetic_frames(n_tracks, 300, seed=n_tracks)):
+        expected = ref.update(v_ego, rr, model.lead, model.leadFuture)
+        dat = rd.update(frame, FakeSubMaster(v_ego, model), rr, True)
+
+        for lead, exp in zip([dat.radarState.leadOne, dat.radarState.leadTwo], expected):
+          self.assertEqual(lead.status, exp['status'])
+          if exp['status']:
+            for k in LEAD_KEYS:
+              self.assertAlmostEqual(getattr(lead, k), exp[k], places=4, msg=k)
+
+        tracks = rd.tracks
+        self.assertEqual(list(tracks.ids), sorted(ref.tracks))
+        np.testing.assert_allclose(tracks.vLeadK, [ref.tracks[i].kf.x[0][0] for i in tracks.ids], atol=1e-9)
+        np.testing.assert_allclose(tracks.aLeadK, [ref.tracks[i].kf.x[1][0] for i in tracks.ids], atol=1e-9)
+        np.testing.assert_allclose(tracks.aLeadTau, [ref.tracks[i].aLeadTau for i in tracks.ids], atol=1e-9)
+
+  def test_no_points(self):
+    rd = RadarD(RADAR_TS)
+    _, rr, model = next(synthetic_frames(0, 1))
+    dat = rd.update(0, FakeSubMaster(10., model), rr, True)
+    self.assertFalse(dat.radarState.leadOne.status and dat.radarState.leadOne.radar)
+    self.assertEqual(len(rd.tracks), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Times importing selfdrive.car.car_helpers in a new interpreter with the car manifest
+cached and not, and with every brand's interface imported up front like before the
+interfaces were loaded lazily. Controlsd's time to its first message, sendcan included,
+comes from benchmark_startup.py controlsd with a replay running.
+
+usage: benchmark_car_import.py [runs]
+"""
+import shutil
+import subprocess
+import sys
+import tempfile
+
+CODE = """
+import sys, time
+t = time.monotonic()
+import selfdrive.car.car_helpers as car_helpers
+if %r:
+  car_helpers.load_interfaces(car_helpers.interface_names)
+print(time.monotonic() - t, len([m for m in sys.modules if m.startswith('selfdrive.car.')]))
+"""
+
+
+def run(eager, manifest_dir):
+  env_code = "import os; os.environ['CAR_MANIFEST_DIR'] = %r\n" % manifest_dir
+  out = subprocess.check_output([sys.executable, "-c", env_code + CODE % eager]).decode().split()
+  return float(out[-2]), int(out[-1])
+
+
+def main(runs):
+  manifest_dir = tempfile.mkdtemp()
+  results = {"uncached": [], "cached": [], "eager": []}
+  for _ in range(runs):
+    shutil.rmtree(manifest_dir, ignore_errors=True)
+    results["uncached"].append(run(False, manifest_dir))
+    results["cached"].append(run(False, manifest_dir))
+    results["eager"].append(run(True, manifest_dir))
+  shutil.rmtree(manifest_dir, ignore_errors=True)
+
+  print("%-10s %10s %10s" % ("manifest", "import", "modules"))
+  for name, rs in results.items():
+    t = sorted(r[0] for r in rs)[len(rs) // 2]
+    print("%-10s %7.1f ms %10d" % (name, t * 1000, rs[0][1]))
+
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Time per frame to cluster synthetic radar tracks, cluster_points_centroid from scratch
+against IncrementalClustering, and the frames where their clusters differ.
+
+usage: benchmark_clustering.py [frames]
+"""
+import sys
+import time
+
+from selfdrive.controls.lib.cluster.fastcluster_py import IncrementalClustering, cluster_points_centroid
+from selfdrive.controls.tests.test_incremental_clustering import DIST, radar_sequence
+
+
+def bench_full(frames):
+  t = time.perf_counter()
+  for _, pts in frames:
+    cluster_points_centroid(pts, DIST)
+  return (time.perf_counter() - t) / len(frames)
+
+
+def bench_incremental(frames, tol):
+  c = IncrementalClustering(DIST, tol)
+  t = time.perf_counter()
+  for ids, pts in frames:
+    c.update(ids, pts)
+  return (time.perf_counter() - t) / len(frames)
+
+
+def differing_frames(frames, tol):
+  c = IncrementalClustering(DIST, tol)
+  return sum(list(c.update(ids, pts)) != cluster_points_centroid(pts, DIST) for ids, pts in frames)
+
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+  print("%6s %6s %6s %10s %12s %10s" % ("tracks", "noise", "tol", "full", "incremental", "differing"))
+  for noise in [0., 0.02]:
+    for n_tracks in [16, 32, 64]:
+      frames = list(radar_sequence(n_tracks, n, noise=noise))
+      full = bench_full(frames)
+      for tol in [0., 0.05]:
+        print("%6d %6.2f %6.2f %7.1f us %9.1f us %10d" % (n_tracks, noise, tol, full * 1e6, bench_incremental(frames, tol) * 1e6,
+                                                        differing_frames(frames, tol)))
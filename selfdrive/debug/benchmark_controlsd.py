@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Replay a drive through controlsd with process_replay under cProfile and report
+the per-cycle time of each stage of the controlsd loop. The recorded carEvents are
+also fed through the old capnp get_events queries and the Events masks, to compare
+the cost of the state_transition/state_control event queries alone.
+
+Only plain LogReader(fn) iteration is used, like process_replay, so any tools.lib.logreader
+works, not just the in-tree one.
+
+usage: benchmark_controlsd.py <rlog.bz2>
+"""
+import cProfile
+import pstats
+import sys
+import time
+
+import selfdrive.controls.controlsd as controlsd
+from selfdrive.controls.lib.drive_helpers import Events, EventTypes as ET, get_events
+from selfdrive.test.process_replay.process_replay import replay_process, CONFIGS
+from tools.lib.logreader import LogReader
+
+STAGES = ["data_sample", "state_transition", "state_control", "data_send"]
+
+# the queries a controlsd cycle makes in the worst case
+QUERIES = [[ET.ENABLE], [ET.NO_ENTRY], [ET.PRE_ENABLE], [ET.USER_DISABLE], [ET.IMMEDIATE_DISABLE],
+           [ET.SOFT_DISABLE], [ET.IMMEDIATE_DISABLE, ET.SOFT_DISABLE], [ET.WARNING], [ET.PERMANENT],
+           [ET.NO_ENTRY]]
+
+
+def profile_replay(lr):
+  cfg = [c for c in CONFIGS if c.proc_name == "controlsd"][0]
+  prof = cProfile.Profile()
+  prof.enable()
+  replay_process(cfg, lr)
+  prof.disable()
+
+  stats = pstats.Stats(prof).stats
+  for (fn, _, name), (_, ncalls, _, cumtime, _) in stats.items():
+    if fn == controlsd.__file__ and name in STAGES:
+      print("%20s: %8.3f ms/call  %6d calls" % (name, cumtime / ncalls * 1e3, ncalls))
+
+
+def compare_queries(lr):
+  capnp_events = [list(m.carEvents) for m in lr if m.which() == "carEvents"]
+
+  t = time.monotonic()
+  for events in capnp_events:
+    for q in QUERIES:
+      get_events(events, q)
+  dt_capnp = time.monotonic() - t
+
+  t = time.monotonic()
+  for events in capnp_events:
+    e = Events()
+    e.add_from_msg(events)
+    for q in QUERIES:
+      if e.any(q):
+        e.names(q)
+  dt_masks = time.monotonic() - t
+
+  print("event queries per cycle: get_events %.3f ms, Events %.3f ms (%d cycles)" % (
+    dt_capnp / len(capnp_events) * 1e3, dt_masks / len(capnp_events) * 1e3, len(capnp_events)))
+
+
+if __name__ == "__main__":
+  lr = list(LogReader(sys.argv[1]))
+  compare_queries(lr)
+  profile_replay(lr)
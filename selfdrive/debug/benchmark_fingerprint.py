@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Replay the startup CAN of a log through CAN fingerprinting, comparing the
+indexed elimination with the linear scan over every car's fingerprints.
+
+usage: benchmark_fingerprint.py <rlog.bz2>
+"""
+import bz2
+import sys
+import time
+
+from cereal import log
+from selfdrive.car.car_helpers import only_toyota_left
+from selfdrive.car.fingerprints import _FINGERPRINTS, _DEBUG_ADDRESS, IGNORED_FINGERPRINTS, \
+                                       is_valid_for_fingerprint, all_known_cars, \
+                                       eliminate_incompatible_cars, compatible_cars_mask, cars_from_mask, ALL_CARS_MASK
+
+MAX_FRAMES = 200
+
+
+def eliminate_linear(msg, candidate_cars):
+  compatible_cars = []
+  for car_name in candidate_cars:
+    if car_name in IGNORED_FINGERPRINTS:
+      continue
+    for fingerprint in _FINGERPRINTS[car_name]:
+      fingerprint.update(_DEBUG_ADDRESS)
+      if is_valid_for_fingerprint(msg, fingerprint):
+        compatible_cars.append(car_name)
+        break
+  return compatible_cars
+
+
+def should_check(can, b, toyota_left):
+  return (can.src == b or (toyota_left and can.src == 2)) and \
+          can.address < 0x800 and can.address not in [0x7df, 0x7e0, 0x7e8]
+
+
+def run_linear(frames):
+  candidate_cars = {i: all_known_cars() for i in [0, 1]}
+  history = []
+  for a in frames:
+    for can in a.can:
+      for b in candidate_cars:
+        if should_check(can, b, only_toyota_left(candidate_cars[b])):
+          candidate_cars[b] = eliminate_linear(can, candidate_cars[b])
+    history.append({b: list(c) for b, c in candidate_cars.items()})
+  return history
+
+
+def run_list(frames):
+  candidate_cars = {i: all_known_cars() for i in [0, 1]}
+  history = []
+  for a in frames:
+    for can in a.can:
+      for b in candidate_cars:
+        if should_check(can, b, only_toyota_left(candidate_cars[b])):
+          candidate_cars[b] = eliminate_incompatible_cars(can, candidate_cars[b])
+    history.append({b: list(c) for b, c in candidate_cars.items()})
+  return history
+
+
+def run_mask(frames):
+  candidate_masks = {i: ALL_CARS_MASK for i in [0, 1]}
+  candidate_cars = {i: cars_from_mask(ALL_CARS_MASK) for i in [0, 1]}
+  toyota_left = {i: only_toyota_left(candidate_cars[i]) for i in [0, 1]}
+  history = []
+  for a in frames:
+    for can in a.can:
+      for b in candidate_cars:
+        if should_check(can, b, toyota_left[b]):
+          mask = candidate_masks[b] & compatible_cars_mask(can)
+          if mask != candidate_masks[b]:
+            candidate_masks[b] = mask
+            candidate_cars[b] = cars_from_mask(mask)
+            toyota_left[b] = only_toyota_left(candidate_cars[b])
+    history.append({b: list(c) for b, c in candidate_cars.items()})
+  return history
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print(__doc__)
+    sys.exit(1)
+
+  with open(sys.argv[1], 'rb') as f:
+    dat = f.read()
+  if sys.argv[1].endswith('.bz2'):
+    dat = bz2.decompress(dat)
+  frames = [e for e in log.Event.read_multiple_bytes(dat) if e.which() == 'can'][:MAX_FRAMES]
+  print("replaying %d can frames" % len(frames))
+
+  results = {}
+  for name, f in [("linear", run_linear), ("eliminate_incompatible_cars", run_list), ("bitmask", run_mask)]:
+    t = time.monotonic()
+    results[name] = f(frames)
+    dt = time.monotonic() - t
+    print("%30s: %8.2f ms total, %6.3f ms/frame" % (name, dt * 1e3, dt / len(frames) * 1e3))
+
+  # ignored cars are never a valid match, they only linger in the candidates until the first elimination
+  for name in ["eliminate_incompatible_cars", "bitmask"]:
+    for ref, res in zip(results["linear"], results[name]):
+      for b in ref:
+        assert [c for c in ref[b] if c not in IGNORED_FINGERPRINTS] == res[b], name
+
+  print("final candidates:", results["bitmask"][-1])
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""Time FW version matching with the FW index against the linear scan over FW_VERSIONS,
+feeding every known FW version back through the matcher."""
+import time
+
+from selfdrive.car.fw_versions import match_fw_to_car, match_fw_to_car_ranked
+from selfdrive.car.tests.test_fw_versions import all_known_fw, match_fw_to_car_linear
+
+
+if __name__ == "__main__":
+  cases = list(all_known_fw())
+  print("%d FW lists" % len(cases))
+
+  for name, f in [("linear", match_fw_to_car_linear), ("indexed", match_fw_to_car), ("indexed ranked", match_fw_to_car_ranked)]:
+    t = time.monotonic()
+    for _, car_fw, _ in cases:
+      f(car_fw)
+    dt = time.monotonic() - t
+    print("%15s: %8.3f ms/match" % (name, dt / len(cases) * 1e3))
+
+  mismatches = [c for c, car_fw, _ in cases if match_fw_to_car(car_fw) != match_fw_to_car_linear(car_fw)]
+  print("mismatches:", mismatches)
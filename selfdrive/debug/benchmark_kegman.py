@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Per cycle cost of the kegman config in plannerd and controlsd, with the config
+re-read every few hundred frames like before against polling the shared store. Runs
+against a copy of the config in a temporary directory.
+
+plannerd: PathPlanner and LongitudinalMpc re-read every 500 frames, Planner every 1000
+controlsd: LatControlPID re-reads and rebuilds its PIController every 300 frames
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from selfdrive import kegman_conf as kc
+from selfdrive.controls.lib.pid import PIController
+
+CYCLES = 30000
+
+
+def run(name, step):
+  times = []
+  for frame in range(CYCLES):
+    t = time.perf_counter()
+    step(frame)
+    times.append(time.perf_counter() - t)
+  times.sort()
+  print("%-20s mean %7.2f us  p99 %7.2f us  max %8.2f us" % (name, sum(times) / len(times) * 1e6,
+                                                               times[int(len(times) * 0.99)] * 1e6, times[-1] * 1e6))
+
+
+def plannerd_reread(frame):
+  for period in (500, 500, 1000):
+    if frame % period == 0:
+      conf = kc.kegman_conf().conf
+      [float(conf[k]) for k in ('steerRatio', 'sR_boost', '1barBP0', '1barMax', '1barHwy')]
+
+
+def controlsd_reread(frame):
+  if frame % 300 == 0:
+    conf = kc.kegman_conf().conf
+    PIController(([0.], [float(conf['Kp'])]), ([0.], [float(conf['Ki'])]), k_f=float(conf['Kf']), pos_limit=1.0)
+
+
+class Consumer():
+  def __init__(self):
+    self.version = None
+
+  def step(self, _):
+    store = kc.kegman_store()
+    if store.poll() != self.version:
+      self.version = store.version
+      [store.floats[k] for k in ('steerRatio', 'sR_boost', '1barBP0', '1barMax', '1barHwy')]
+
+
+if __name__ == "__main__":
+  tmpdir = tempfile.mkdtemp()
+  kc.KEGMAN_FILE = os.path.join(tmpdir, "kegman.json")
+  if os.path.isfile("/data/kegman.json"):
+    shutil.copy("/data/kegman.json", kc.KEGMAN_FILE)
+
+  run("plannerd re-read", plannerd_reread)
+  consumers = [Consumer() for _ in range(3)]
+  run("plannerd store", lambda f: [c.step(f) for c in consumers])
+  run("controlsd re-read", controlsd_reread)
+  run("controlsd store", Consumer().step)
+
+  shutil.rmtree(tmpdir)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Time per radard frame for synthetic radar points, the array based RadarD against the
+per track reference in test_radard. Both build the radarState message. Clustering the
+points from scratch is also reported on its own.
+
+usage: benchmark_radard.py [frames]
+"""
+import sys
+import time
+
+import cereal.messaging as messaging
+from selfdrive.controls.lib.cluster.fastcluster_py import cluster_points_centroid
+from selfdrive.controls.radard import RadarD
+from selfdrive.controls.tests.test_radard import RADAR_TS, FakeSubMaster, RadarDReference, synthetic_frames
+
+
+def bench_reference(frames):
+  rd = RadarDReference(RADAR_TS)
+  t = time.perf_counter()
+  for v_ego, rr, model in frames:
+    lead_one, lead_two = rd.update(v_ego, rr, model.lead, model.leadFuture)
+    dat = messaging.new_message('radarState')
+    dat.radarState.leadOne = lead_one
+    dat.radarState.leadTwo = lead_two
+  return (time.perf_counter() - t) / len(frames)
+
+
+def bench_radard(frames):
+  rd = RadarD(RADAR_TS)
+  sms = [FakeSubMaster(v_ego, model) for v_ego, _, model in frames]
+  t = time.perf_counter()
+  for i, (_, rr, _) in enumerate(frames):
+    rd.update(i, sms[i], rr, True)
+  return (time.perf_counter() - t) / len(frames)
+
+
+def bench_cluster(frames):
+  pts = [[[pt.dRel, pt.yRel * 2, pt.vRel] for pt in rr.points] for _, rr, _ in frames]
+  t = time.perf_counter()
+  for p in pts:
+    cluster_points_centroid(p, 2.5)
+  return (time.perf_counter() - t) / len(frames)
+
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+  print("%6s %12s %12s %12s" % ("tracks", "reference", "arrays", "clustering"))
+  for n_tracks in [16, 32, 64]:
+    frames = list(synthetic_frames(n_tracks, n))
+    print("%6d %9.1f us %9.1f us %9.1f us" % (n_tracks, bench_reference(frames) * 1e6,
+                                             bench_radard(frames) * 1e6, bench_cluster(frames) * 1e6))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Starts python daemons three ways and reports the time until they enter main() and
+until they send their first message, from the launcher's timing reports:
+
+  cold:   a new interpreter, the imports are paid in the child
+  fork:   multiprocessing.Process from a process with everything imported, what the
+          manager does after manager_prepare
+  zygote: forked by selfdrive.zygote
+
+Most daemons only publish once their inputs arrive, run a replay alongside (e.g.
+tools/replay/unlogger.py) to get first message times, otherwise they show as "-".
+
+usage: benchmark_startup.py [process ...]
+"""
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+DEFAULT_PROCS = {
+  "controlsd": "selfdrive.controls.controlsd",
+  "plannerd": "selfdrive.controls.plannerd",
+  "radard": "selfdrive.controls.radard",
+  "locationd": "selfdrive.locationd.locationd",
+}
+TIMEOUT = 10.
+
+
+def wait_timing(fn, proc, timeout=TIMEOUT):
+  t = time.monotonic()
+  timings = {}
+  while time.monotonic() - t < timeout and "first_message" not in timings:
+    if os.path.exists(fn):
+      with open(fn) as f:
+        for line in f:
+          j = json.loads(line)
+          if j["proc"] == proc:
+            timings[j["event"]] = j["dt"]
+    time.sleep(0.01)
+  return timings
+
+
+def start_cold(proc):
+  code = "from selfdrive.launcher import launcher; launcher(%r, %f)" % (proc, time.monotonic())
+  return subprocess.Popen([sys.executable, "-c", code]).pid
+
+
+def start_fork(proc):
+  from selfdrive.launcher import launcher
+  p = Process(target=launcher, args=(proc, time.monotonic()))
+  p.start()
+  return p.pid
+
+
+def main(names):
+  timing_file = tempfile.mktemp()
+  os.environ["LAUNCHER_TIMING"] = timing_file
+
+  from selfdrive.zygote import Zygote, PREIMPORTS
+  zygote = Zygote()
+
+  results = {}
+  for method in ["cold", "fork", "zygote"]:
+    if method == "fork":
+      for m in PREIMPORTS + [DEFAULT_PROCS[n] for n in names]:
+        importlib.import_module(m)
+
+    for name in names:
+      proc = DEFAULT_PROCS[name]
+      if os.path.exists(timing_file):
+        os.unlink(timing_file)
+
+      if method == "cold":
+        pid = start_cold(proc)
+      elif method == "fork":
+        pid = start_fork(proc)
+      else:
+        pid = zygote.start(name, proc).pid
+
+      results[(method, name)] = wait_timing(timing_file, proc)
+      os.kill(pid, signal.SIGKILL)
+      time.sleep(0.5)
+
+  zygote.stop()
+  if os.path.exists(timing_file):
+    os.unlink(timing_file)
+
+  fmt = lambda t: "%7.1f ms" % (t * 1000) if t is not None else "%10s" % "-"
+  print("%-10s %-7s %10s %10s" % ("process", "method", "main", "first msg"))
+  for name in names:
+    for method in ["cold", "fork", "zygote"]:
+      t = results[(method, name)]
+      print("%-10s %-7s %s %s" % (name, method, fmt(t.get("main")), fmt(t.get("first_message"))))
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:] or list(DEFAULT_PROCS))
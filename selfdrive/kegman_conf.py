@@ -1,5 +1,12 @@
 import json
 import os
+import time
+
+from common import inotify
+
+KEGMAN_FILE = '/data/kegman.json'
+# how often poll looks for changes, edits are made by hand so this can be slow
+POLL_INTERVAL = 0.1
 
 class kegman_conf():
   def __init__(self, CP=None):
@@ -39,8 +46,8 @@ class kegman_conf():
   def read_config(self):
     self.element_updated = False
 
-    if os.path.isfile('/data/kegman.json'):
-      with open('/data/kegman.json', 'r') as f:
+    if os.path.isfile(KEGMAN_FILE):
+      with open(KEGMAN_FILE, 'r') as f:
         self.config = json.load(f)
 
       if "cameraOffset" not in self.config:
@@ -157,11 +164,98 @@ class kegman_conf():
 
   def write_config(self, config):
     try:
-      with open('/data/kegman.json', 'w') as f:
+      with open(KEGMAN_FILE, 'w') as f:
         json.dump(self.config, f, indent=2, sort_keys=True)
-        os.chmod("/data/kegman.json", 0o764)
+        os.chmod(KEGMAN_FILE, 0o764)
     except IOError:
-      os.mkdir('/data')
-      with open('/data/kegman.json', 'w') as f:
+      os.mkdir(os.path.dirname(KEGMAN_FILE))
+      with open(KEGMAN_FILE, 'w') as f:
         json.dump(self.config, f, indent=2, sort_keys=True)
-        os.chmod("/data/kegman.json", 0o764)
+        os.chmod(KEGMAN_FILE, 0o764)
+
+
+def _to_float(v):
+  try:
+    return float(v)
+  except (TypeError, ValueError):
+    return None
+
+
+class KegmanStore():
+  """The kegman config shared by everything in a process. conf has the values as strings
+  like in the file and floats the ones that parse as float. The file is only re-read when
+  poll sees it change, version counts the re-reads."""
+  def __init__(self):
+    self.version = 0
+    self.inotify = None
+    self.stat = None
+    self.next_poll = 0.
+    # loading first creates the file and /data if missing
+    self.reload()
+    self.watch()
+
+  def watch(self):
+    # the file is rewritten in place or replaced, so watch the directory
+    try:
+      self.inotify = inotify.Inotify()
+      self.inotify.add_watch(os.path.dirname(KEGMAN_FILE), inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_CREATE)
+    except OSError:
+      # no inotify, fall back to checking the mtime
+      if self.inotify is not None:
+        self.inotify.close()
+      self.inotify = None
+
+  def file_stat(self):
+    try:
+      st = os.stat(KEGMAN_FILE)
+      return (st.st_ino, st.st_size, st.st_mtime_ns)
+    except OSError:
+      return None
+
+  def reload(self):
+    try:
+      self.conf = kegman_conf().conf
+    except ValueError:
+      if self.version == 0:
+        raise
+      # caught it mid write, keep the last config until the next change
+      self.stat = None
+      return
+    self.floats = {k: _to_float(v) for k, v in self.conf.items()}
+    self.stat = self.file_stat()
+    self.version += 1
+
+  def poll(self):
+    """Re-reads the file if it changed since the last poll, returns the version. Checks at
+    most every POLL_INTERVAL, so it is cheap enough to call every cycle."""
+    t = time.monotonic()
+    if t < self.next_poll:
+      return self.version
+    self.next_poll = t + POLL_INTERVAL
+
+    if self.inotify is not None:
+      name = os.path.basename(KEGMAN_FILE)
+      changed = any(n == name for _, _, n in self.inotify.read(0.))
+    else:
+      changed = self.file_stat() != self.stat
+
+    if changed:
+      self.reload()
+    return self.version
+
+
+_store = None
+
+def _reset_store():
+  # a forked child gets its own inotify fd, the parent's would split the events
+  global _store
+  _store = None
+
+os.register_at_fork(after_in_child=_reset_store)
+
+def kegman_store():
+  """Returns the process wide KegmanStore."""
+  global _store
+  if _store is None:
+    _store = KegmanStore()
+  return _store
@@ -1,11 +1,44 @@
 import importlib
+import json
+import os
+import time
 from setproctitle import setproctitle  #pylint: disable=no-name-in-module
 
 import cereal.messaging as messaging
 import selfdrive.crash as crash
 from selfdrive.swaglog import cloudlog
 
-def launcher(proc):
+# append startup timings as json lines to this file, for benchmarks
+TIMING_FILE = os.getenv("LAUNCHER_TIMING")
+
+def report_timing(proc, event, start_t, **kwargs):
+  dt = time.monotonic() - start_t
+  cloudlog.event("launcher_timing", proc=proc, timing=event, dt=dt, **kwargs)
+  if TIMING_FILE is not None:
+    with open(TIMING_FILE, "a") as f:
+      f.write(json.dumps({"proc": proc, "event": event, "dt": dt, **kwargs}) + "\n")
+
+class TimedPubSocket():
+  """Forwards to a PubSocket and reports the first message the process sends."""
+  def __init__(self, sock, proc, endpoint, start_t, state):
+    self.sock = sock
+    self.proc = proc
+    self.endpoint = endpoint
+    self.start_t = start_t
+    self.state = state
+
+  def send(self, dat):
+    # later sends go straight to the socket
+    self.send = self.sock.send
+    if not self.state["reported"]:
+      self.state["reported"] = True
+      report_timing(self.proc, "first_message", self.start_t, service=self.endpoint)
+    return self.sock.send(dat)
+
+def launcher(proc, start_t=None):
+  if start_t is None:
+    start_t = time.monotonic()
+
   try:
     # import the process
     mod = importlib.import_module(proc)
@@ -16,6 +49,10 @@ def launcher(proc):
     # create new context since we forked
     messaging.context = messaging.Context()
 
+    report_timing(proc, "main", start_t)
+    pub_sock, state = messaging.pub_sock, {"reported": False}
+    messaging.pub_sock = lambda endpoint: TimedPubSocket(pub_sock(endpoint), proc, endpoint, start_t, state)
+
     # exec the process
     mod.main()
   except KeyboardInterrupt:
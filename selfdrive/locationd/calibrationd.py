@@ -134,7 +134,7 @@ class Calibrator():
     pm.send('liveCalibration', cal_send)
 
 
-def calibrationd_thread(sm=None, pm=None):
+def calibrationd_steps(sm=None, pm=None):
   if sm is None:
     sm = messaging.SubMaster(['cameraOdometry', 'carState'])
 
@@ -145,6 +145,7 @@ def calibrationd_thread(sm=None, pm=None):
 
   send_counter = 0
   while 1:
+    yield
     sm.update()
 
     if sm.updated['carState']:
@@ -165,6 +166,11 @@ def calibrationd_thread(sm=None, pm=None):
       # decimate outputs for efficiency
 
 
+def calibrationd_thread(sm=None, pm=None):
+  for _ in calibrationd_steps(sm, pm):
+    pass
+
+
 def main(sm=None, pm=None):
   calibrationd_thread(sm, pm)
 
@@ -1,39 +1,218 @@
 #!/usr/bin/env python3
 import os
+import ctypes
+import platform
 import shutil
 import threading
+from queue import Queue
 from selfdrive.swaglog import cloudlog
 from selfdrive.loggerd.config import ROOT, get_available_bytes, get_available_percent
-from selfdrive.loggerd.uploader import listdir_by_creation
+from selfdrive.loggerd.uploader import listdir_by_creation, get_directory_sort, UPLOAD_ATTR_NAME
+from common.xattr import getxattr
 
 MIN_BYTES = 5 * 1024 * 1024 * 1024
 MIN_PERCENT = 10
+# free this much more than the minimum, so a batch lasts a while
+HEADROOM_BYTES = 1024 * 1024 * 1024
 
+# lower is deleted first, files of the same rank go oldest segment first
+DELETE_RANK = {
+  "fcamera.hevc": 0,
+  "dcamera.hevc": 0,
+  "rlog.bz2": 1,
+  "qcamera.ts": 2,
+  "qlog.bz2": 3,
+}
+DEFAULT_DELETE_RANK = 1
+# qlogs and qcameras are small and cover the whole drive, they go once nothing else is left
+KEEP_RANK = 2
 
-def deleter_thread(exit_event):
-  while not exit_event.is_set():
-    out_of_bytes = get_available_bytes(default=MIN_BYTES + 1) < MIN_BYTES
-    out_of_percent = get_available_percent(default=MIN_PERCENT + 1) < MIN_PERCENT
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+SYS_IOPRIO_SET = {"x86_64": 251, "aarch64": 30, "armv7l": 314, "armv8l": 314}
+
+
+def set_io_priority_idle():
+  """Moves the calling thread to the idle I/O scheduling class."""
+  nr = SYS_IOPRIO_SET.get(platform.machine())
+  if nr is None:
+    return False
+  libc = ctypes.CDLL(None, use_errno=True)
+  if libc.syscall(nr, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+    cloudlog.error("ioprio_set failed: %d", ctypes.get_errno())
+    return False
+  return True
+
+
+def get_size(path):
+  """Size of a file, or of everything in a directory."""
+  if not os.path.isdir(path) or os.path.islink(path):
+    return os.path.getsize(path)
+  size = 0
+  for dirpath, _, fns in os.walk(path):
+    for fn in fns:
+      try:
+        size += os.path.getsize(os.path.join(dirpath, fn))
+      except OSError:
+        pass
+  return size
+
+
+def is_uploaded(fn):
+  try:
+    return bool(getxattr(fn, UPLOAD_ATTR_NAME))
+  except OSError:
+    return False
 
-    if out_of_percent or out_of_bytes:
-      # remove the earliest directory we can
-      dirs = listdir_by_creation(ROOT)
-      for delete_dir in dirs:
-        delete_path = os.path.join(ROOT, delete_dir)
 
-        if any(name.endswith(".lock") for name in os.listdir(delete_path)):
+class Segment():
+  def __init__(self, name, mtime, files, locked):
+    self.name = name
+    self.mtime = mtime
+    self.files = files  # name -> [size, uploaded]
+    self.locked = locked
+
+
+class SegmentIndex():
+  """Size and upload state of every segment in root. A segment directory is only listed
+  again when its mtime changes, the upload xattr is only read for files not yet uploaded."""
+  def __init__(self, root):
+    self.root = root
+    self.segments = {}
+
+  def update(self):
+    names = listdir_by_creation(self.root)
+    for name in set(self.segments) - set(names):
+      del self.segments[name]
+
+    for name in names:
+      path = os.path.join(self.root, name)
+      try:
+        mtime = os.stat(path).st_mtime_ns
+      except OSError:
+        self.segments.pop(name, None)
+        continue
+
+      seg = self.segments.get(name)
+      if seg is None or seg.mtime != mtime:
+        seg = self.scan_segment(name, path, mtime)
+        if seg is None:
           continue
+        self.segments[name] = seg
+      else:
+        for fn, f in seg.files.items():
+          if not f[1]:
+            f[1] = is_uploaded(os.path.join(path, fn))
+    return [self.segments[name] for name in names if name in self.segments]
+
+  def scan_segment(self, name, path, mtime):
+    try:
+      fns = os.listdir(path)
+    except OSError:
+      return None
+
+    files = {}
+    for fn in fns:
+      if fn.endswith(".lock"):
+        continue
+      try:
+        files[fn] = [get_size(os.path.join(path, fn)), is_uploaded(os.path.join(path, fn))]
+      except OSError:
+        pass
+    return Segment(name, mtime, files, any(fn.endswith(".lock") for fn in fns))
+
+  def remove(self, seg_name, fn):
+    seg = self.segments.get(seg_name)
+    if seg is not None:
+      seg.files.pop(fn, None)
 
-        try:
-          cloudlog.info("deleting %s" % delete_path)
-          shutil.rmtree(delete_path)
-          break
-        except OSError:
-          cloudlog.exception("issue deleting %s" % delete_path)
+
+def bytes_to_free(available_bytes, available_percent):
+  """Returns how many bytes have to be deleted, 0 when there is enough space."""
+  if available_bytes >= MIN_BYTES and available_percent >= MIN_PERCENT:
+    return 0
+  total_bytes = available_bytes * 100. / available_percent if available_percent > 0 else 0
+  need = max(MIN_BYTES - available_bytes, total_bytes * MIN_PERCENT / 100. - available_bytes)
+  return int(max(need, 0)) + HEADROOM_BYTES
+
+
+def plan_deletes(segments, need):
+  """Picks files to delete until need bytes are freed: files below KEEP_RANK first, of
+  those uploaded ones first, then by DELETE_RANK, then oldest segment first.
+  Returns [(segment, file, size)]."""
+  candidates = []
+  for seg in segments:
+    if seg.locked:
+      continue
+    for fn, (size, uploaded) in seg.files.items():
+      rank = DELETE_RANK.get(fn, DEFAULT_DELETE_RANK)
+      candidates.append(((rank >= KEEP_RANK, not uploaded, rank, get_directory_sort(seg.name)), seg.name, fn, size))
+  candidates.sort(key=lambda c: c[0])
+
+  plan = []
+  freed = 0
+  for _, seg_name, fn, size in candidates:
+    if freed >= need:
+      break
+    plan.append((seg_name, fn, size))
+    freed += size
+  return plan
+
+
+def delete_worker(root, jobs, done):
+  set_io_priority_idle()
+  while True:
+    plan = jobs.get()
+    if plan is None:
+      return
+
+    for seg_name, fn, _ in plan:
+      path = os.path.join(root, seg_name, fn)
+      try:
+        if os.path.isdir(path) and not os.path.islink(path):
+          shutil.rmtree(path)
+        else:
+          os.unlink(path)
+      except FileNotFoundError:
+        pass
+      except OSError:
+        cloudlog.exception("issue deleting %s" % path)
+
+    # drop segments that are left empty
+    for seg_name in {seg_name for seg_name, _, _ in plan}:
+      try:
+        os.rmdir(os.path.join(root, seg_name))
+      except OSError:
+        pass
+    done.set()
+
+
+def deleter_thread(exit_event):
+  index = SegmentIndex(ROOT)
+  jobs = Queue()
+  done = threading.Event()
+  worker = threading.Thread(target=delete_worker, args=(ROOT, jobs, done), daemon=True)
+  worker.start()
+
+  while not exit_event.is_set():
+    need = bytes_to_free(get_available_bytes(default=MIN_BYTES + 1), get_available_percent(default=MIN_PERCENT + 1))
+    plan = plan_deletes(index.update(), need) if need > 0 else []
+
+    if plan:
+      cloudlog.info("deleting %d files, %d bytes to free", len(plan), need)
+      done.clear()
+      jobs.put(plan)
+      while not done.wait(.1) and not exit_event.is_set():
+        pass
+      for seg_name, fn, _ in plan:
+        index.remove(seg_name, fn)
       exit_event.wait(.1)
     else:
       exit_event.wait(30)
 
+  jobs.put(None)
+
 
 def main():
   deleter_thread(threading.Event())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Simulates driving on a small fake disk: segments are written with fill_eon.make_segment,
+qlogs are uploaded right away and one in three segments gets its raw files uploaded later.
+Free space is the disk capacity minus what is in ROOT. After every segment the deleter
+runs until there is enough space again.
+
+Compares the old deleter (one oldest segment per 0.1 s tick) against the retention engine
+and reports deleter passes, time spent deciding, how many qlogs survive and how much data
+that was never uploaded got deleted.
+
+usage: benchmark_deleter.py [segments]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from queue import Queue
+
+import selfdrive.loggerd.deleter as deleter
+from common.xattr import setxattr
+from selfdrive.loggerd.uploader import listdir_by_creation, UPLOAD_ATTR_NAME, UPLOAD_ATTR_VALUE
+from selfdrive.loggerd.tests.fill_eon import make_segment
+
+MB = 1024 * 1024
+# a 100x scaled down EON
+SEGMENT_FILES = {"fcamera.hevc": 0.36, "dcamera.hevc": 0.1, "rlog.bz2": 0.02, "qlog.bz2": 0.005}
+CAPACITY = 40 * MB
+MIN_BYTES = 5 * MB
+HEADROOM_BYTES = 2 * MB
+
+
+class FakeDisk():
+  def __init__(self, root):
+    self.root = root
+    self.stat_time = 0.
+    self.stat_calls = 0
+
+  def available_bytes(self, default=None):
+    t = time.monotonic()
+    used = 0
+    for seg in os.scandir(self.root):
+      for f in os.scandir(seg.path):
+        used += f.stat().st_size
+    self.stat_time += time.monotonic() - t
+    self.stat_calls += 1
+    return CAPACITY - used
+
+  def available_percent(self, default=None):
+    return 100. * self.available_bytes() / CAPACITY
+
+
+def legacy_pass(root):
+  # one tick of the old deleter
+  for delete_dir in listdir_by_creation(root):
+    delete_path = os.path.join(root, delete_dir)
+    if any(name.endswith(".lock") for name in os.listdir(delete_path)):
+      continue
+    shutil.rmtree(delete_path)
+    return
+
+
+def run(root, n_segments, legacy):
+  shutil.rmtree(root, ignore_errors=True)
+  os.mkdir(root)
+  disk = FakeDisk(root)
+  deleter.get_available_bytes = disk.available_bytes
+  deleter.get_available_percent = disk.available_percent
+  deleter.MIN_BYTES, deleter.HEADROOM_BYTES = MIN_BYTES, HEADROOM_BYTES
+  index = deleter.SegmentIndex(root)
+
+  created = {}
+  passes = 0
+  t_delete = 0.
+  for i in range(n_segments):
+    seg_path = make_segment(root, i, SEGMENT_FILES)
+    for fn, size_mb in SEGMENT_FILES.items():
+      created[os.path.join(seg_path, fn)] = size_mb * MB
+    setxattr(os.path.join(seg_path, "qlog.bz2"), UPLOAD_ATTR_NAME, UPLOAD_ATTR_VALUE)
+    if i >= 5 and i % 3 == 0:
+      old_path = os.path.join(root, "1970-01-01--00-00-00--%d" % (i - 5))
+      for fn in SEGMENT_FILES:
+        try:
+          setxattr(os.path.join(old_path, fn), UPLOAD_ATTR_NAME, UPLOAD_ATTR_VALUE)
+        except OSError:
+          pass
+
+    stat_time = disk.stat_time
+    t = time.monotonic()
+    if legacy:
+      while disk.available_bytes() < deleter.MIN_BYTES or disk.available_percent() < deleter.MIN_PERCENT:
+        legacy_pass(root)
+        passes += 1
+    else:
+      need = deleter.bytes_to_free(disk.available_bytes(), disk.available_percent())
+      if need > 0:
+        jobs, done = Queue(), threading.Event()
+        jobs.put(deleter.plan_deletes(index.update(), need))
+        jobs.put(None)
+        deleter.delete_worker(root, jobs, done)
+        passes += 1
+    t_delete += time.monotonic() - t - (disk.stat_time - stat_time)
+
+  uploaded_fns = set()
+  for seg in os.listdir(root):
+    for fn in os.listdir(os.path.join(root, seg)):
+      uploaded_fns.add(os.path.join(root, seg, fn))
+  lost = 0
+  for fn, size in created.items():
+    if fn not in uploaded_fns and not is_uploaded_sim(fn, n_segments):
+      lost += size
+  qlogs = sum(fn.endswith("qlog.bz2") for fn in uploaded_fns)
+
+  print("%-9s %4d deleter passes (%5.1f s of 0.1 s ticks), %6.1f ms deciding+deleting, %4d qlogs kept, "
+        "%5.1f MB never uploaded deleted" % ("legacy" if legacy else "retention", passes, passes * 0.1 if legacy else 0.,
+                                            t_delete * 1000, qlogs, lost / MB))
+
+
+def is_uploaded_sim(fn, n_segments):
+  # mirrors the upload schedule in run
+  seg = int(os.path.basename(os.path.dirname(fn)).rsplit("--", 1)[1])
+  if fn.endswith("qlog.bz2"):
+    return True
+  uploaded_at = seg + 5
+  return uploaded_at < n_segments and uploaded_at % 3 == 0
+
+
+if __name__ == "__main__":
+  n_segments = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+  root = tempfile.mkdtemp()
+  try:
+    run(root, n_segments, True)
+    run(root, n_segments, False)
+  finally:
+    shutil.rmtree(root)
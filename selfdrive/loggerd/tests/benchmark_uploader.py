@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Runs the uploader against a local blob server with per request latency and a per
+connection bandwidth cap. Backlogged segments are on disk when it starts, a new segment
+shows up a second later. Reports throughput and how long the new qlog waited.
+
+Compares one worker with whole file PUTs (the old uploader) against the defaults.
+
+usage: benchmark_uploader.py [segments] [latency_ms] [bandwidth_mbps]
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from selfdrive.swaglog import cloudlog
+import selfdrive.loggerd.uploader as uploader
+from selfdrive.loggerd.tests.loggerd_tests_common import MockBlobServer, MockParams, create_random_file
+
+FILES = {"qlog.bz2": 0.2, "rlog.bz2": 2, "fcamera.hevc": 10, "dcamera.hevc": 3, "bootlog.bz2": 0.05}
+
+
+class UploadTimes(logging.Handler):
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.done = {}
+
+  def emit(self, record):
+    try:
+      j = json.loads(record.message)
+      if j["event"] == "upload_success":
+        self.done[j["key"]] = time.monotonic()
+    except Exception:
+      pass
+
+
+def run(root, n_segments, latency, bandwidth, workers, chunked):
+  shutil.rmtree(root, ignore_errors=True)
+  os.mkdir(root)
+  seg_format = "2020-01-01--00-00-00--{}"
+  total = 0
+  for i in range(n_segments):
+    for name, size_mb in FILES.items():
+      create_random_file(os.path.join(root, seg_format.format(i), name), size_mb)
+      total += size_mb
+
+  server = MockBlobServer(latency, bandwidth)
+  uploader.ROOT = root
+  uploader.Api = server.api()
+  uploader.Params = MockParams
+  uploader.fake_upload = 0
+  uploader.is_on_hotspot = lambda *args: False
+  uploader.is_on_wifi = lambda *args: True
+  uploader.UPLOAD_WORKERS = workers
+  uploader.CHUNKED_UPLOAD_MIN_SIZE = 8 * 1024 * 1024 if chunked else float("inf")
+
+  times = UploadTimes()
+  cloudlog.addHandler(times)
+  exit_event = threading.Event()
+  thread = threading.Thread(target=uploader.uploader_fn, args=[exit_event], daemon=True)
+  t0 = time.monotonic()
+  thread.start()
+
+  time.sleep(1)
+  new_key = os.path.join(seg_format.format(n_segments), "qlog.bz2")
+  create_random_file(os.path.join(root, new_key), FILES["qlog.bz2"])
+  t_new = time.monotonic()
+  total += FILES["qlog.bz2"]
+
+  n_files = n_segments * len(FILES) + 1
+  while len(times.done) < n_files:
+    time.sleep(0.05)
+  t_end = max(times.done.values())
+  exit_event.set()
+  thread.join()
+  cloudlog.removeHandler(times)
+  server.stop()
+
+  first_qlog = min(v for k, v in times.done.items() if k.endswith("qlog.bz2"))
+  print("workers=%d chunked=%-5s %6.1f MB in %5.1f s, %5.2f MB/s, first qlog %5.2f s, new qlog %5.2f s" %
+        (workers, chunked, total, t_end - t0, total / (t_end - t0), first_qlog - t0, times.done[new_key] - t_new))
+
+
+if __name__ == "__main__":
+  n_segments = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+  latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+  bandwidth = float(sys.argv[3]) * 1e6 / 8 if len(sys.argv) > 3 else 40e6 / 8
+
+  workers = uploader.UPLOAD_WORKERS
+  root = tempfile.mkdtemp()
+  try:
+    run(root, n_segments, latency, bandwidth, 1, False)
+    run(root, n_segments, latency, bandwidth, workers, True)
+  finally:
+    shutil.rmtree(root)
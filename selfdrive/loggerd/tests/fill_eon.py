@@ -6,17 +6,20 @@ import os
 from selfdrive.loggerd.config import ROOT, get_available_percent
 from selfdrive.loggerd.tests.loggerd_tests_common import create_random_file
 
+SEGMENT_FILES = {'fcamera.hevc': 36, 'rlog.bz2': 2}
+
+
+def make_segment(root, segment_idx, files=SEGMENT_FILES):
+  seg_path = os.path.join(root, "1970-01-01--00-00-00--%d" % segment_idx)
+  for fn, size_mb in files.items():
+    create_random_file(os.path.join(seg_path, fn), size_mb)
+  return seg_path
+
 
 if __name__ == "__main__":
   segment_idx = 0
   while True:
-    seg_name = "1970-01-01--00-00-00--%d" % segment_idx
-    seg_path = os.path.join(ROOT, seg_name)
-
-    print(seg_path)
-
-    create_random_file(os.path.join(seg_path, 'fcamera.hevc'), 36)
-    create_random_file(os.path.join(seg_path, 'rlog.bz2'), 2)
+    print(make_segment(ROOT, segment_idx))
 
     segment_idx += 1
 
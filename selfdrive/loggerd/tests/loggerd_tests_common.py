@@ -1,9 +1,15 @@
 import os
+import re
+import json
+import time
 import errno
 import shutil
 import random
 import tempfile
 import unittest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 
 import selfdrive.loggerd.uploader as uploader
 
@@ -52,6 +58,93 @@ class MockApiIgnore():
   def get_token(self):
     return "fake-token"
 
+class MockBlobServer():
+  """Local stand-in for the Azure blob store, supports whole blob and block uploads.
+  Set drop_after to a number of block PUTs after which connections are dropped. latency
+  and bandwidth (bytes/s, per connection) slow down every PUT like a real link would."""
+  def __init__(self, latency=0., bandwidth=None):
+    self.blobs = {}
+    self.blocks = {}
+    self.requests = []
+    self.latency = latency
+    self.bandwidth = bandwidth
+    self.drop_after = None
+    self.lock = threading.Lock()
+
+    server = self
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def log_message(self, *args):
+        pass
+
+      def reply(self, code, body=b""):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def do_GET(self):
+        path, query = self.parse()
+        with server.lock:
+          blocks = server.blocks.get(path, {})
+          body = "<BlockList><UncommittedBlocks>%s</UncommittedBlocks></BlockList>" % \
+                 "".join("<Block><Name>%s</Name><Size>%d</Size></Block>" % (k, len(v)) for k, v in blocks.items())
+        self.reply(200, body.encode())
+
+      def do_PUT(self):
+        path, query = self.parse()
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        server.delay(len(data))
+        comp = query.get("comp", [None])[0]
+        with server.lock:
+          server.requests.append((path, comp))
+          if comp == "block":
+            if server.drop_after is not None:
+              if server.drop_after <= 0:
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+              server.drop_after -= 1
+            server.blocks.setdefault(path, {})[query["blockid"][0]] = data
+          elif comp == "blocklist":
+            blocks = server.blocks.pop(path, {})
+            ids = re.findall(r"<Latest>([^<]*)</Latest>", data.decode())
+            server.blobs[path] = b"".join(blocks[i] for i in ids)
+          else:
+            server.blobs[path] = data
+        self.reply(201)
+
+      def parse(self):
+        url = urlparse(self.path)
+        return url.path, parse_qs(url.query)
+
+    self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.httpd.daemon_threads = True
+    self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+    self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    self.thread.start()
+
+  def delay(self, size):
+    t = self.latency
+    if self.bandwidth:
+      t += size / self.bandwidth
+    if t > 0:
+      time.sleep(t)
+
+  def api(self):
+    """Returns an Api class handing out upload urls on this server."""
+    url = self.url
+    class MockBlobApi(MockApi):
+      def get(self, *args, **kwargs):
+        return MockResponse(json.dumps({"url": "%s/%s?sig=fake" % (url, kwargs["path"]),
+                                        "headers": {"x-ms-blob-type": "BlockBlob"}}), 200)
+    return MockBlobApi
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
 class MockParams():
   def __init__(self):
     self.params = {
@@ -76,6 +169,7 @@ class UploaderTestCase(unittest.TestCase):
     uploader.fake_upload = 1
     uploader.is_on_hotspot = lambda *args: False
     uploader.is_on_wifi = lambda *args: True
+    uploader.UPLOAD_WORKERS = 1
     self.seg_num = random.randint(1, 300)
     self.seg_format = "2019-04-18--12-52-54--{}"
     self.seg_format2 = "2019-05-18--11-22-33--{}"
@@ -6,6 +6,8 @@ from collections import namedtuple
 
 import selfdrive.loggerd.deleter as deleter
 from common.timeout import Timeout, TimeoutException
+from common.xattr import setxattr
+import selfdrive.loggerd.uploader as uploader
 
 from selfdrive.loggerd.tests.loggerd_tests_common import UploaderTestCase
 
@@ -22,8 +24,17 @@ class TestDeleter(UploaderTestCase):
     self.fake_stats = Stats(f_bavail=0, f_blocks=10, f_frsize=4096)
     deleter.os.statvfs = self.fake_statvfs
     deleter.ROOT = self.root
+    self.headroom = deleter.HEADROOM_BYTES
+
+  def set_bytes_short(self, n):
+    # just n bytes under MIN_BYTES, plenty of percent
+    deleter.HEADROOM_BYTES = 0
+    block_size = 4096
+    available = (deleter.MIN_BYTES - n) // block_size
+    self.fake_stats = Stats(f_bavail=available, f_blocks=available * 2, f_frsize=block_size)
 
   def tearDown(self):
+    deleter.HEADROOM_BYTES = self.headroom
     super(TestDeleter, self).tearDown()
 
   def start_thread(self):
@@ -54,6 +65,7 @@ class TestDeleter(UploaderTestCase):
     self.seg_num += 1
     self.seg_dir = self.seg_format.format(self.seg_num)
     f_path_2 = self.make_file_with_data(self.seg_dir, self.f_type)
+    self.set_bytes_short(1)
 
     self.start_thread()
 
@@ -103,6 +115,64 @@ class TestDeleter(UploaderTestCase):
 
     self.assertTrue(os.path.exists(f_path), "File deleted when locked")
 
+  def test_delete_uploaded_first(self):
+    f_path_1 = self.make_file_with_data(self.seg_dir, self.f_type)
+    self.seg_num += 1
+    self.seg_dir = self.seg_format.format(self.seg_num)
+    f_path_2 = self.make_file_with_data(self.seg_dir, self.f_type)
+    setxattr(f_path_2, uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+    self.set_bytes_short(1)
+
+    self.start_thread()
+
+    with Timeout(5, "Timeout waiting for file to be deleted"):
+      while os.path.exists(f_path_1) and os.path.exists(f_path_2):
+        time.sleep(0.01)
+    self.join_thread()
+
+    self.assertTrue(os.path.exists(f_path_1), "Not uploaded file deleted before uploaded file")
+    self.assertFalse(os.path.exists(f_path_2), "Uploaded file not deleted")
+
+  def test_delete_directory(self):
+    os.mkdir(os.path.join(self.root, self.seg_dir))
+    f_path = self.make_file_with_data(os.path.join(self.seg_dir, "subdir"), self.f_type, 1)
+    self.set_bytes_short(1)
+
+    index = deleter.SegmentIndex(self.root)
+    plan = deleter.plan_deletes(index.update(), 1)
+    self.assertEqual([(seg, fn) for seg, fn, _ in plan], [(self.seg_dir, "subdir")])
+    self.assertGreaterEqual(plan[0][2], os.path.getsize(f_path))
+
+    self.start_thread()
+
+    with Timeout(5, "Timeout waiting for directory to be deleted"):
+      while os.path.exists(os.path.dirname(f_path)):
+        time.sleep(0.01)
+    self.join_thread()
+
+    self.assertFalse(os.path.exists(os.path.join(self.root, self.seg_dir)), "Segment not deleted")
+
+  def test_plan_deletes(self):
+    seg_dirs = [self.seg_format.format(i) for i in range(3)]
+    for seg_dir in seg_dirs:
+      for fn in ["qlog.bz2", "rlog.bz2", "fcamera.hevc"]:
+        self.make_file_with_data(seg_dir, fn, size_mb=0.5)
+    setxattr(os.path.join(self.root, seg_dirs[2], "qlog.bz2"), uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+    self.make_file_with_data(self.seg_format.format(3), "fcamera.hevc", lock=True)
+
+    index = deleter.SegmentIndex(self.root)
+    plan = deleter.plan_deletes(index.update(), 4 * 1024 * 1024)
+    self.assertEqual([(seg, fn) for seg, fn, _ in plan], [
+      (seg_dirs[0], "fcamera.hevc"), (seg_dirs[1], "fcamera.hevc"), (seg_dirs[2], "fcamera.hevc"),
+      (seg_dirs[0], "rlog.bz2"), (seg_dirs[1], "rlog.bz2"), (seg_dirs[2], "rlog.bz2"),
+      (seg_dirs[2], "qlog.bz2"), (seg_dirs[0], "qlog.bz2"),
+    ])
+
+    # upload state is picked up without the directory changing
+    setxattr(os.path.join(self.root, seg_dirs[1], "rlog.bz2"), uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+    plan = deleter.plan_deletes(index.update(), 1)
+    self.assertEqual([(seg, fn) for seg, fn, _ in plan], [(seg_dirs[1], "rlog.bz2")])
+
 
 if __name__ == "__main__":
   unittest.main()
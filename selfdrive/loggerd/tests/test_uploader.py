@@ -9,7 +9,7 @@ import selfdrive.loggerd.uploader as uploader
 
 from common.xattr import getxattr
 
-from selfdrive.loggerd.tests.loggerd_tests_common import UploaderTestCase
+from selfdrive.loggerd.tests.loggerd_tests_common import UploaderTestCase, MockBlobServer
 
 class TestLogHandler(logging.Handler):
   def __init__(self):
@@ -136,6 +136,62 @@ class TestUploader(UploaderTestCase):
     for f_path in f_paths:
       self.assertFalse(getxattr(f_path, uploader.UPLOAD_ATTR_NAME), "File upload when locked")
 
+  def test_upload_new_segments(self):
+    self.start_thread()
+    time.sleep(1)
+    f_paths = list()
+    seg_nums = [0, 1, 2]
+    for i in seg_nums:
+      self.seg_dir = self.seg_format.format(i)
+      f_paths += self.gen_files()
+    # picked up from inotify events, not a rescan
+    time.sleep(3)
+    self.join_thread()
+
+    self.assertEqual(len(log_handler.upload_order), len(f_paths), "Files not uploaded exactly once")
+    for f_path in f_paths:
+      self.assertTrue(getxattr(f_path, uploader.UPLOAD_ATTR_NAME), "All files not uploaded")
+
+  def test_concurrent_upload(self):
+    uploader.UPLOAD_WORKERS = 4
+    f_paths = list()
+    for i in range(5):
+      self.seg_dir = self.seg_format.format(i)
+      f_paths += self.gen_files()
+
+    self.start_thread()
+    time.sleep(5)
+    self.join_thread()
+
+    self.assertEqual(sorted(log_handler.upload_order), sorted(self.gen_order(range(5), [])), "Files not uploaded exactly once")
+
+  def test_chunked_upload_resume(self):
+    min_size, block_size = uploader.CHUNKED_UPLOAD_MIN_SIZE, uploader.UPLOAD_BLOCK_SIZE
+    uploader.fake_upload = 0
+    uploader.CHUNKED_UPLOAD_MIN_SIZE = 0
+    uploader.UPLOAD_BLOCK_SIZE = 64 * 1024
+    server = MockBlobServer()
+    uploader.Api = server.api()
+    try:
+      f_path = self.make_file_with_data(self.seg_dir, "fcamera.hevc", 1)
+      key = f"{self.seg_dir}/fcamera.hevc"
+      up = uploader.Uploader("0000000000000000", self.root)
+
+      server.drop_after = 5
+      self.assertFalse(up.upload(key, f_path), "Upload succeeded with dropped connection")
+
+      server.drop_after = None
+      server.requests.clear()
+      self.assertTrue(up.upload(key, f_path), "Resumed upload failed")
+      blocks = [r for r in server.requests if r[1] == "block"]
+      self.assertEqual(len(blocks), 16 - 5, "Uploaded blocks were sent again")
+      with open(f_path, "rb") as f:
+        self.assertEqual(server.blobs["/" + key], f.read())
+      self.assertTrue(getxattr(f_path, uploader.UPLOAD_ATTR_NAME))
+    finally:
+      server.stop()
+      uploader.CHUNKED_UPLOAD_MIN_SIZE, uploader.UPLOAD_BLOCK_SIZE = min_size, block_size
+
 
 if __name__ == "__main__":
   unittest.main()
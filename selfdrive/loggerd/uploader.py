@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 import os
 import re
-import time
 import json
+import time
+import heapq
+import base64
 import random
 import ctypes
 import inspect
@@ -10,11 +12,17 @@ import requests
 import traceback
 import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote
+from xml.etree import ElementTree
 
 from selfdrive.swaglog import cloudlog
 from selfdrive.loggerd.config import ROOT
 
 from common import android
+from common import inotify
+from common.inotify import IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_ISDIR, \
+                          IN_IGNORED, IN_Q_OVERFLOW
 from common.params import Params
 from common.api import Api
 from common.xattr import getxattr, setxattr
@@ -24,6 +32,16 @@ UPLOAD_ATTR_VALUE = b'1'
 
 fake_upload = os.getenv("FAKEUPLOAD") is not None
 
+UPLOAD_WORKERS = 4
+# hevc files at least this big are uploaded as blocks, so a dropped connection only costs one block
+CHUNKED_UPLOAD_MIN_SIZE = 8 * 1024 * 1024
+UPLOAD_BLOCK_SIZE = 2 * 1024 * 1024
+# without inotify the queue is rebuilt from a full scan this often
+RESCAN_INTERVAL = 30.
+
+IMMEDIATE_PRIORITY = {"qlog.bz2": 0, "qcamera.ts": 1}
+HIGH_PRIORITY = {"rlog.bz2": 0, "fcamera.hevc": 1, "dcamera.hevc": 2}
+
 def raise_on_thread(t, exctype):
   for ctid, tobj in threading._active.items():
     if tobj is t:
@@ -93,72 +111,278 @@ def is_on_hotspot():
   except Exception:
     return False
 
+def get_upload_sort(name):
+  if name in IMMEDIATE_PRIORITY:
+    return IMMEDIATE_PRIORITY[name]
+  if name in HIGH_PRIORITY:
+    return HIGH_PRIORITY[name] + 100
+  return 1000
+
+def get_upload_tier(name):
+  # 0: always uploaded, 1 and 2: only with raw uploads allowed
+  if name in IMMEDIATE_PRIORITY:
+    return 0
+  if name in HIGH_PRIORITY:
+    return 1
+  return 2
+
+def is_uploaded(key, fn):
+  try:
+    return getxattr(fn, UPLOAD_ATTR_NAME)
+  except OSError:
+    cloudlog.event("uploader_getxattr_failed", key=key, fn=fn)
+    return True # deleter could have deleted
+
+class UploadQueue():
+  """Files waiting for upload, ordered by (tier, segment, file priority).
+
+  ROOT is scanned once, after that the queue follows inotify events on ROOT and on every
+  segment directory. Without inotify it falls back to a full rescan every RESCAN_INTERVAL."""
+  SEGMENT_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE
+
+  def __init__(self, root):
+    self.root = root
+    self.lock = threading.Lock()
+    self.cv = threading.Condition(self.lock)
+    self.pending = {}  # key -> (sort key, fn)
+    self.heap = []
+    self.in_flight = set()
+    self.locked = {}  # logname -> lock files present
+    self.wds = {}  # wd -> logname, None for root
+
+    self.notify = None
+    if inotify.available():
+      try:
+        self.notify = inotify.Inotify()
+      except OSError:
+        cloudlog.exception("uploader inotify failed")
+    self.last_scan = 0.
+
+    self.scan()
+    if self.notify is not None:
+      self.thread = threading.Thread(target=self.watch_thread, daemon=True)
+      self.thread.start()
+
+  def scan(self):
+    with self.lock:
+      self.pending = {k: v for k, v in self.pending.items() if k in self.in_flight}
+      self.heap = []
+      self.locked = {}
+    self.last_scan = time.monotonic()
+
+    if self.notify is not None and None not in self.wds.values():
+      try:
+        self.wds[self.notify.add_watch(self.root, IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM)] = None
+      except OSError:
+        pass
+    if not os.path.isdir(self.root):
+      return
+    for logname in listdir_by_creation(self.root):
+      self.add_segment(logname)
+
+  def add_segment(self, logname):
+    path = os.path.join(self.root, logname)
+    if self.notify is not None:
+      try:
+        self.wds[self.notify.add_watch(path, self.SEGMENT_EVENTS)] = logname
+      except OSError:
+        return
+    self.scan_segment(logname)
+
+  def scan_segment(self, logname):
+    path = os.path.join(self.root, logname)
+    try:
+      names = os.listdir(path)
+    except OSError:
+      return
+    locks = {name for name in names if name.endswith(".lock")}
+    with self.lock:
+      self.locked[logname] = locks
+    if locks:
+      return
+    for name in names:
+      self.add_file(logname, name)
+
+  def add_file(self, logname, name):
+    if name.endswith(".lock") or name.endswith(".tmp"):
+      return
+    key = os.path.join(logname, name)
+    fn = os.path.join(self.root, key)
+    with self.cv:
+      if self.locked.get(logname) or key in self.pending or is_uploaded(key, fn):
+        return
+      sort_key = (get_upload_tier(name), get_directory_sort(logname), get_upload_sort(name), name)
+      self.pending[key] = (sort_key, fn)
+      heapq.heappush(self.heap, (sort_key, key))
+      self.cv.notify_all()
+
+  def remove_segment(self, logname):
+    prefix = logname + "/"
+    with self.lock:
+      self.locked.pop(logname, None)
+      for key in [k for k in self.pending if k.startswith(prefix)]:
+        del self.pending[key]
+
+  def handle_event(self, wd, mask, name):
+    if mask & IN_Q_OVERFLOW:
+      self.scan()
+      return
+    if wd not in self.wds:
+      return
+    logname = self.wds[wd]
+    if mask & IN_IGNORED:
+      del self.wds[wd]
+    elif logname is None:
+      if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+        self.add_segment(name)
+      elif mask & (IN_DELETE | IN_MOVED_FROM):
+        self.remove_segment(name)
+    elif name.endswith(".lock"):
+      with self.lock:
+        locks = self.locked.setdefault(logname, set())
+        if mask & (IN_CREATE | IN_MOVED_TO):
+          locks.add(name)
+        else:
+          locks.discard(name)
+        unlocked = not locks
+      if unlocked:
+        self.scan_segment(logname)
+    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+      self.add_file(logname, name)
+    elif mask & (IN_DELETE | IN_MOVED_FROM):
+      with self.lock:
+        self.pending.pop(os.path.join(logname, name), None)
+
+  def watch_thread(self):
+    while True:
+      # poll until ROOT exists
+      root_watched = None in self.wds.values()
+      for wd, mask, name in self.notify.read(None if root_watched else 1.):
+        try:
+          self.handle_event(wd, mask, name)
+        except Exception:
+          cloudlog.exception("uploader inotify event failed")
+      if not root_watched:
+        self.scan()
+
+  def pop(self, with_raw):
+    if self.notify is None and time.monotonic() - self.last_scan > RESCAN_INTERVAL:
+      self.scan()
+
+    with self.lock:
+      while self.heap:
+        sort_key, key = self.heap[0]
+        if key in self.in_flight or self.pending.get(key, (None,))[0] != sort_key:
+          heapq.heappop(self.heap)
+          continue
+        if sort_key[0] > 0 and not with_raw:
+          return None
+        heapq.heappop(self.heap)
+        self.in_flight.add(key)
+        return (key, self.pending[key][1])
+    return None
+
+  def done(self, key, success):
+    with self.lock:
+      self.in_flight.discard(key)
+      if success:
+        self.pending.pop(key, None)
+      elif key in self.pending:
+        heapq.heappush(self.heap, (self.pending[key][0], key))
+
+  def wait(self, timeout):
+    """Waits for up to timeout seconds for a file to be added."""
+    with self.cv:
+      self.cv.wait(timeout)
+
+  def files(self):
+    with self.lock:
+      return sorted((sort_key, key, fn) for key, (sort_key, fn) in self.pending.items())
+
 class Uploader():
   def __init__(self, dongle_id, root):
     self.dongle_id = dongle_id
     self.api = Api(dongle_id)
     self.root = root
+    self.queue = UploadQueue(root)
 
-    self.upload_thread = None
+    self.session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=UPLOAD_WORKERS)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
 
-    self.last_resp = None
-    self.last_exc = None
+    self.local = threading.local()
+
+    self.immediate_priority = IMMEDIATE_PRIORITY
+    self.high_priority = HIGH_PRIORITY
 
-    self.immediate_priority = {"qlog.bz2": 0, "qcamera.ts": 1}
-    self.high_priority = {"rlog.bz2": 0, "fcamera.hevc": 1, "dcamera.hevc": 2}
+  # last response and exception are per upload thread
+  @property
+  def last_resp(self):
+    return getattr(self.local, "last_resp", None)
+
+  @last_resp.setter
+  def last_resp(self, resp):
+    self.local.last_resp = resp
+
+  @property
+  def last_exc(self):
+    return getattr(self.local, "last_exc", None)
+
+  @last_exc.setter
+  def last_exc(self, exc):
+    self.local.last_exc = exc
 
   def get_upload_sort(self, name):
-    if name in self.immediate_priority:
-      return self.immediate_priority[name]
-    if name in self.high_priority:
-      return self.high_priority[name] + 100
-    return 1000
+    return get_upload_sort(name)
 
   def gen_upload_files(self):
-    if not os.path.isdir(self.root):
-      return
-    for logname in listdir_by_creation(self.root):
-      path = os.path.join(self.root, logname)
-      try:
-        names = os.listdir(path)
-      except OSError:
-        continue
-      if any(name.endswith(".lock") for name in names):
-        continue
+    for (_, _, _, name), key, fn in self.queue.files():
+      yield (name, key, fn)
 
-      for name in sorted(names, key=self.get_upload_sort):
-        key = os.path.join(logname, name)
-        fn = os.path.join(path, name)
-        # skip files already uploaded
-        try:
-          is_uploaded = getxattr(fn, UPLOAD_ATTR_NAME)
-        except OSError:
-          cloudlog.event("uploader_getxattr_failed", exc=self.last_exc, key=key, fn=fn)
-          is_uploaded = True # deleter could have deleted
-        if is_uploaded:
-          continue
+  def next_file_to_upload(self, with_raw):
+    """Takes the next file off the queue, it has to be handed back with upload_done."""
+    return self.queue.pop(with_raw)
 
-        yield (name, key, fn)
+  def upload_done(self, key, success):
+    self.queue.done(key, success)
 
-  def next_file_to_upload(self, with_raw):
-    upload_files = list(self.gen_upload_files())
-    # try to upload qlog files first
-    for name, key, fn in upload_files:
-      if name in self.immediate_priority:
-        return (key, fn)
-
-    if with_raw:
-      # then upload the full log files, rear and front camera files
-      for name, key, fn in upload_files:
-        if name in self.high_priority:
-          return (key, fn)
-
-      # then upload other files
-      for name, key, fn in upload_files:
-        if not name.endswith('.lock') and not name.endswith(".tmp"):
-          return (key, fn)
+  def get_uploaded_blocks(self, url, headers):
+    try:
+      resp = self.session.get(url + "&comp=blocklist&blocklisttype=uncommitted", headers=headers, timeout=10)
+      if resp.status_code != 200:
+        return {}
+      blocks = ElementTree.fromstring(resp.content).iter("Block")
+      return {b.findtext("Name"): int(b.findtext("Size")) for b in blocks}
+    except Exception:
+      cloudlog.exception("uploader blocklist failed")
+      return {}
+
+  def upload_blocks(self, url, headers, fn):
+    """Uploads fn as an Azure block blob. Blocks stay on the server uncommitted when an
+    upload is interrupted, the next attempt only sends the ones missing."""
+    headers = {k: v for k, v in headers.items() if k.lower() != "x-ms-blob-type"}
+    if "?" not in url:
+      url += "?"
+
+    sz = os.path.getsize(fn)
+    block_ids = [base64.b64encode(b"%08d" % i).decode() for i in range((sz + UPLOAD_BLOCK_SIZE - 1) // UPLOAD_BLOCK_SIZE)]
+    uploaded = self.get_uploaded_blocks(url, headers)
+    if uploaded:
+      cloudlog.info("resuming %r, %d blocks uploaded", fn, len(uploaded))
+
+    with open(fn, "rb") as f:
+      for i, block_id in enumerate(block_ids):
+        size = min(UPLOAD_BLOCK_SIZE, sz - i * UPLOAD_BLOCK_SIZE)
+        if uploaded.get(block_id) == size:
+          continue
+        f.seek(i * UPLOAD_BLOCK_SIZE)
+        resp = self.session.put(url + "&comp=block&blockid=" + quote(block_id), data=f.read(size), headers=headers, timeout=10)
+        if resp.status_code not in (200, 201):
+          return resp
 
-    return None
+    body = "<?xml version=\"1.0\" encoding=\"utf-8\"?><BlockList>%s</BlockList>" % "".join("<Latest>%s</Latest>" % b for b in block_ids)
+    return self.session.put(url + "&comp=blocklist", data=body, headers=headers, timeout=10)
 
   def do_upload(self, key, fn):
     try:
@@ -179,8 +403,11 @@ class Uploader():
             self.status_code = 200
         self.last_resp = FakeResponse()
       else:
-        with open(fn, "rb") as f:
-          self.last_resp = requests.put(url, data=f, headers=headers, timeout=10)
+        if fn.endswith(".hevc") and os.path.getsize(fn) >= CHUNKED_UPLOAD_MIN_SIZE:
+          self.last_resp = self.upload_blocks(url, headers, fn)
+        else:
+          with open(fn, "rb") as f:
+            self.last_resp = self.session.put(url, data=f, headers=headers, timeout=10)
     except Exception as e:
       self.last_exc = (e, traceback.format_exc())
       raise
@@ -243,33 +470,49 @@ def uploader_fn(exit_event):
 
   uploader = Uploader(dongle_id, ROOT)
 
+  def upload(key, fn):
+    success = False
+    try:
+      success = uploader.upload(key, fn)
+    finally:
+      uploader.upload_done(key, success)
+    cloudlog.info("upload done, success=%r", success)
+    return success
+
   backoff = 0.1
-  while True:
-    allow_raw_upload = (params.get("IsUploadRawEnabled") != b"0")
-    on_hotspot = is_on_hotspot()
-    on_wifi = is_on_wifi()
-    should_upload = on_wifi and not on_hotspot
+  in_flight = set()
+  with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+    while True:
+      allow_raw_upload = (params.get("IsUploadRawEnabled") != b"0")
+      on_hotspot = is_on_hotspot()
+      on_wifi = is_on_wifi()
+      should_upload = on_wifi and not on_hotspot
+
+      if exit_event.is_set():
+        return
 
-    if exit_event.is_set():
-      return
+      while len(in_flight) < UPLOAD_WORKERS:
+        d = uploader.next_file_to_upload(with_raw=allow_raw_upload and should_upload)
+        if d is None:
+          break
 
-    d = uploader.next_file_to_upload(with_raw=allow_raw_upload and should_upload)
-    if d is None:
-      time.sleep(5)
-      continue
+        cloudlog.event("uploader_netcheck", is_on_hotspot=on_hotspot, is_on_wifi=on_wifi)
+        cloudlog.info("to upload %r", d)
+        in_flight.add(pool.submit(upload, *d))
 
-    key, fn = d
+      if not in_flight:
+        uploader.queue.wait(5)
+        continue
 
-    cloudlog.event("uploader_netcheck", is_on_hotspot=on_hotspot, is_on_wifi=on_wifi)
-    cloudlog.info("to upload %r", d)
-    success = uploader.upload(key, fn)
-    if success:
-      backoff = 0.1
-    else:
-      cloudlog.info("backoff %r", backoff)
-      time.sleep(backoff + random.uniform(0, backoff))
-      backoff = min(backoff*2, 120)
-    cloudlog.info("upload done, success=%r", success)
+      done, in_flight = wait(in_flight, timeout=5, return_when=FIRST_COMPLETED)
+      if not done:
+        continue
+      if all(f.result() for f in done):
+        backoff = 0.1
+      else:
+        cloudlog.info("backoff %r", backoff)
+        exit_event.wait(backoff + random.uniform(0, backoff))
+        backoff = min(backoff*2, 120)
 
 def main():
   uploader_fn(threading.Event())
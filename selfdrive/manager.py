@@ -153,6 +153,7 @@ from selfdrive.registration import register
 from selfdrive.version import version, dirty
 from selfdrive.loggerd.config import ROOT
 from selfdrive.launcher import launcher
+from selfdrive.zygote import Zygote
 from common import android
 from common.apk import update_apks, pm_apply_packages, start_offroad
 from common.manager_helpers import print_cpu_usage
@@ -198,6 +199,9 @@ running = {}
 def get_running():
   return running
 
+# python processes are forked from the zygote once it is started, NOZYGOTE=1 disables it
+zygote = None
+
 # due to qualcomm kernel bugs SIGKILLing camerad sometimes causes page table corruption
 unkillable_processes = ['camerad']
 
@@ -273,12 +277,25 @@ def nativelauncher(pargs, cwd):
   os.execvp(pargs[0], pargs)
 
 def start_managed_process(name):
+  global zygote
   if name in running or name not in managed_processes:
     return
   proc = managed_processes[name]
   if isinstance(proc, str):
     cloudlog.info("starting python %s" % proc)
-    running[name] = Process(name=name, target=launcher, args=(proc,))
+    if zygote is not None and not zygote.is_alive():
+      cloudlog.error("zygote is dead, starting processes directly")
+      zygote.stop()
+      zygote = None
+    if zygote is not None:
+      try:
+        running[name] = zygote.start(name, proc)
+      except OSError:
+        cloudlog.exception("zygote failed, starting processes directly")
+        zygote.stop()
+        zygote = None
+    if name not in running:
+      running[name] = Process(name=name, target=launcher, args=(proc,))
   else:
     pdir, pargs = proc
     cwd = os.path.join(BASEDIR, pdir)
@@ -378,6 +395,9 @@ def cleanup_all_processes(signal, frame):
 
   for name in list(running.keys()):
     kill_managed_process(name)
+
+  if zygote is not None:
+    zygote.stop()
   cloudlog.info("everything is dead")
 
 # ****************** run loop ******************
@@ -416,6 +436,11 @@ def manager_init(should_register=True):
     os.chmod(os.path.join(BASEDIR, "cereal"), 0o755)
     os.chmod(os.path.join(BASEDIR, "cereal", "libmessaging_shared.so"), 0o755)
 
+def start_zygote():
+  global zygote
+  if os.getenv("NOZYGOTE") is None:
+    zygote = Zygote()
+
 def manager_thread():
   # now loop
   thermal_sock = messaging.sub_sock('thermal')
@@ -577,6 +602,9 @@ def main():
   if ANDROID:
     update_apks()
   manager_init()
+  # before manager_prepare imports every daemon, so the zygote stays small
+  if os.getenv("PREPAREONLY") is None:
+    start_zygote()
   manager_prepare(spinner)
   spinner.close()
 
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Replays segments through every process with the threaded and the single-threaded
+replay, reporting messages/sec for both and checking the outputs are identical.
+
+usage: benchmark_replay.py [segment ...]
+"""
+import os
+import sys
+import time
+
+from selfdrive.test.process_replay.compare_logs import compare_logs
+from selfdrive.test.process_replay.process_replay import replay_process, CONFIGS
+from selfdrive.test.process_replay.test_processes import segments, get_segment
+from tools.lib.logreader import LogReader
+
+
+def timed_replay(cfg, lr, threaded):
+  n = len([m for m in lr if m.which() in cfg.pub_sub])
+  t = time.monotonic()
+  log_msgs = replay_process(cfg, lr, threaded=threaded)
+  return log_msgs, n / (time.monotonic() - t)
+
+
+if __name__ == "__main__":
+  segs = sys.argv[1:] if len(sys.argv) > 1 else [s for _, s in segments]
+
+  failed = False
+  for segment in segs:
+    rlog_fn = get_segment(segment)
+    lr = list(LogReader(rlog_fn))
+    os.remove(rlog_fn)
+
+    for cfg in CONFIGS:
+      threaded_msgs, threaded_rate = timed_replay(cfg, lr, True)
+      step_msgs, step_rate = timed_replay(cfg, lr, False)
+
+      try:
+        diff = compare_logs(threaded_msgs, step_msgs, cfg.ignore)
+      except Exception as e:  # logs of different length or out of order
+        diff = [str(e)]
+      failed = failed or len(diff) > 0
+
+      print("%s %-13s threaded %8.0f msgs/s  steps %8.0f msgs/s  %5.1fx  %s" % (
+        segment, cfg.proc_name, threaded_rate, step_rate, step_rate / threaded_rate,
+        "identical" if not diff else "%d differences" % len(diff)))
+
+  sys.exit(int(failed))
@@ -3,6 +3,7 @@ import bz2
 import os
 import sys
 import numbers
+from itertools import zip_longest
 
 import dictdiffer
 if "CI" in os.environ:
@@ -10,19 +11,20 @@ if "CI" in os.environ:
 else:
   from tqdm import tqdm
 
-from tools.lib.logreader import LogReader
-
 def save_log(dest, log_msgs):
-  dat = b""
-  for msg in tqdm(log_msgs):
-    dat += msg.as_builder().to_bytes()
-  dat = bz2.compress(dat)
-
+  # compress while writing, so the log never has to fit in memory
+  compressor = bz2.BZ2Compressor()
   with open(dest, "wb") as f:
-   f.write(dat)
+    for msg in tqdm(log_msgs):
+      f.write(compressor.compress(msg.as_builder().to_bytes()))
+    f.write(compressor.flush())
 
 def remove_ignored_fields(msg, ignore):
   msg = msg.as_builder()
+  return clear_ignored_fields(msg, ignore).as_reader()
+
+def clear_ignored_fields(msg, ignore):
+  """Zeroes the ignored fields of a message builder in place."""
   for key in ignore:
     attr = msg
     keys = key.split(".")
@@ -43,30 +45,49 @@ def remove_ignored_fields(msg, ignore):
       else:
         raise NotImplementedError
       setattr(attr, keys[-1], val)
-  return msg.as_reader()
+  return msg
 
-def compare_logs(log1, log2, ignore_fields=[], ignore_msgs=[]):
+def iter_diffs(log1, log2, ignore_fields=[], ignore_msgs=[]):
+  """Compares two logs message by message without holding them in memory. Raw bytes are
+  compared first, ignored fields are only cleared and messages only diffed field by field
+  when those differ."""
   filter_msgs = lambda m: m.which() not in ignore_msgs
-  log1, log2 = [list(filter(filter_msgs, log)) for log in (log1, log2)]
-  assert len(log1) == len(log2), "logs are not same length: " + str(len(log1)) + " VS " + str(len(log2))
+  log1, log2 = [filter(filter_msgs, log) for log in (log1, log2)]
+
+  cnt1, cnt2 = 0, 0
+  for msg1, msg2 in tqdm(zip_longest(log1, log2)):
+    cnt1 += msg1 is not None
+    cnt2 += msg2 is not None
+    if msg1 is None or msg2 is None:
+      continue
 
-  diff = []
-  for msg1, msg2 in tqdm(zip(log1, log2)):
     if msg1.which() != msg2.which():
       print(msg1, msg2)
       raise Exception("msgs not aligned between logs")
 
-    msg1_bytes = remove_ignored_fields(msg1, ignore_fields).as_builder().to_bytes()
-    msg2_bytes = remove_ignored_fields(msg2, ignore_fields).as_builder().to_bytes()
+    msg1_builder, msg2_builder = msg1.as_builder(), msg2.as_builder()
+    if msg1_builder.to_bytes() == msg2_builder.to_bytes():
+      continue
+
+    # only numeric and bool fields are cleared, nothing is leaked by writing again
+    msg1_builder.clear_write_flag()
+    msg2_builder.clear_write_flag()
+
+    msg1_bytes = clear_ignored_fields(msg1_builder, ignore_fields).to_bytes()
+    msg2_bytes = clear_ignored_fields(msg2_builder, ignore_fields).to_bytes()
 
     if msg1_bytes != msg2_bytes:
       msg1_dict = msg1.to_dict(verbose=True)
       msg2_dict = msg2.to_dict(verbose=True)
-      dd = dictdiffer.diff(msg1_dict, msg2_dict, ignore=ignore_fields, tolerance=0)
-      diff.extend(dd)
-  return diff
+      yield from dictdiffer.diff(msg1_dict, msg2_dict, ignore=ignore_fields, tolerance=0)
+
+  assert cnt1 == cnt2, "logs are not same length: " + str(cnt1) + " VS " + str(cnt2)
+
+def compare_logs(log1, log2, ignore_fields=[], ignore_msgs=[]):
+  return list(iter_diffs(log1, log2, ignore_fields, ignore_msgs))
 
 if __name__ == "__main__":
-  log1 = list(LogReader(sys.argv[1]))
-  log2 = list(LogReader(sys.argv[2]))
+  from tools.lib.logreader import LogReader
+  log1 = LogReader(sys.argv[1])
+  log2 = LogReader(sys.argv[2])
   print(compare_logs(log1, log2, sys.argv[3:]))
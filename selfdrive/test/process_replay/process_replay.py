@@ -71,9 +71,10 @@ class DumbSocket:
     pass
 
 class FakeSubMaster(messaging.SubMaster):
-  def __init__(self, services):
+  def __init__(self, services, wait=True):
     super(FakeSubMaster, self).__init__(services, addr=None)
     self.sock = {s: DumbSocket(s) for s in services}
+    self.wait = wait
     self.update_called = threading.Event()
     self.update_ready = threading.Event()
 
@@ -81,19 +82,27 @@ class FakeSubMaster(messaging.SubMaster):
 
   def __getitem__(self, s):
     # hack to know when fingerprinting is done
-    if self.wait_on_getitem:
+    if self.wait and self.wait_on_getitem:
       self.update_called.set()
       wait_for_event(self.update_ready)
       self.update_ready.clear()
     return self.data[s]
 
   def update(self, timeout=-1):
+    # without waiting, update_msgs is called before the process is stepped
+    if not self.wait:
+      return
+
     self.update_called.set()
     wait_for_event(self.update_ready)
     self.update_ready.clear()
 
 
   def update_msgs(self, cur_time, msgs):
+    if not self.wait:
+      super(FakeSubMaster, self).update_msgs(cur_time, msgs)
+      return
+
     wait_for_event(self.update_called)
     self.update_called.clear()
     super(FakeSubMaster, self).update_msgs(cur_time, msgs)
@@ -103,10 +112,12 @@ class FakeSubMaster(messaging.SubMaster):
     wait_for_event(self.update_called)
 
 class FakePubMaster(messaging.PubMaster):
-  def __init__(self, services):
+  def __init__(self, services, wait=True):
     self.data = {}
     self.sock = {}
     self.last_updated = None
+    self.wait = wait
+    self.sent = []
     for s in services:
       try:
         data = messaging.new_message(s)
@@ -123,6 +134,11 @@ class FakePubMaster(messaging.PubMaster):
       self.data[s] = log.Event.from_bytes(dat)
     else:
       self.data[s] = dat.as_reader()
+
+    if not self.wait:
+      self.sent.append(self.data[s])
+      return
+
     self.send_called.set()
     wait_for_event(self.get_called)
     self.get_called.clear()
@@ -251,7 +267,90 @@ CONFIGS = [
   ),
 ]
 
-def replay_process(cfg, lr):
+def replay_process(cfg, lr, threaded=False):
+  if threaded:
+    return replay_process_threaded(cfg, lr)
+  return replay_process_steps(cfg, lr)
+
+def setup_replay(cfg):
+  params = Params()
+  params.clear_all()
+  params.manager_start()
+  params.put("OpenpilotEnabledToggle", "1")
+  params.put("Passive", "0")
+  params.put("CommunityFeaturesToggle", "1")
+
+  os.environ['NO_RADAR_SLEEP'] = "1"
+  manager.prepare_managed_process(cfg.proc_name)
+  return importlib.import_module(manager.managed_processes[cfg.proc_name])
+
+def get_recv_socks(msg, CP, cfg, fsm):
+  if cfg.should_recv_callback is not None:
+    return cfg.should_recv_callback(msg, CP, cfg, fsm)
+
+  recv_socks = [s for s in cfg.pub_sub[msg.which()] if
+                  (fsm.frame + 1) % int(service_list[msg.which()].frequency / service_list[s].frequency) == 0]
+  return recv_socks, bool(len(recv_socks))
+
+def replay_process_steps(cfg, lr):
+  """Replays the log through the process in the calling thread. The process loop is a generator
+  that yields whenever it is about to wait for input, so each message is handed over by filling
+  the fake sockets and stepping the generator once, without any thread handshakes."""
+  sub_sockets = [s for _, sub in cfg.pub_sub.items() for s in sub]
+  pub_sockets = [s for s in cfg.pub_sub.keys() if s != 'can']
+
+  fsm = FakeSubMaster(pub_sockets, wait=False)
+  fpm = FakePubMaster(sub_sockets, wait=False)
+  args = (fsm, fpm)
+  can_sock = None
+  if 'can' in list(cfg.pub_sub.keys()):
+    can_sock = FakeSocket(wait=False)
+    args = (fsm, fpm, can_sock)
+
+  all_msgs = sorted(lr, key=lambda msg: msg.logMonoTime)
+  pub_msgs = [msg for msg in all_msgs if msg.which() in list(cfg.pub_sub.keys())]
+
+  params = Params()
+  mod = setup_replay(cfg)
+  steps = getattr(mod, cfg.proc_name + "_steps")(*args)
+
+  if cfg.init_callback is fingerprint:
+    # run the process up to its main loop on the first CAN messages
+    canmsgs = [msg for msg in all_msgs if msg.which() == "can"]
+    can_sock.data = [msg.as_builder().to_bytes() for msg in canmsgs[:300]]
+    next(steps)
+    can_sock.data = []
+  else:
+    if cfg.init_callback is not None:
+      cfg.init_callback(all_msgs, fsm, can_sock)
+    next(steps)
+
+  CP = car.CarParams.from_bytes(params.get("CarParams", block=True))
+
+  log_msgs, msg_queue = fpm.sent, []
+  fpm.sent = []
+  for msg in tqdm(pub_msgs):
+    _, should_recv = get_recv_socks(msg, CP, cfg, fsm)
+
+    if msg.which() == 'can':
+      can_sock.data.append(msg.as_builder().to_bytes())
+    else:
+      msg_queue.append(msg.as_builder())
+
+    if should_recv:
+      fsm.update_msgs(0, msg_queue)
+      msg_queue = []
+
+    # processes reading CAN loop once per CAN message, the others once per update
+    if should_recv or msg.which() == 'can':
+      next(steps)
+      log_msgs += fpm.sent
+      fpm.sent = []
+
+  steps.close()
+  return log_msgs
+
+def replay_process_threaded(cfg, lr):
   sub_sockets = [s for _, sub in cfg.pub_sub.items() for s in sub]
   pub_sockets = [s for s in cfg.pub_sub.keys() if s != 'can']
 
@@ -266,15 +365,7 @@ def replay_process(cfg, lr):
   pub_msgs = [msg for msg in all_msgs if msg.which() in list(cfg.pub_sub.keys())]
 
   params = Params()
-  params.clear_all()
-  params.manager_start()
-  params.put("OpenpilotEnabledToggle", "1")
-  params.put("Passive", "0")
-  params.put("CommunityFeaturesToggle", "1")
-
-  os.environ['NO_RADAR_SLEEP'] = "1"
-  manager.prepare_managed_process(cfg.proc_name)
-  mod = importlib.import_module(manager.managed_processes[cfg.proc_name])
+  mod = setup_replay(cfg)
   thread = threading.Thread(target=mod.main, args=args)
   thread.daemon = True
   thread.start()
@@ -294,12 +385,7 @@ def replay_process(cfg, lr):
 
   log_msgs, msg_queue = [], []
   for msg in tqdm(pub_msgs):
-    if cfg.should_recv_callback is not None:
-      recv_socks, should_recv = cfg.should_recv_callback(msg, CP, cfg, fsm)
-    else:
-      recv_socks = [s for s in cfg.pub_sub[msg.which()] if
-                      (fsm.frame + 1) % int(service_list[msg.which()].frequency / service_list[s].frequency) == 0]
-      should_recv = bool(len(recv_socks))
+    recv_socks, should_recv = get_recv_socks(msg, CP, cfg, fsm)
 
     if msg.which() == 'can':
       can_sock.send(msg.as_builder().to_bytes())
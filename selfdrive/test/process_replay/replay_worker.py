@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Runs process replay for a single (segment, process) pair and writes the result to a
+pickle. test_processes.py starts one of these per pair, each with its own PARAMS_PATH
+and OPENPILOT_PREFIX, so pairs can run in parallel.
+
+Results are cached by (segment, process, CarParams, reference log, ignored fields). A
+cached result is only used if every source file and native library the process loaded
+when it was produced is unchanged.
+
+usage: replay_worker.py <segment> <rlog> <proc_name> <ref_log> <out.pkl> [--no-cache]
+                        [--ignore-fields ...] [--ignore-msgs ...]
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from common.basedir import BASEDIR
+
+CACHE_DIR = os.getenv("REPLAY_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "process_replay"))
+
+
+def file_hash(fn):
+  try:
+    with open(fn, "rb") as f:
+      return hashlib.sha1(f.read()).hexdigest()
+  except OSError:
+    return None
+
+
+def loaded_sources():
+  """Python and native files from this repo loaded by the current process."""
+  files = set()
+  for m in list(sys.modules.values()):
+    fn = getattr(m, "__file__", None)
+    if fn is not None:
+      files.add(os.path.realpath(fn))
+
+  # libraries loaded with cffi or ctypes aren't modules
+  with open("/proc/self/maps") as f:
+    for line in f:
+      fn = line.split()[-1]
+      if fn.endswith(".so"):
+        files.add(os.path.realpath(fn))
+
+  return {fn: file_hash(fn) for fn in sorted(files) if fn.startswith(BASEDIR + os.sep)}
+
+
+def cache_key(segment, proc_name, CP, ref_log, ignore_fields, ignore_msgs):
+  h = hashlib.sha1()
+  for s in [segment, proc_name, os.path.basename(ref_log), " ".join(ignore_fields), " ".join(ignore_msgs)]:
+    h.update(s.encode('utf8') + b"\0")
+  h.update(CP.to_bytes())
+  return h.hexdigest()
+
+
+def load_cached(key):
+  try:
+    with open(os.path.join(CACHE_DIR, key + ".pkl"), "rb") as f:
+      entry = pickle.load(f)
+  except (OSError, pickle.UnpicklingError, EOFError):
+    return None
+
+  if any(file_hash(fn) != h for fn, h in entry['sources'].items()):
+    return None
+  return entry['result']
+
+
+def store_cached(key, result):
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  entry = {'sources': loaded_sources(), 'result': result}
+  with tempfile.NamedTemporaryFile(dir=CACHE_DIR, delete=False) as f:
+    pickle.dump(entry, f)
+  os.replace(f.name, os.path.join(CACHE_DIR, key + ".pkl"))
+
+
+def run_pair(segment, rlog_fn, proc_name, ref_log, use_cache=True, ignore_fields=[], ignore_msgs=[]):
+  from selfdrive.test.process_replay.process_replay import CONFIGS, FakeSocket
+  from selfdrive.test.process_replay.test_processes import test_process
+  from selfdrive.car.car_helpers import get_car
+  from tools.lib.logreader import LogReader
+
+  t = time.monotonic()
+  lr = list(LogReader(rlog_fn))
+  cfg = [c for c in CONFIGS if c.proc_name == proc_name][0]
+
+  # fingerprint the segment, the process' CarParams are part of the key
+  can, sendcan = FakeSocket(wait=False), FakeSocket(wait=False)
+  for m in [m for m in lr if m.which() == 'can'][:300]:
+    can.send(m.as_builder().to_bytes())
+  _, CP = get_car(can, sendcan)
+
+  key = cache_key(segment, proc_name, CP, ref_log, ignore_fields, ignore_msgs)
+  result = load_cached(key) if use_cache else None
+  cached = result is not None
+
+  if not cached:
+    try:
+      result = test_process(cfg, lr, ref_log, ignore_fields, ignore_msgs)
+    except Exception as e:
+      result = str(e)
+    else:
+      store_cached(key, result)
+
+  return {'result': result, 'cached': cached, 'time': time.monotonic() - t}
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("segment")
+  parser.add_argument("rlog")
+  parser.add_argument("proc_name")
+  parser.add_argument("ref_log")
+  parser.add_argument("out")
+  parser.add_argument("--no-cache", action="store_true")
+  parser.add_argument("--ignore-fields", type=str, nargs="*", default=[])
+  parser.add_argument("--ignore-msgs", type=str, nargs="*", default=[])
+  args = parser.parse_args()
+
+  ret = run_pair(args.segment, args.rlog, args.proc_name, args.ref_log, not args.no_cache,
+                 args.ignore_fields, args.ignore_msgs)
+  with open(args.out, "wb") as f:
+    pickle.dump(ret, f)
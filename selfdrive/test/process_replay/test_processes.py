@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import pickle
 import requests
+import subprocess
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from selfdrive.car.car_helpers import interface_names
 from selfdrive.test.process_replay.process_replay import replay_process, CONFIGS
@@ -62,7 +65,7 @@ def test_process(cfg, lr, cmp_log_fn, ignore_fields=[], ignore_msgs=[]):
       f.seek(0)
       cmp_log_msgs = list(LogReader(f.name))
   else:
-    cmp_log_msgs = list(LogReader(cmp_log_fn))
+    cmp_log_msgs = LogReader(cmp_log_fn)
 
   log_msgs = replay_process(cfg, lr)
 
@@ -80,6 +83,40 @@ def test_process(cfg, lr, cmp_log_fn, ignore_fields=[], ignore_msgs=[]):
 
   return compare_logs(cmp_log_msgs, log_msgs, ignore_fields+cfg.ignore, ignore_msgs)
 
+def run_pairs(pairs, ref_commit, jobs, use_cache=True, ignore_fields=[], ignore_msgs=[]):
+  """Replays (segment, rlog, proc_name) pairs in parallel, each in a worker process with its
+  own params and messaging namespace. Returns {(segment, proc_name): worker result}."""
+  process_replay_dir = os.path.dirname(os.path.abspath(__file__))
+  worker = os.path.join(process_replay_dir, "replay_worker.py")
+
+  def run(i, segment, rlog_fn, proc_name):
+    cmp_log_fn = os.path.join(process_replay_dir, "%s_%s_%s.bz2" % (segment, proc_name, ref_commit))
+    with tempfile.TemporaryDirectory() as tmpdir:
+      env = dict(os.environ, PARAMS_PATH=os.path.join(tmpdir, "params"), OPENPILOT_PREFIX="replay%d" % i)
+      out = os.path.join(tmpdir, "result.pkl")
+      cmd = [sys.executable, worker, segment, rlog_fn, proc_name, cmp_log_fn, out,
+             "--ignore-fields"] + ignore_fields + ["--ignore-msgs"] + ignore_msgs
+      if not use_cache:
+        cmd.append("--no-cache")
+
+      proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+      if proc.returncode != 0:
+        return {'result': "worker failed:\n" + proc.stdout.decode('utf8', 'replace'), 'cached': False, 'time': 0.}
+      with open(out, "rb") as f:
+        return pickle.load(f)
+
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    futures = {(segment, proc_name): pool.submit(run, i, segment, rlog_fn, proc_name)
+               for i, (segment, rlog_fn, proc_name) in enumerate(pairs)}
+    return {k: f.result() for k, f in futures.items()}
+
+def format_timing(timing):
+  out = "***** timing *****\n"
+  for (segment, proc_name), r in sorted(timing.items(), key=lambda x: -x[1]['time']):
+    out += "%-50s %-13s %7.2f s%s\n" % (segment, proc_name, r['time'], "  (cached)" if r['cached'] else "")
+  out += "total %.2f s" % sum(r['time'] for r in timing.values())
+  return out
+
 def format_diff(results, ref_commit):
   diff1, diff2 = "", ""
   diff2 += "***** tested against commit %s *****\n" % ref_commit
@@ -126,6 +163,10 @@ if __name__ == "__main__":
                         help="Extra fields or msgs to ignore (e.g. carState.events)")
   parser.add_argument("--ignore-msgs", type=str, nargs="*", default=[],
                         help="Msgs to ignore (e.g. carEvents)")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Number of (segment, process) pairs to replay in parallel")
+  parser.add_argument("--no-cache", action="store_true",
+                        help="Replay every pair, even if its inputs and sources are unchanged")
   args = parser.parse_args()
 
   cars_whitelisted = len(args.whitelist_cars) > 0
@@ -146,28 +187,34 @@ if __name__ == "__main__":
     untested = (set(interface_names) - set(excluded_interfaces)) - tested_cars
     assert len(untested) == 0, "Cars missing routes: %s" % (str(untested))
 
-  results = {}
+  results, pairs, rlogs = {}, [], []
   for car_brand, segment in segments:
     if (cars_whitelisted and car_brand.upper() not in args.whitelist_cars) or \
         (not cars_whitelisted and car_brand.upper() in args.blacklist_cars):
       continue
 
-    print("***** testing route segment %s *****\n" % segment)
+    print("***** downloading route segment %s *****\n" % segment)
 
     results[segment] = {}
 
     rlog_fn = get_segment(segment)
-    lr = LogReader(rlog_fn)
+    rlogs.append(rlog_fn)
 
     for cfg in CONFIGS:
       if (procs_whitelisted and cfg.proc_name not in args.whitelist_procs) or \
           (not procs_whitelisted and cfg.proc_name in args.blacklist_procs):
         continue
+      pairs.append((segment, rlog_fn, cfg.proc_name))
 
-      cmp_log_fn = os.path.join(process_replay_dir, "%s_%s_%s.bz2" % (segment, cfg.proc_name, ref_commit))
-      results[segment][cfg.proc_name] = test_process(cfg, lr, cmp_log_fn, args.ignore_fields, args.ignore_msgs)
+  print("***** replaying %d pairs with %d jobs *****\n" % (len(pairs), args.jobs))
+  timing = run_pairs(pairs, ref_commit, args.jobs, not args.no_cache, args.ignore_fields, args.ignore_msgs)
+  for (segment, proc_name), r in timing.items():
+    results[segment][proc_name] = r['result']
+  for rlog_fn in rlogs:
     os.remove(rlog_fn)
 
+  print(format_timing(timing))
+
   diff1, diff2, failed = format_diff(results, ref_commit)
   with open(os.path.join(process_replay_dir, "diff.txt"), "w") as f:
     f.write(diff2)
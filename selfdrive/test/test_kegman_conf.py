@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from selfdrive import kegman_conf as kc
+
+
+class TestKegmanStore(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.fn = os.path.join(self.tmpdir, "kegman.json")
+    self.patches = [mock.patch.object(kc, "KEGMAN_FILE", self.fn), mock.patch.object(kc, "POLL_INTERVAL", 0.)]
+    for p in self.patches:
+      p.start()
+
+  def tearDown(self):
+    for p in self.patches:
+      p.stop()
+    kc._store = None
+    shutil.rmtree(self.tmpdir)
+
+  def write(self, **kwargs):
+    with open(self.fn) as f:
+      conf = json.load(f)
+    conf.update(kwargs)
+    with open(self.fn, "w") as f:
+      json.dump(conf, f)
+
+  def _test_reload(self, store):
+    self.assertEqual(store.conf["cameraOffset"], "0.06")
+    self.assertEqual(store.floats["cameraOffset"], 0.06)
+    v = store.poll()
+    self.assertEqual(store.poll(), v)
+
+    self.write(cameraOffset="0.1")
+    self.assertEqual(store.poll(), v + 1)
+    self.assertEqual(store.floats["cameraOffset"], 0.1)
+    self.assertEqual(store.poll(), v + 1)
+
+  def test_defaults_written(self):
+    store = kc.KegmanStore()
+    self.assertTrue(os.path.isfile(self.fn))
+    self.assertEqual(store.floats["Kp"], -1.)
+
+  def test_reload_inotify(self):
+    store = kc.KegmanStore()
+    self.assertIsNotNone(store.inotify)
+    self._test_reload(store)
+
+  def test_reload_stat(self):
+    with mock.patch.object(kc.inotify, "Inotify", side_effect=OSError):
+      store = kc.KegmanStore()
+    self.assertIsNone(store.inotify)
+    self._test_reload(store)
+
+  def test_partial_write(self):
+    store = kc.KegmanStore()
+    v = store.poll()
+    with open(self.fn, "w") as f:
+      f.write('{"cameraOff')
+    self.assertEqual(store.poll(), v)
+    self.assertEqual(store.conf["cameraOffset"], "0.06")
+
+    with open(self.fn, "w") as f:
+      json.dump(dict(store.conf, cameraOffset="0.1"), f)
+    self.assertEqual(store.poll(), v + 1)
+    self.assertEqual(store.floats["cameraOffset"], 0.1)
+
+  def test_poll_interval(self):
+    store = kc.KegmanStore()
+    v = store.poll()
+    with mock.patch.object(kc, "POLL_INTERVAL", 10.):
+      store.poll()
+      self.write(cameraOffset="0.1")
+      self.assertEqual(store.poll(), v)
+      store.next_poll = 0.
+      self.assertEqual(store.poll(), v + 1)
+
+  def test_shared(self):
+    self.assertIs(kc.kegman_store(), kc.kegman_store())
+
+
+if __name__ == "__main__":
+  unittest.main()
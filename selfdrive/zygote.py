@@ -0,0 +1,211 @@
+"""Forks python managed processes from a small process that has the heavy shared modules
+imported already, instead of from the manager. Processes started through it look like
+multiprocessing.Process objects to the manager.
+"""
+import importlib
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+from multiprocessing import Process
+
+from selfdrive.swaglog import cloudlog
+
+# shared by most python daemons, imported once in the zygote
+PREIMPORTS = [
+  "numpy",
+  "capnp",
+  "cereal.messaging",
+  "common.params",
+  "common.realtime",
+  "selfdrive.car.car_helpers",
+]
+
+# (pid, exitcode) pairs from the zygote, start replies carry STARTED instead of an exitcode
+REPLY = struct.Struct("ii")
+STARTED = 0x7fffffff
+# a zygote that doesn't answer a start in time is treated as dead, includes the preimports
+START_TIMEOUT = 20.
+
+
+def exitcode(status):
+  # like multiprocessing, -N when killed by signal N
+  if os.WIFSIGNALED(status):
+    return -os.WTERMSIG(status)
+  return os.WEXITSTATUS(status)
+
+
+def zygote_main(sock, manager_sock, modules):
+  # only the manager holds its end, so the zygote sees it go away
+  manager_sock.close()
+
+  from selfdrive.launcher import launcher
+  from setproctitle import setproctitle  #pylint: disable=no-name-in-module
+
+  setproctitle("zygote")
+  for m in modules:
+    try:
+      importlib.import_module(m)
+    except Exception:
+      cloudlog.exception("zygote failed to preimport %s" % m)
+
+  children = set()
+  while True:
+    r, _, _ = select.select([sock], [], [], 0.05)
+
+    # reap children and tell the manager
+    for pid in list(children):
+      done, status = os.waitpid(pid, os.WNOHANG)
+      if done:
+        children.discard(pid)
+        sock.sendall(REPLY.pack(pid, exitcode(status)))
+
+    if not r:
+      continue
+    msg = sock.recv(4096)
+    if not msg:
+      # manager is gone
+      return
+
+    proc, start_t, cwd = msg.decode("utf8").split(" ", 2)
+    pid = os.fork()
+    if pid == 0:
+      # SystemExit on sigterm, like the manager's children got from it before the zygote
+      signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+      sock.close()
+      code = 0
+      try:
+        os.chdir(cwd)
+        launcher(proc, float(start_t))
+      except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+      except BaseException:
+        code = 1
+      finally:
+        os._exit(code)
+
+    children.add(pid)
+    sock.sendall(REPLY.pack(pid, STARTED))
+
+
+class ZygoteProcess():
+  """multiprocessing.Process stand-in for a child of the zygote."""
+  def __init__(self, zygote, name, pid):
+    self.zygote = zygote
+    self.name = name
+    self.pid = pid
+    self._exitcode = None
+
+  @property
+  def exitcode(self):
+    self.zygote.poll()
+    return self._exitcode
+
+  def is_alive(self):
+    return self.exitcode is None
+
+  def terminate(self):
+    if self.exitcode is None:
+      os.kill(self.pid, signal.SIGTERM)
+
+  def join(self, timeout=None):
+    t = time.monotonic()
+    while self.exitcode is None and (timeout is None or time.monotonic() - t < timeout):
+      self.zygote.poll(0.01)
+
+  def start(self):
+    pass
+
+
+class Zygote():
+  def __init__(self, modules=PREIMPORTS):
+    self.sock, child_sock = socket.socketpair()
+    self.process = Process(name="zygote", target=zygote_main, args=(child_sock, self.sock, modules))
+    self.process.start()
+    child_sock.close()
+    self.children = {}
+    self.exited = {}
+    self.buf = b""
+    self.dead = False
+
+  def is_alive(self):
+    return not self.dead and self.process.is_alive()
+
+  def _died(self):
+    # nothing reaps the children anymore, kill them so the manager can start them again
+    cloudlog.error("zygote died, killing its %d children" % len(self.children))
+    self.dead = True
+    for pid, p in self.children.items():
+      try:
+        os.kill(pid, signal.SIGKILL)
+      except OSError:
+        pass
+      p._exitcode = -signal.SIGKILL
+    self.children = {}
+
+  def _read(self, timeout):
+    if self.dead:
+      return []
+    r, _, _ = select.select([self.sock], [], [], timeout)
+    if not r:
+      return []
+    try:
+      data = self.sock.recv(4096)
+    except OSError:
+      data = b""
+    if not data:
+      self._died()
+      return []
+
+    self.buf += data
+    n = len(self.buf) // REPLY.size * REPLY.size
+    replies = [REPLY.unpack_from(self.buf, i) for i in range(0, n, REPLY.size)]
+    self.buf = self.buf[n:]
+    return replies
+
+  def poll(self, timeout=0.):
+    """Reads exit notifications, returns the pid of a start reply if one came in."""
+    started = None
+    for pid, code in self._read(timeout):
+      if code == STARTED:
+        started = pid
+      elif pid in self.children:
+        self.children.pop(pid)._exitcode = code
+      else:
+        # exited before start() saw the reply
+        self.exited[pid] = code
+    return started
+
+  def start(self, name, proc):
+    """Forks proc from the zygote, raises OSError if the zygote is dead."""
+    if self.dead:
+      raise OSError("zygote died")
+    try:
+      self.sock.sendall(("%s %f %s" % (proc, time.monotonic(), os.getcwd())).encode("utf8"))
+    except OSError:
+      self._died()
+      raise
+    pid = None
+    t = time.monotonic()
+    while pid is None:
+      if time.monotonic() - t > START_TIMEOUT:
+        self._died()
+        raise OSError("zygote didn't start %s in time" % name)
+      pid = self.poll(1.)
+      if self.dead:
+        raise OSError("zygote died")
+    p = ZygoteProcess(self, name, pid)
+    if pid in self.exited:
+      p._exitcode = self.exited.pop(pid)
+    else:
+      self.children[pid] = p
+    return p
+
+  def stop(self):
+    self.sock.close()
+    self.process.join(1)
+    if self.process.exitcode is None:
+      self.process.kill()
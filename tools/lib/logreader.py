@@ -0,0 +1,328 @@
+"""Reads rlog/qlog segments, compressed with bz2 or not.
+
+Logs are decompressed in chunks and split into messages using the capnp framing, without
+decoding them. Each log gets an index of (logMonoTime, service, offset, size) per message,
+so reading only some services or a time range only decodes the messages that are returned.
+For uncompressed logs the index is also used to seek straight to them. Indexes are written
+to INDEX_CACHE_DIR, a <log>.idx next to the log is used if one is there already. The least
+recently used indexes are removed once the cache is over INDEX_CACHE_SIZE.
+
+  for msg in LogReader("rlog.bz2", services=["carState"], start_time=t):
+    ...
+"""
+import bz2
+import hashlib
+import os
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cereal import log as capnp_log
+
+SERVICES = list(capnp_log.Event.schema.union_fields)
+SERVICE_IDS = {s: i for i, s in enumerate(SERVICES)}
+
+# byte offset of the union discriminant in the data section of an Event
+DISCRIMINANT_OFFSET = capnp_log.Event.schema.node.struct.discriminantOffset * 2
+
+INDEX_VERSION = 1
+INDEX_MAGIC = b"LRIDX"
+INDEX_HEADER = struct.Struct("<5sIQQQ")  # magic, version, log size, log mtime, entries
+INDEX_DTYPE = np.dtype([('mono', '<u8'), ('service', '<u2'), ('offset', '<u8'), ('size', '<u4')])
+INDEX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "logreader")
+INDEX_CACHE_SIZE = 512 * 1024 * 1024
+
+CHUNK_SIZE = 1 << 20
+DECODE_BATCH = 1 << 20
+
+
+def message_size(buf, pos):
+  """Size of the capnp message starting at pos, None if buf doesn't hold all of it."""
+  if len(buf) - pos < 4:
+    return None
+  n_segments = struct.unpack_from("<I", buf, pos)[0] + 1
+  header_size = (4 + 4 * n_segments + 7) & ~7
+  if len(buf) - pos < header_size:
+    return None
+  size = header_size + 8 * sum(struct.unpack_from("<%dI" % n_segments, buf, pos + 4))
+  if len(buf) - pos < size:
+    return None
+  return size
+
+
+def read_chunks(fn):
+  """Decompressed contents of fn, a chunk at a time."""
+  with open(fn, "rb") as f:
+    decompressor = bz2.BZ2Decompressor() if fn.endswith(".bz2") else None
+    while True:
+      dat = f.read(CHUNK_SIZE)
+      if not dat:
+        break
+
+      if decompressor is not None:
+        dat = decompressor.decompress(dat)
+        # concatenated bz2 streams
+        while decompressor.eof and decompressor.unused_data:
+          unused = decompressor.unused_data
+          decompressor = bz2.BZ2Decompressor()
+          dat += decompressor.decompress(unused)
+      if dat:
+        yield dat
+
+
+def raw_messages(fn):
+  """(offset, raw bytes) of every message in the log, in file order."""
+  buf = b""
+  offset = 0
+  for chunk in read_chunks(fn):
+    buf = buf + chunk if buf else chunk
+    pos = 0
+    while True:
+      size = message_size(buf, pos)
+      if size is None:
+        break
+      yield offset + pos, buf[pos:pos + size]
+      pos += size
+    offset += pos
+    buf = buf[pos:]
+
+
+def message_info(dat):
+  """logMonoTime and service id of a raw Event, read from its root struct without decoding it."""
+  n_segments = struct.unpack_from("<I", dat, 0)[0] + 1
+  start = (4 + 4 * n_segments + 7) & ~7
+  ptr = struct.unpack_from("<Q", dat, start)[0]
+
+  if n_segments == 1 and ptr & 3 == 0:
+    data = start + 8 + 8 * (((ptr >> 2) & 0x3fffffff) ^ 0x20000000) - 8 * 0x20000000
+    data_size = 8 * ((ptr >> 32) & 0xffff)
+    mono = struct.unpack_from("<Q", dat, data)[0] if data_size >= 8 else 0
+    service = struct.unpack_from("<H", dat, data + DISCRIMINANT_OFFSET)[0] if data_size >= DISCRIMINANT_OFFSET + 2 else 0
+    return mono, service
+
+  # far pointers, let capnp follow them
+  msg = next(capnp_log.Event.read_multiple_bytes(dat))
+  return msg.logMonoTime, SERVICE_IDS[msg.which()]
+
+
+def decode(raws):
+  """Decodes a list of raw Events with a single capnp call."""
+  if raws:
+    yield from capnp_log.Event.read_multiple_bytes(b"".join(raws))
+
+
+def index_cache_path(fn):
+  fn = os.path.abspath(fn)
+  return os.path.join(INDEX_CACHE_DIR, hashlib.sha1(fn.encode('utf8')).hexdigest() + ".idx")
+
+
+def touch_index(path):
+  # mtime is the last use when pruning the cache
+  try:
+    os.utime(path)
+  except OSError:
+    pass
+
+
+def load_index(fn):
+  st = os.stat(fn)
+  for path in [fn + ".idx", index_cache_path(fn)]:
+    try:
+      with open(path, "rb") as f:
+        magic, version, size, mtime, n = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        if (magic, version, size, mtime) != (INDEX_MAGIC, INDEX_VERSION, st.st_size, st.st_mtime_ns):
+          continue
+        index = np.frombuffer(f.read(), dtype=INDEX_DTYPE)
+        if len(index) == n:
+          if path != fn + ".idx":
+            touch_index(path)
+          return index
+    except (OSError, struct.error, ValueError):
+      pass
+  return None
+
+
+def write_index(fn, index):
+  st = os.stat(fn)
+  header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, st.st_size, st.st_mtime_ns, len(index))
+  path = index_cache_path(fn)
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+      f.write(header)
+      f.write(index.tobytes())
+    os.replace(f.name, path)
+  except OSError:
+    return False
+  prune_index_cache(keep=path)
+  return True
+
+
+def prune_index_cache(keep=None):
+  """Removes the least recently used indexes until the cache fits in INDEX_CACHE_SIZE."""
+  entries = []
+  try:
+    with os.scandir(INDEX_CACHE_DIR) as it:
+      for e in it:
+        if e.name.endswith(".idx") and e.path != keep:
+          try:
+            st = e.stat()
+            entries.append((st.st_mtime_ns, st.st_size, e.path))
+          except OSError:
+            pass
+    total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep is not None else 0)
+  except OSError:
+    return
+
+  for _, size, path in sorted(entries):
+    if total <= INDEX_CACHE_SIZE:
+      break
+    try:
+      os.unlink(path)
+      total -= size
+    except OSError:
+      pass
+
+
+def build_index(fn):
+  entries = []
+  for offset, dat in raw_messages(fn):
+    mono, service = message_info(dat)
+    entries.append((mono, service, offset, len(dat)))
+  return np.array(entries, dtype=INDEX_DTYPE)
+
+
+def get_index(fn):
+  index = load_index(fn)
+  if index is None:
+    index = build_index(fn)
+    write_index(fn, index)
+  return index
+
+
+class LogReader():
+  def __init__(self, fn, services=None, start_time=None, end_time=None, use_index=True):
+    self.fn = fn
+    self.services = None if services is None else set(services)
+    self.start_time = start_time
+    self.end_time = end_time
+    self.use_index = use_index
+
+  def _selected(self, index):
+    mask = np.ones(len(index), dtype=bool)
+    if self.services is not None:
+      mask &= np.isin(index['service'], [SERVICE_IDS[s] for s in self.services])
+    if self.start_time is not None:
+      mask &= index['mono'] >= self.start_time
+    if self.end_time is not None:
+      mask &= index['mono'] < self.end_time
+    return index[mask]
+
+  def _wanted(self, mono, service):
+    return (self.services is None or SERVICES[service] in self.services) and \
+           (self.start_time is None or mono >= self.start_time) and \
+           (self.end_time is None or mono < self.end_time)
+
+  def index(self):
+    return get_index(self.fn)
+
+  def raw_batches(self):
+    """Lists of raw selected messages, about DECODE_BATCH bytes each."""
+    index = load_index(self.fn) if self.use_index else None
+    if index is None:
+      yield from self._raw_batches_unindexed()
+      return
+
+    selected = self._selected(index)
+    if not len(selected):
+      return
+
+    if self.fn.endswith(".bz2"):
+      yield from self._raw_batches_stream(selected)
+    else:
+      yield from self._raw_batches_seek(selected)
+
+  def _raw_batches_unindexed(self):
+    # stream everything and build the index on the way
+    entries, batch, batch_size = [], [], 0
+    for offset, dat in raw_messages(self.fn):
+      mono, service = message_info(dat)
+      entries.append((mono, service, offset, len(dat)))
+      if self._wanted(mono, service):
+        batch.append(dat)
+        batch_size += len(dat)
+        if batch_size >= DECODE_BATCH:
+          yield batch
+          batch, batch_size = [], 0
+    yield batch
+
+    if self.use_index:
+      write_index(self.fn, np.array(entries, dtype=INDEX_DTYPE))
+
+  def _raw_batches_stream(self, selected):
+    # bz2 can't seek, decompress up to the last selected message and only slice out the selected ones
+    offsets, sizes = selected['offset'].tolist(), selected['size'].tolist()
+    batch, batch_size, i = [], 0, 0
+    buf, buf_offset = b"", 0
+    for chunk in read_chunks(self.fn):
+      buf = buf + chunk if buf else chunk
+      while i < len(offsets) and offsets[i] + sizes[i] <= buf_offset + len(buf):
+        start = offsets[i] - buf_offset
+        batch.append(buf[start:start + sizes[i]])
+        batch_size += sizes[i]
+        i += 1
+        if batch_size >= DECODE_BATCH:
+          yield batch
+          batch, batch_size = [], 0
+
+      if i == len(offsets):
+        break
+
+      # keep only what the next selected message needs
+      drop = min(offsets[i] - buf_offset, len(buf))
+      buf, buf_offset = buf[drop:], buf_offset + drop
+    yield batch
+
+  def _raw_batches_seek(self, selected):
+    batch, batch_size = [], 0
+    with open(self.fn, "rb") as f:
+      for offset, size in zip(selected['offset'].tolist(), selected['size'].tolist()):
+        f.seek(offset)
+        batch.append(f.read(size))
+        batch_size += size
+        if batch_size >= DECODE_BATCH:
+          yield batch
+          batch, batch_size = [], 0
+    yield batch
+
+  def __iter__(self):
+    for batch in self.raw_batches():
+      yield from decode(batch)
+
+
+class MultiLogReader():
+  """Iterates the messages of several segments in order. Up to `workers` segments are
+  decompressed and filtered ahead in background threads while the current one is decoded."""
+  def __init__(self, fns, services=None, start_time=None, end_time=None, workers=4):
+    self.readers = [LogReader(fn, services, start_time, end_time) for fn in fns]
+    self.workers = workers
+
+  def __iter__(self):
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      pending = deque()
+      readers = iter(self.readers)
+      for lr in readers:
+        pending.append(pool.submit(lambda lr: list(lr.raw_batches()), lr))
+        if len(pending) >= self.workers:
+          break
+
+      while pending:
+        batches = pending.popleft().result()
+        lr = next(readers, None)
+        if lr is not None:
+          pending.append(pool.submit(lambda lr: list(lr.raw_batches()), lr))
+        for batch in batches:
+          yield from decode(batch)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Generates a synthetic log from the cereal schemas and times LogReader on it: a full
+read, building the index, reading a single service and seeking to the last tenth by
+time, uncompressed and bz2 compressed. The log is also split into segments to time
+MultiLogReader.
+
+usage: benchmark_logreader.py [size_mb] [segments]
+"""
+import bz2
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from cereal import log
+from tools.lib.logreader import LogReader, MultiLogReader, get_index
+
+# roughly the mix of a real rlog
+SERVICE_WEIGHTS = {"can": 100, "sendcan": 100, "carState": 100, "controlsState": 100, "carControl": 100,
+                   "sensorEvents": 100, "model": 20, "pathPlan": 20, "plan": 20, "radarState": 20,
+                   "liveCalibration": 4, "thermal": 2, "health": 2, "gpsLocationExternal": 10}
+
+
+def template_messages(n=2000):
+  random.seed(0)
+  services = random.choices(list(SERVICE_WEIGHTS), weights=list(SERVICE_WEIGHTS.values()), k=n)
+  msgs = []
+  for service in services:
+    msg = log.Event.new_message()
+    if service in ["can", "sendcan"]:
+      for c in msg.init(service, random.randint(10, 60)):
+        c.address = random.randint(0, 0x7ff)
+        c.dat = os.urandom(8)
+    elif service == "sensorEvents":
+      for e in msg.init(service, 6):
+        e.acceleration.v = [random.random() for _ in range(3)]
+    elif service == "model":
+      msg.init(service).path.points = [random.random() for _ in range(50)]
+    else:
+      msg.init(service)
+    msgs.append(msg.to_bytes())
+  return msgs
+
+
+def set_mono(dat, mono):
+  # logMonoTime is the first word of the root struct's data section
+  return dat[:16] + struct.pack("<Q", mono) + dat[24:]
+
+
+def write_logs(dest_dir, size, segments):
+  templates = template_messages()
+  fns = []
+  mono, seg_size = 0, size // segments
+  for i in range(segments):
+    fn = os.path.join(dest_dir, "%d--rlog" % i)
+    written = 0
+    with open(fn, "wb") as f:
+      while written < seg_size:
+        buf = []
+        for dat in templates:
+          mono += 1000000
+          buf.append(set_mono(dat, mono))
+        buf = b"".join(buf)
+        f.write(buf)
+        written += len(buf)
+    fns.append(fn)
+  return fns, mono
+
+
+def compress(fn):
+  compressor = bz2.BZ2Compressor()
+  with open(fn, "rb") as src, open(fn + ".bz2", "wb") as dst:
+    for dat in iter(lambda: src.read(1 << 20), b""):
+      dst.write(compressor.compress(dat))
+    dst.write(compressor.flush())
+  return fn + ".bz2"
+
+
+def timed(name, f):
+  t = time.monotonic()
+  n = f()
+  dt = time.monotonic() - t
+  print("%30s: %8.2f s  %9d msgs" % (name, dt, n))
+
+
+def count(it):
+  return sum(1 for _ in it)
+
+
+if __name__ == "__main__":
+  size = int(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1 else 2 * 1024 * 1024 * 1024
+  segments = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    fns, last_mono = write_logs(tmpdir, size, segments)
+    print("%d MB in %d segments" % (sum(os.path.getsize(fn) for fn in fns) // (1024 * 1024), segments))
+
+    for kind in ["raw", "bz2"]:
+      if kind == "bz2":
+        fns = [compress(fn) for fn in fns]
+      fn = fns[-1]
+      print("***** %s, one segment: %d MB *****" % (kind, os.path.getsize(fn) // (1024 * 1024)))
+
+      seek_time = last_mono - (last_mono // segments) // 10
+      timed("read all, no index", lambda: count(LogReader(fn, use_index=False)))
+      timed("build index", lambda: len(get_index(fn)))
+      timed("read all", lambda: count(LogReader(fn)))
+      timed("carState, no index", lambda: count(LogReader(fn, services=["carState"], use_index=False)))
+      timed("carState", lambda: count(LogReader(fn, services=["carState"])))
+      timed("last 10%, no index", lambda: count(LogReader(fn, start_time=seek_time, use_index=False)))
+      timed("last 10%", lambda: count(LogReader(fn, start_time=seek_time)))
+
+      for fn in fns:
+        get_index(fn)
+      timed("carState, sequential", lambda: sum(count(LogReader(fn, services=["carState"])) for fn in fns))
+      timed("carState, MultiLogReader", lambda: count(MultiLogReader(fns, services=["carState"])))
+  finally:
+    shutil.rmtree(tmpdir)
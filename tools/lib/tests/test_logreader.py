@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from cereal import log
+import tools.lib.logreader as logreader
+from tools.lib.logreader import LogReader, MultiLogReader, get_index, index_cache_path, load_index, message_info, SERVICE_IDS
+
+SERVICES = ["can", "carState", "controlsState", "thermal", "sendcan"]
+
+
+def make_log(n, seed=0):
+  random.seed(seed)
+  msgs = []
+  for i in range(n):
+    service = random.choice(SERVICES)
+    if service in ["can", "sendcan"]:
+      msg = log.Event.new_message()
+      can = msg.init(service, random.randint(0, 20))
+      for c in can:
+        c.address = random.randint(0, 0x7ff)
+        c.dat = os.urandom(8)
+    else:
+      msg = log.Event.new_message()
+      msg.init(service)
+    msg.logMonoTime = 1000 * i + random.randint(0, 999)
+    msgs.append(msg.to_bytes())
+  return msgs
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.msgs = make_log(3000)
+    self.raw_fn = os.path.join(self.tmpdir, "rlog")
+    self.bz2_fn = os.path.join(self.tmpdir, "rlog.bz2")
+    with open(self.raw_fn, "wb") as f:
+      f.write(b"".join(self.msgs))
+    with open(self.bz2_fn, "wb") as f:
+      f.write(bz2.compress(b"".join(self.msgs)))
+
+    # small chunks so messages are split across them
+    self._chunk_size = logreader.CHUNK_SIZE
+    logreader.CHUNK_SIZE = 1000
+    self._cache_dir = logreader.INDEX_CACHE_DIR
+    logreader.INDEX_CACHE_DIR = os.path.join(self.tmpdir, "cache")
+    self._cache_size = logreader.INDEX_CACHE_SIZE
+
+  def tearDown(self):
+    logreader.CHUNK_SIZE = self._chunk_size
+    logreader.INDEX_CACHE_DIR = self._cache_dir
+    logreader.INDEX_CACHE_SIZE = self._cache_size
+    shutil.rmtree(self.tmpdir)
+
+  def _expected(self, services=None, start_time=None, end_time=None):
+    ret = []
+    for m in log.Event.read_multiple_bytes(b"".join(self.msgs)):
+      if (services is None or m.which() in services) and \
+         (start_time is None or m.logMonoTime >= start_time) and \
+         (end_time is None or m.logMonoTime < end_time):
+        ret.append(m.as_builder().to_bytes())
+    return ret
+
+  def _read(self, lr):
+    return [m.as_builder().to_bytes() for m in lr]
+
+  def test_message_info(self):
+    for dat in self.msgs[:100]:
+      m = next(log.Event.read_multiple_bytes(dat))
+      self.assertEqual(message_info(dat), (m.logMonoTime, SERVICE_IDS[m.which()]))
+
+  def test_read_all(self):
+    for fn in [self.raw_fn, self.bz2_fn]:
+      self.assertEqual(self._read(LogReader(fn, use_index=False)), self._expected())
+      # builds the index on the first pass, uses it on the second
+      self.assertEqual(self._read(LogReader(fn)), self._expected())
+      self.assertTrue(os.path.isfile(index_cache_path(fn)))
+      self.assertFalse(os.path.exists(fn + ".idx"))
+      self.assertEqual(self._read(LogReader(fn)), self._expected())
+
+  def test_sidecar_index(self):
+    # an index next to the log is used when it is there
+    get_index(self.raw_fn)
+    shutil.move(index_cache_path(self.raw_fn), self.raw_fn + ".idx")
+    self.assertEqual(len(load_index(self.raw_fn)), len(self.msgs))
+    self.assertEqual(self._read(LogReader(self.raw_fn, services=["carState"])), self._expected(["carState"]))
+    self.assertFalse(os.path.exists(index_cache_path(self.raw_fn)))
+
+  def test_cache_pruned(self):
+    fns = []
+    for i in range(3):
+      fn = os.path.join(self.tmpdir, "%d--rlog" % i)
+      shutil.copy(self.raw_fn, fn)
+      fns.append(fn)
+    get_index(fns[0])
+    size = os.path.getsize(index_cache_path(fns[0]))
+    logreader.INDEX_CACHE_SIZE = 2 * size
+
+    # using an index keeps it in the cache
+    get_index(fns[1])
+    os.utime(index_cache_path(fns[0]), ns=(0, 0))
+    os.utime(index_cache_path(fns[1]), ns=(1, 1))
+    get_index(fns[0])
+    get_index(fns[2])
+    self.assertEqual([os.path.isfile(index_cache_path(fn)) for fn in fns], [True, False, True])
+
+  def test_filter(self):
+    cases = [(["carState"], None, None), (["can", "thermal"], 500000, None), (None, 1000000, 2000000),
+             (["controlsState"], 2999000, None), (["initData"], None, None)]
+    for fn in [self.raw_fn, self.bz2_fn]:
+      for indexed in [False, True]:
+        if indexed:
+          get_index(fn)
+        for services, start, end in cases:
+          lr = LogReader(fn, services=services, start_time=start, end_time=end, use_index=indexed)
+          self.assertEqual(self._read(lr), self._expected(services, start, end))
+
+  def test_index_invalidated(self):
+    get_index(self.raw_fn)
+    with open(self.raw_fn, "ab") as f:
+      f.write(self.msgs[0])
+    self.msgs.append(self.msgs[0])
+    self.assertEqual(self._read(LogReader(self.raw_fn)), self._expected())
+
+  def test_multi(self):
+    fns = []
+    for i in range(5):
+      fn = os.path.join(self.tmpdir, "%d--rlog.bz2" % i)
+      shutil.copy(self.bz2_fn, fn)
+      fns.append(fn)
+
+    lr = MultiLogReader(fns, services=["carState"], workers=3)
+    self.assertEqual(self._read(lr), self._expected(["carState"]) * 5)
+
+
+if __name__ == "__main__":
+  unittest.main()